@@ -7,8 +7,10 @@ import collections
 import errno
 import hashlib
 import fileinput
+import fnmatch
 import glob
 import grp
+import json
 import numbers
 import os
 import pwd
@@ -50,6 +52,7 @@ __all__ = [
     'join_path',
     'mkdirp',
     'remove_dead_links',
+    'remove_file_listing',
     'remove_if_dead_link',
     'remove_linked_tree',
     'set_executable',
@@ -58,7 +61,8 @@ __all__ = [
     'touchp',
     'traverse_tree',
     'unset_executable_mode',
-    'working_dir'
+    'working_dir',
+    'write_file_listing'
 ]
 
 
@@ -860,6 +864,10 @@ def find(root, files, recursive=True):
     [!seq]   matches any character not in ``seq``
     =======  ====================================
 
+    The directory tree is walked once, whatever the number of patterns.
+    Trees with a listing saved by ``write_file_listing()``, like Spack
+    install prefixes, are searched through their listing instead.
+
     Parameters:
         root (str): The root directory to start searching from
         files (str or collections.Sequence): Library name(s) to search for
@@ -872,10 +880,198 @@ def find(root, files, recursive=True):
     if isinstance(files, six.string_types):
         files = [files]
 
-    if recursive:
-        return _find_recursive(root, files)
+    # patterns spanning directories are left to glob
+    if any(os.sep in f for f in files):
+        if recursive:
+            return _find_recursive(root, files)
+        else:
+            return _find_non_recursive(root, files)
+
+    # Make the path absolute to have absolute paths returned
+    root = os.path.abspath(root)
+
+    tree = _listed_tree(root, recursive)
+    if tree is None:
+        if recursive:
+            tree = _walk_tree(root)
+        elif os.path.isdir(root):
+            tree = [(root, os.listdir(root))]
+        else:
+            tree = []
+
+    return _match_tree(tree, files)
+
+
+class _DirEntry(object):
+    """Stand-in for ``os.DirEntry`` where ``os.scandir`` is missing."""
+
+    def __init__(self, dirname, name):
+        self.name = name
+        self.path = os.path.join(dirname, name)
+
+    def is_dir(self, follow_symlinks=True):
+        if not follow_symlinks and os.path.islink(self.path):
+            return False
+        return os.path.isdir(self.path)
+
+
+def _scandir(path):
+    """List the entries of a directory. With ``os.scandir``, the type of
+    most entries is known without a stat."""
+    if hasattr(os, 'scandir'):
+        return list(os.scandir(path))
+    return [_DirEntry(path, name) for name in os.listdir(path)]
+
+
+def _walk_tree(root):
+    """Yield each directory under root, top-down like ``os.walk``, with the
+    names of the files and directories in it in the order ``os.listdir``
+    returns them."""
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            entries = _scandir(path)
+        except OSError:
+            continue
+        yield path, [e.name for e in entries]
+        stack.extend(reversed(
+            [e.path for e in entries if e.is_dir(follow_symlinks=False)]))
+
+
+def _name_matcher(pattern):
+    """Return a function telling whether a file name matches a glob
+    pattern, the way ``glob.glob`` does."""
+    if not glob.has_magic(pattern):
+        return lambda name: name == pattern
+
+    match = re.compile(fnmatch.translate(pattern)).match
+    if pattern.startswith('.'):
+        return match
+
+    # glob leaves out hidden files unless the pattern starts with a dot
+    return lambda name: not name.startswith('.') and match(name)
+
+
+def _match_tree(tree, search_files):
+    """Match the names of the files in tree against each pattern in
+    search_files, with a single pass over the tree."""
+    matchers = [_name_matcher(f) for f in search_files]
+
+    # the answer is ordered by pattern first, and by tree order for each
+    # pattern
+    found_files = [[] for f in search_files]
+    for path, names in tree:
+        for name in names:
+            for found, match in zip(found_files, matchers):
+                if match(name):
+                    found.append(os.path.join(path, name))
+
+    answer = []
+    for found in found_files:
+        answer.extend(found)
+    return answer
+
+
+#: Where ``write_file_listing()`` saves the listing of a directory tree,
+#: relative to the root of the tree. In Spack install prefixes it is kept
+#: with the rest of the install metadata.
+file_listing_path = os.path.join('.spack', 'files.json')
+
+# listings read by _read_file_listing(), by path
+_file_listings = {}
+
+
+def write_file_listing(root):
+    """Save the names of the files and directories under root, for
+    ``find()`` to search the tree without walking it.
+
+    The listing must be written again, or removed with
+    ``remove_file_listing()``, when files are added to or removed from the
+    tree.
+    """
+    root = os.path.abspath(root)
+    tree = [[os.path.relpath(path, root), names]
+            for path, names in _walk_tree(root)]
+
+    path = os.path.join(root, file_listing_path)
+    mkdirp(os.path.dirname(path))
+    with open(path, 'w') as f:
+        json.dump({'version': 1, 'tree': tree}, f)
+
+
+def remove_file_listing(root):
+    """Remove the listing of the tree under root, if there is one."""
+    path = os.path.join(root, file_listing_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _read_file_listing(root):
+    """Find the listing of the tree root is in, looking in root and its
+    parents.
+
+    Returns:
+        (tuple): the root of the listed tree, the (directory, names) pairs
+            of the tree in walk order and the names in each directory, or
+            None if root is not in a listed tree
+    """
+    path = root
+    while True:
+        listing = os.path.join(path, file_listing_path)
+        try:
+            mtime = os.stat(listing).st_mtime
+            break
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+    cached = _file_listings.get(listing)
+    if cached is None or cached[0] != mtime:
+        try:
+            with open(listing) as f:
+                data = json.load(f)
+            tree = []
+            for rel_path, names in data['tree']:
+                if sys.version_info[0] < 3:
+                    rel_path = rel_path.encode('utf-8')
+                    names = [n.encode('utf-8') for n in names]
+                tree.append((os.path.normpath(rel_path), names))
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            tty.debug('Ignoring file listing %s: %s' % (listing, e))
+            return None
+        cached = (mtime, path, tree, dict(tree))
+        _file_listings[listing] = cached
+    return cached[1:]
+
+
+def _listed_tree(root, recursive):
+    """Return the directories under root with the names in each of them,
+    like ``_walk_tree()``, from the listing of the tree root is in. Return
+    None if root is not in a listed tree."""
+    listing = _read_file_listing(root)
+    if listing is None:
+        return None
+
+    listing_root, tree, names = listing
+    rel_root = os.path.relpath(root, listing_root)
+    if rel_root not in names:
+        # not a directory, or one the listing does not walk into
+        return None
+
+    if not recursive:
+        return [(root, names[rel_root])]
+
+    if rel_root == '.':
+        subtree = tree
     else:
-        return _find_non_recursive(root, files)
+        subtree = [(path, dir_names) for path, dir_names in tree
+                   if path == rel_root or path.startswith(rel_root + os.sep)]
+    return [(listing_root if path == '.' else
+             os.path.join(listing_root, path), dir_names)
+            for path, dir_names in subtree]
 
 
 def _find_recursive(root, search_files):
@@ -10,8 +10,10 @@ from __future__ import print_function
 import os
 import shutil
 import filecmp
+from multiprocessing.pool import ThreadPool
 
 from llnl.util.filesystem import traverse_tree, mkdirp, touch
+from llnl.util.filesystem import _DirEntry, _scandir
 import llnl.util.tty as tty
 
 __all__ = ['LinkTree']
@@ -29,6 +31,34 @@ def remove_link(src, dest):
         os.remove(dest)
 
 
+class TreeScan(object):
+    """The directories and files of a source tree, matched with the
+    paths they have in a destination tree.
+
+    Built by ``LinkTree.scan()`` from a single walk of the source tree,
+    which lists each destination directory once instead of checking each
+    destination path.
+
+    Attributes:
+        dirs (list): (source, destination) pairs of the directories, in
+            pre-order
+        files (dict): destination of each file, by source
+        new_dirs (set): destination directories that do not exist
+        empty_dirs (set): destination directories that exist and are empty
+        existing (set): destinations of files that already exist
+        conflicts (list): messages for the destinations that are not of the
+            same type (file or directory) as their source
+    """
+
+    def __init__(self):
+        self.dirs = []
+        self.files = {}
+        self.new_dirs = set()
+        self.empty_dirs = set()
+        self.existing = set()
+        self.conflicts = []
+
+
 class LinkTree(object):
     """Class to create trees of symbolic links from a source directory.
 
@@ -45,54 +75,100 @@ class LinkTree(object):
 
         self._root = source_root
 
+    def scan(self, dest_root, ignore=None):
+        """Walk the source tree once and match it with dest_root.
+
+        Arguments:
+            dest_root (str): destination of the tree
+            ignore (callable): returns True for the paths, relative to the
+                source root, that are left out (directories are not
+                descended into)
+
+        Returns:
+            (TreeScan): the directories and files of the tree
+        """
+        ignore = ignore or (lambda x: False)
+        scan = TreeScan()
+
+        if not os.path.lexists(dest_root):
+            dest_root_entry = None
+        else:
+            dest_root_entry = _DirEntry(*os.path.split(dest_root))
+
+        stack = [('', dest_root_entry)]
+        while stack:
+            rel_path, dest_entry = stack.pop()
+            if ignore(rel_path):
+                continue
+
+            src_dir = os.path.join(self._root, rel_path)
+            dest_dir = os.path.join(dest_root, rel_path)
+            scan.dirs.append((src_dir, dest_dir))
+
+            # Directories in the view are never symlinks that are merged
+            # through, or files could be linked into another prefix
+            dest_entries = {}
+            if dest_entry is None:
+                scan.new_dirs.add(dest_dir)
+            elif not dest_entry.is_dir(follow_symlinks=not rel_path):
+                scan.conflicts.append("File blocks directory: %s" % dest_dir)
+            else:
+                dest_entries = dict(
+                    (e.name, e) for e in _scandir(dest_dir))
+                if not dest_entries:
+                    scan.empty_dirs.add(dest_dir)
+
+            for entry in _scandir(src_dir):
+                rel_child = os.path.join(rel_path, entry.name)
+                dest_child = dest_entries.get(entry.name)
+
+                # Symlinked source directories become real directories
+                if entry.is_dir():
+                    stack.append((rel_child, dest_child))
+                elif not ignore(rel_child):
+                    dest = os.path.join(dest_dir, entry.name)
+                    scan.files[os.path.join(src_dir, entry.name)] = dest
+                    if dest_child is not None:
+                        scan.existing.add(dest)
+                        if dest_child.is_dir(follow_symlinks=False):
+                            scan.conflicts.append(
+                                "Directory blocks file: %s" % dest)
+        return scan
+
     def find_conflict(self, dest_root, ignore=None,
                       ignore_file_conflicts=False):
         """Returns the first file in dest that conflicts with src"""
-        ignore = ignore or (lambda x: False)
-        conflicts = self.find_dir_conflicts(dest_root, ignore)
+        scan = self.scan(dest_root, ignore)
+        conflicts = list(scan.conflicts)
 
         if not ignore_file_conflicts:
-            conflicts.extend(
-                dst for src, dst
-                in self.get_file_map(dest_root, ignore).items()
-                if os.path.exists(dst))
+            conflicts.extend(sorted(scan.existing))
 
         if conflicts:
             return conflicts[0]
 
     def find_dir_conflicts(self, dest_root, ignore):
-        conflicts = []
-        kwargs = {'follow_nonexisting': False, 'ignore': ignore}
-        for src, dest in traverse_tree(self._root, dest_root, **kwargs):
-            if os.path.isdir(src):
-                if os.path.exists(dest) and not os.path.isdir(dest):
-                    conflicts.append("File blocks directory: %s" % dest)
-            elif os.path.exists(dest) and os.path.isdir(dest):
-                conflicts.append("Directory blocks directory: %s" % dest)
-        return conflicts
+        return self.scan(dest_root, ignore).conflicts
 
     def get_file_map(self, dest_root, ignore):
-        merge_map = {}
-        kwargs = {'follow_nonexisting': True, 'ignore': ignore}
-        for src, dest in traverse_tree(self._root, dest_root, **kwargs):
-            if not os.path.isdir(src):
-                merge_map[src] = dest
-        return merge_map
-
-    def merge_directories(self, dest_root, ignore):
-        for src, dest in traverse_tree(self._root, dest_root, ignore=ignore):
-            if os.path.isdir(src):
-                if not os.path.exists(dest):
-                    mkdirp(dest)
-                    continue
+        return self.scan(dest_root, ignore).files
 
-                if not os.path.isdir(dest):
-                    raise ValueError("File blocks directory: %s" % dest)
+    def merge_directories(self, dest_root, ignore, scan=None):
+        """Create the directories of the tree in dest_root.
 
+        Arguments:
+            scan (TreeScan): result of ``scan(dest_root, ignore)``, if it
+                was computed already
+        """
+        scan = scan or self.scan(dest_root, ignore)
+        for src, dest in scan.dirs:
+            if dest in scan.new_dirs:
+                mkdirp(dest)
+            elif not os.path.isdir(dest):
+                raise ValueError("File blocks directory: %s" % dest)
+            elif dest in scan.empty_dirs:
                 # mark empty directories so they aren't removed on unmerge.
-                if not os.listdir(dest):
-                    marker = os.path.join(dest, empty_file_name)
-                    touch(marker)
+                touch(os.path.join(dest, empty_file_name))
 
     def unmerge_directories(self, dest_root, ignore):
         for src, dest in traverse_tree(
@@ -113,7 +189,7 @@ class LinkTree(object):
                     os.remove(marker)
 
     def merge(self, dest_root, ignore_conflicts=False, ignore=None,
-              link=os.symlink, relative=False):
+              link=os.symlink, relative=False, jobs=1):
         """Link all files in src into dest, creating directories
            if necessary.
 
@@ -130,29 +206,43 @@ class LinkTree(object):
         relative (bool): create all symlinks relative to the target
             (default False)
 
+        jobs (int): number of threads creating the links (default 1). More
+            than one helps when each link is a round trip to a remote
+            filesystem.
+
         """
-        if ignore is None:
-            ignore = lambda x: False
+        scan = self.scan(dest_root, ignore)
+        conflicts = list(scan.conflicts)
+        if not ignore_conflicts:
+            conflicts.extend(sorted(scan.existing))
+        if conflicts:
+            raise MergeConflictError(conflicts[0])
 
-        conflict = self.find_conflict(
-            dest_root, ignore=ignore, ignore_file_conflicts=ignore_conflicts)
-        if conflict:
-            raise MergeConflictError(conflict)
+        self.merge_directories(dest_root, ignore, scan=scan)
 
-        self.merge_directories(dest_root, ignore)
-        existing = []
-        for src, dst in self.get_file_map(dest_root, ignore).items():
-            if os.path.exists(dst):
-                existing.append(dst)
-            elif relative:
+        def link_file(item):
+            src, dst = item
+            if relative:
                 abs_src = os.path.abspath(src)
                 dst_dir = os.path.dirname(os.path.abspath(dst))
-                rel = os.path.relpath(abs_src, dst_dir)
-                link(rel, dst)
+                link(os.path.relpath(abs_src, dst_dir), dst)
             else:
                 link(src, dst)
 
-        for c in existing:
+        todo = [(src, dst) for src, dst in scan.files.items()
+                if dst not in scan.existing]
+        if jobs > 1 and len(todo) > 1:
+            pool = ThreadPool(min(jobs, len(todo)))
+            try:
+                pool.map(link_file, todo)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for item in todo:
+                link_file(item)
+
+        for c in sorted(scan.existing):
             tty.warn("Could not merge: %s" % c)
 
     def unmerge(self, dest_root, ignore=None, remove_file=remove_link):
@@ -284,11 +284,15 @@ class Lock(object):
             self._writes += 1
             return False
 
-    def release_read(self):
+    def release_read(self, release_fn=None):
         """Releases a read lock.
 
-        Returns True if the last recursive lock was released, False if
-        there are still outstanding locks.
+        Arguments:
+            release_fn (callable): function to call *before* the last
+                recursive lock (read or write) is released.
+
+        If the last recursive lock will be released, then this will call
+        release_fn and return True, otherwise return False.
 
         Does limited correctness checking: if a read lock is released
         when none are held, this will raise an assertion error.
@@ -300,6 +304,8 @@ class Lock(object):
             self._debug(
                 'READ LOCK: {0.path}[{0._start}:{0._length}] [Released]'
                 .format(self))
+            if release_fn is not None:
+                release_fn()
             self._unlock()      # can raise LockError.
             self._reads -= 1
             return True
@@ -307,11 +313,18 @@ class Lock(object):
             self._reads -= 1
             return False
 
-    def release_write(self):
+    def release_write(self, release_fn=None):
         """Releases a write lock.
 
-        Returns True if the last recursive lock was released, False if
-        there are still outstanding locks.
+        Arguments:
+            release_fn (callable): function to call before the last
+                recursive write is released.
+
+        If the last recursive *write* lock will be released, then this
+        will call release_fn and return True, otherwise return False.
+        The POSIX lock is held until all local read and write locks are
+        released, so release_fn always runs while other processes are
+        still locked out.
 
         Does limited correctness checking: if a read lock is released
         when none are held, this will raise an assertion error.
@@ -323,11 +336,19 @@ class Lock(object):
             self._debug(
                 'WRITE LOCK: {0.path}[{0._start}:{0._length}] [Released]'
                 .format(self))
+            if release_fn is not None:
+                release_fn()
             self._unlock()      # can raise LockError.
             self._writes -= 1
             return True
         else:
             self._writes -= 1
+            # the last write of a write nested in a read: the changes it
+            # protects are written while the lock is still held
+            if self._writes == 0:
+                if release_fn is not None:
+                    release_fn()
+                return True
             return False
 
     def _debug(self, *args):
@@ -382,15 +403,20 @@ class LockTransaction(object):
                 return self._as
 
     def __exit__(self, type, value, traceback):
-        suppress = False
-        if self._exit():
+        suppress = []
+
+        # called by the lock before it is released, so that whatever the
+        # transaction writes is not seen half-done by other processes
+        def release_fn():
             if self._as and hasattr(self._as, '__exit__'):
                 if self._as.__exit__(type, value, traceback):
-                    suppress = True
+                    suppress.append(True)
             if self._release_fn:
                 if self._release_fn(type, value, traceback):
-                    suppress = True
-        return suppress
+                    suppress.append(True)
+
+        self._exit(release_fn)
+        return bool(suppress)
 
 
 class ReadTransaction(LockTransaction):
@@ -398,8 +424,8 @@ class ReadTransaction(LockTransaction):
     def _enter(self):
         return self._lock.acquire_read(self._timeout)
 
-    def _exit(self):
-        return self._lock.release_read()
+    def _exit(self, release_fn):
+        return self._lock.release_read(release_fn)
 
 
 class WriteTransaction(LockTransaction):
@@ -407,8 +433,8 @@ class WriteTransaction(LockTransaction):
     def _enter(self):
         return self._lock.acquire_write(self._timeout)
 
-    def _exit(self):
-        return self._lock.release_write()
+    def _exit(self, release_fn):
+        return self._lock.release_write(release_fn)
 
 
 class LockError(Exception):
@@ -3,11 +3,14 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import gzip
+import io
 import os
 import re
 import tarfile
 import shutil
 import tempfile
+import time
 import hashlib
 from contextlib import closing
 
@@ -18,10 +21,14 @@ from six.moves.urllib.error import URLError
 import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp, install_tree
 
+import spack.caches
 import spack.cmd
+import spack.config
 import spack.fetch_strategy as fs
+import spack.util.compression as compression
 import spack.util.gpg as gpg_util
 import spack.relocate as relocate
+import spack.util.spack_json as sjson
 import spack.util.spack_yaml as syaml
 from spack.spec import Spec
 from spack.stage import Stage
@@ -32,6 +39,15 @@ from spack.util.executable import ProcessError
 
 _build_cache_relative_path = 'build_cache'
 
+#: Compressed JSON index of all the spec.yaml files in a build cache
+_spec_index_name = 'index.json.gz'
+
+#: File with the sha256 checksum of the index, checked before fetching it
+_spec_index_hash_name = 'index.json.hash'
+
+#: Version of the format of the index
+spec_index_version = 1
+
 
 class NoOverwriteException(Exception):
     """
@@ -90,6 +106,14 @@ class NewLayoutException(spack.error.SpackError):
     pass
 
 
+class UnsupportedCompressionException(spack.error.SpackError):
+    """
+    Raised if the buildcache tarball uses a compression that is not
+    available.
+    """
+    pass
+
+
 def has_gnupg2():
     try:
         gpg_util.Gpg.gpg()('--version', output=os.devnull)
@@ -125,10 +149,9 @@ def read_buildinfo_file(prefix):
     return buildinfo
 
 
-def write_buildinfo_file(prefix, workdir, rel=False):
+def get_buildinfo(prefix, rel=False):
     """
-    Create a cache file containing information
-    required for the relocation
+    Return the information required for the relocation of prefix
     """
     text_to_relocate = []
     binary_to_relocate = []
@@ -177,6 +200,15 @@ def write_buildinfo_file(prefix, workdir, rel=False):
     buildinfo['relocate_textfiles'] = text_to_relocate
     buildinfo['relocate_binaries'] = binary_to_relocate
     buildinfo['relocate_links'] = link_to_relocate
+    return buildinfo
+
+
+def write_buildinfo_file(prefix, workdir, rel=False):
+    """
+    Create a cache file containing information
+    required for the relocation
+    """
+    buildinfo = get_buildinfo(prefix, rel=rel)
     filename = buildinfo_file_name(workdir)
     with open(filename, 'w') as outfile:
         outfile.write(syaml.dump(buildinfo, default_flow_style=True))
@@ -214,6 +246,122 @@ def tarball_path_name(spec, ext):
                         tarball_name(spec, ext))
 
 
+class HashingWriter(object):
+    """Write-only file object computing the sha256 and size of the data
+    it passes on to the wrapped stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        self.stream.write(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+def add_prefix_to_tarball(tar, prefix, rel=False, allow_root=False):
+    """
+    Add the files of prefix to tar, reading each of them once from
+    the install prefix instead of a copy.  Binaries are made relative in a
+    temporary copy, links are redirected in their tar header only, and
+    the relocation information is added from memory.
+    """
+    buildinfo = get_buildinfo(prefix, rel=rel)
+    binaries = set(buildinfo['relocate_binaries'])
+    links = set(buildinfo['relocate_links'])
+    buildinfo_path = buildinfo_file_name(prefix)
+    arcroot = os.path.basename(prefix)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tar.add(prefix, arcname=arcroot, recursive=False)
+        for root, dirs, files in os.walk(prefix, topdown=True):
+            dirs.sort()
+            for filename in dirs + sorted(files):
+                path_name = os.path.join(root, filename)
+                rel_path_name = os.path.relpath(path_name, prefix)
+                arcname = os.path.join(arcroot, rel_path_name)
+
+                if path_name == buildinfo_path:
+                    continue
+
+                elif rel_path_name in links:
+                    tarinfo = tar.gettarinfo(path_name, arcname)
+                    link = os.readlink(path_name)
+                    if rel:
+                        tarinfo.linkname = relocate.relative_link_target(
+                            link, path_name)
+                    else:
+                        tarinfo.linkname = relocate.placeholder_link_target(
+                            link, prefix, prefix)
+                    tar.addfile(tarinfo)
+
+                elif rel_path_name in binaries and rel:
+                    tmp_path = os.path.join(tmpdir, filename)
+                    shutil.copy2(path_name, tmp_path)
+                    relocate.make_binary_relative(
+                        [tmp_path], [path_name], buildinfo['buildpath'],
+                        allow_root)
+                    tarinfo = tar.gettarinfo(tmp_path, arcname)
+                    with open(tmp_path, 'rb') as f:
+                        tar.addfile(tarinfo, f)
+                    os.remove(tmp_path)
+
+                else:
+                    if rel_path_name in binaries:
+                        relocate.make_binary_placeholder(
+                            [path_name], allow_root)
+                    tar.add(path_name, arcname=arcname, recursive=False)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    data = syaml.dump(buildinfo, default_flow_style=True).encode('utf-8')
+    tarinfo = tarfile.TarInfo(os.path.join(
+        arcroot, os.path.relpath(buildinfo_path, prefix)))
+    tarinfo.size = len(data)
+    tarinfo.mtime = int(time.time())
+    tarinfo.mode = 0o644
+    tar.addfile(tarinfo, io.BytesIO(data))
+
+
+def stream_tarball(spec, spackfile, tarfile_name, codec, rel=False,
+                   allow_root=False):
+    """
+    Write the tarball of the prefix of spec, compressed with codec, as the
+    first member of the uncompressed spackfile archive, in a single pass.
+    Return its sha256 checksum.
+    """
+    # The header of the member needs its size, so a placeholder of the
+    # same length is written first and filled in at the end
+    member = tarfile.TarInfo(tarfile_name)
+    member.mtime = int(time.time())
+    member.mode = 0o644
+    header_offset = spackfile.tell()
+    spackfile.write(b'\0' * len(member.tobuf(tarfile.GNU_FORMAT)))
+
+    writer = HashingWriter(spackfile)
+    with closing(codec.compressor(writer)) as stream:
+        with closing(tarfile.open(mode='w|', fileobj=stream)) as tar:
+            add_prefix_to_tarball(tar, spec.prefix, rel, allow_root)
+
+    remainder = writer.size % tarfile.BLOCKSIZE
+    if remainder:
+        spackfile.write(b'\0' * (tarfile.BLOCKSIZE - remainder))
+    end = spackfile.tell()
+
+    member.size = writer.size
+    spackfile.seek(header_offset)
+    spackfile.write(member.tobuf(tarfile.GNU_FORMAT))
+    spackfile.seek(end)
+
+    return writer.hexdigest()
+
+
 def checksum_tarball(file):
     # calculate sha256 hash of tar file
     block_size = 65536
@@ -276,20 +424,86 @@ def generate_package_index(build_cache_dir):
     _generate_html_index(path_list, index_html_path_tmp)
     shutil.move(index_html_path_tmp, index_html_path)
 
+    _generate_spec_index(build_cache_dir, yaml_list)
+
+
+def _generate_spec_index(build_cache_dir, file_list):
+    """Write the contents of all the spec.yaml files in build_cache_dir
+    to a single compressed JSON index, and its checksum next to it."""
+    index_path = os.path.join(build_cache_dir, _spec_index_name)
+
+    # Entries of spec.yaml files older than the previous index are reused
+    old_entries, index_mtime = {}, 0
+    if os.path.exists(index_path):
+        try:
+            index_mtime = os.stat(index_path).st_mtime
+            with open(index_path, 'rb') as f:
+                old_entries = _load_spec_index(f.read())['specs']
+        except Exception as e:
+            tty.debug('Rebuilding the spec index from scratch: %s' % e)
+            old_entries = {}
+
+    entries = {}
+    for filename in file_list:
+        if not filename.endswith('.spec.yaml'):
+            continue
+        path = os.path.join(build_cache_dir, filename)
+        if (filename in old_entries and
+                os.stat(path).st_mtime < index_mtime):
+            entries[filename] = old_entries[filename]
+        else:
+            with open(path, 'r') as f:
+                entries[filename] = syaml.load(f)
+
+    index = {'index_version': spec_index_version, 'specs': entries}
+    buf = io.BytesIO()
+    # sorted and without a timestamp, so that the same specs always give
+    # the same checksum
+    with closing(gzip.GzipFile(
+            filename='', mode='wb', fileobj=buf, mtime=0)) as f:
+        f.write(json.dumps(index, sort_keys=True).encode('utf-8'))
+    data = buf.getvalue()
+
+    for name, contents in ((_spec_index_name, data),
+                           (_spec_index_hash_name, hashlib.sha256(
+                               data).hexdigest().encode('utf-8'))):
+        tmp_path = os.path.join(build_cache_dir, name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(contents)
+        shutil.move(tmp_path, os.path.join(build_cache_dir, name))
+
+
+def _load_spec_index(data):
+    """Read the spec index from its compressed contents."""
+    with closing(gzip.GzipFile(fileobj=io.BytesIO(data))) as f:
+        index = sjson.load(f.read().decode('utf-8'))
+    if index.get('index_version') != spec_index_version:
+        raise ValueError('unsupported spec index version %s' %
+                         index.get('index_version'))
+    return index
+
 
 def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
-                  allow_root=False, key=None, regenerate_index=False):
+                  allow_root=False, key=None, regenerate_index=False,
+                  stream=False, compression_name=None):
     """
     Build a tarball from given spec and put it into the directory structure
     used at the mirror (following <tarball_directory_name>).
+
+    With stream, the tarball is created, compressed and checksummed in a
+    single pass over the install prefix, without copying it first.
+    The tarball is compressed with the codec called compression_name,
+    config:buildcache_compression by default.
     """
     if not spec.concrete:
         raise ValueError('spec must be concrete to build tarball')
 
+    codec = get_compression_codec(compression_name)
+
     # set up some paths
     build_cache_dir = build_cache_directory(outdir)
 
-    tarfile_name = tarball_name(spec, '.tar.gz')
+    tarfile_name = tarball_name(spec, codec.extension)
     tarfile_dir = os.path.join(build_cache_dir,
                                tarball_directory_name(spec))
     tarfile_path = os.path.join(tarfile_dir, tarfile_name)
@@ -314,38 +528,20 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
             os.remove(specfile_path)
         else:
             raise NoOverwriteException(str(specfile_path))
-    # make a copy of the install directory to work with
-    workdir = os.path.join(tempfile.mkdtemp(), os.path.basename(spec.prefix))
-    install_tree(spec.prefix, workdir, symlinks=True)
-
-    # create info for later relocation and create tar
-    write_buildinfo_file(spec.prefix, workdir, rel=rel)
 
-    # optionally make the paths in the binaries relative to each other
-    # in the spack install tree before creating tarball
-    if rel:
+    if stream:
+        spackfile = open(spackfile_path, 'wb')
         try:
-            make_package_relative(workdir, spec.prefix, allow_root)
+            checksum = stream_tarball(spec, spackfile, tarfile_name,
+                                      codec, rel, allow_root)
         except Exception as e:
-            shutil.rmtree(workdir)
+            spackfile.close()
             shutil.rmtree(tarfile_dir)
             tty.die(e)
     else:
-        try:
-            make_package_placeholder(workdir, spec.prefix, allow_root)
-        except Exception as e:
-            shutil.rmtree(workdir)
-            shutil.rmtree(tarfile_dir)
-            tty.die(e)
-    # create compressed tarball of the install prefix
-    with closing(tarfile.open(tarfile_path, 'w:gz')) as tar:
-        tar.add(name='%s' % workdir,
-                arcname='%s' % os.path.basename(spec.prefix))
-    # remove copy of install directory
-    shutil.rmtree(workdir)
-
-    # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
+        spackfile = None
+        checksum = _build_tarball_from_copy(
+            spec, tarfile_dir, tarfile_path, codec, rel, allow_root)
 
     # add sha256 checksum to spec.yaml
     spec_dict = {}
@@ -356,6 +552,7 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     bchecksum['hash_algorithm'] = 'sha256'
     bchecksum['hash'] = checksum
     spec_dict['binary_cache_checksum'] = bchecksum
+    spec_dict['binary_cache_compression'] = codec.name
     # Add original install prefix relative to layout root to spec.yaml.
     # This will be used to determine is the directory layout has changed.
     buildinfo = {}
@@ -375,15 +572,24 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     if not unsigned:
         sign_tarball(key, force, specfile_path)
     # put tarball, spec and signature files in .spack archive
-    with closing(tarfile.open(spackfile_path, 'w')) as tar:
+    if stream:
+        # the tarball is already there
+        tar = tarfile.open(fileobj=spackfile, mode='w',
+                           format=tarfile.GNU_FORMAT)
+    else:
+        tar = tarfile.open(spackfile_path, 'w')
         tar.add(name='%s' % tarfile_path, arcname='%s' % tarfile_name)
+    with closing(tar):
         tar.add(name='%s' % specfile_path, arcname='%s' % specfile_name)
         if not unsigned:
             tar.add(name='%s.asc' % specfile_path,
                     arcname='%s.asc' % specfile_name)
 
     # cleanup file moved to archive
-    os.remove(tarfile_path)
+    if stream:
+        spackfile.close()
+    else:
+        os.remove(tarfile_path)
     if not unsigned:
         os.remove('%s.asc' % specfile_path)
 
@@ -394,6 +600,64 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     return None
 
 
+def _build_tarball_from_copy(spec, tarfile_dir, tarfile_path, codec, rel,
+                             allow_root):
+    """
+    Create the tarball of a relocatable copy of the prefix of spec,
+    compressed with codec, and return its sha256 checksum.
+    """
+    # make a copy of the install directory to work with
+    workdir = os.path.join(tempfile.mkdtemp(), os.path.basename(spec.prefix))
+    install_tree(spec.prefix, workdir, symlinks=True)
+
+    # create info for later relocation and create tar
+    write_buildinfo_file(spec.prefix, workdir, rel=rel)
+
+    # optionally make the paths in the binaries relative to each other
+    # in the spack install tree before creating tarball
+    if rel:
+        try:
+            make_package_relative(workdir, spec.prefix, allow_root)
+        except Exception as e:
+            shutil.rmtree(workdir)
+            shutil.rmtree(tarfile_dir)
+            tty.die(e)
+    else:
+        try:
+            make_package_placeholder(workdir, spec.prefix, allow_root)
+        except Exception as e:
+            shutil.rmtree(workdir)
+            shutil.rmtree(tarfile_dir)
+            tty.die(e)
+    # create compressed tarball of the install prefix, and get its
+    # sha256 checksum while it is written
+    with open(tarfile_path, 'wb') as f:
+        writer = HashingWriter(f)
+        with closing(codec.compressor(writer)) as stream:
+            with closing(tarfile.open(mode='w|', fileobj=stream)) as tar:
+                tar.add(name='%s' % workdir,
+                        arcname='%s' % os.path.basename(spec.prefix))
+    # remove copy of install directory
+    shutil.rmtree(workdir)
+
+    return writer.hexdigest()
+
+
+def get_compression_codec(name=None):
+    """
+    Return the codec called name, or the one set in
+    config:buildcache_compression.  Fall back to gzip if it is not
+    available on this machine.
+    """
+    if name is None:
+        name = spack.config.get('config:buildcache_compression', 'gzip')
+    codec = compression.codec_for(name)
+    if not codec.available():
+        tty.warn('%s compression is not available, using gzip' % name)
+        codec = compression.codec_for('gzip')
+    return codec
+
+
 def download_tarball(spec):
     """
     Download binary tarball for given package into stage area
@@ -469,6 +733,7 @@ def relocate_package(workdir, allow_root):
 
     tty.msg("Relocating package from",
             "%s to %s." % (old_path, new_path))
+    start = time.time()
     path_names = set()
     for filename in buildinfo['relocate_textfiles']:
         path_name = os.path.join(workdir, filename)
@@ -478,6 +743,8 @@ def relocate_package(workdir, allow_root):
     relocate.relocate_text(path_names, oldpath=old_path,
                            newpath=new_path, oldprefix=old_prefix,
                            newprefix=new_prefix)
+    start = _relocation_phase_done('text files', len(path_names), start)
+
     # If the binary files in the package were not edited to use
     # relative RPATHs, then the RPATHs need to be relocated
     if not rel:
@@ -486,11 +753,22 @@ def relocate_package(workdir, allow_root):
             path_name = os.path.join(workdir, filename)
             path_names.add(path_name)
         relocate.relocate_binary(path_names, old_path, new_path, allow_root)
+        start = _relocation_phase_done('binaries', len(path_names), start)
+
         path_names = set()
         for filename in buildinfo.get('relocate_links', []):
             path_name = os.path.join(workdir, filename)
             path_names.add(path_name)
         relocate.relocate_links(path_names, old_path, new_path)
+        _relocation_phase_done('links', len(path_names), start)
+
+
+def _relocation_phase_done(what, count, start):
+    """Report the time spent relocating ``count`` files since ``start``,
+    and return the current time."""
+    now = time.time()
+    tty.debug('Relocated {0} {1} in {2:.2f}s'.format(count, what, now - start))
+    return now
 
 
 def extract_tarball(spec, filename, allow_root=False, unsigned=False,
@@ -508,8 +786,6 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
     stagepath = os.path.dirname(filename)
     spackfile_name = tarball_name(spec, '.spack')
     spackfile_path = os.path.join(stagepath, spackfile_name)
-    tarfile_name = tarball_name(spec, '.tar.gz')
-    tarfile_path = os.path.join(tmpdir, tarfile_name)
     specfile_name = tarball_name(spec, '.spec.yaml')
     specfile_path = os.path.join(tmpdir, specfile_name)
 
@@ -528,14 +804,26 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
                 "Package spec file failed signature verification.\n"
                 "Use spack buildcache keys to download "
                 "and install a key for verification from the mirror.")
-    # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
-
-    # get the sha256 checksum recorded at creation
     spec_dict = {}
     with open(specfile_path, 'r') as inputfile:
         content = inputfile.read()
         spec_dict = syaml.load(content)
+
+    # tarballs created before compression was configurable are gzipped
+    codec_name = spec_dict.get('binary_cache_compression', 'gzip')
+    codec = compression.codecs.get(codec_name)
+    if codec is None or not codec.available():
+        shutil.rmtree(tmpdir)
+        raise UnsupportedCompressionException(
+            "Package tarball is compressed with %s, " % codec_name +
+            "which is not available.\nIt cannot be installed.")
+    tarfile_name = tarball_name(spec, codec.extension)
+    tarfile_path = os.path.join(tmpdir, tarfile_name)
+
+    # get the sha256 checksum of the tarball
+    checksum = checksum_tarball(tarfile_path)
+
+    # get the sha256 checksum recorded at creation
     bchecksum = spec_dict['binary_cache_checksum']
 
     # if the checksums don't match don't install
@@ -560,8 +848,7 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
         raise NewLayoutException(msg)
 
     # extract the tarball in a temp directory
-    with closing(tarfile.open(tarfile_path, 'r')) as tar:
-        tar.extractall(path=tmpdir)
+    codec.extract(tarfile_path, tmpdir)
     # the base of the install prefix is used when creating the tarball
     # so the pathname should be the same now that the directory layout
     # is confirmed
@@ -584,46 +871,203 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
         shutil.rmtree(tmpdir)
 
 
-#: Internal cache for get_specs
-_cached_specs = None
+class BinaryCacheIndex(object):
+    """The specs in the build caches of the configured mirrors.
+
+    The specs of each mirror are indexed by DAG hash, along with the full
+    hash recorded when they were built. They are read the first time a
+    mirror is searched, and again after ``config:binary_index_ttl``
+    seconds or after ``refresh()``.
+    """
+
+    def __init__(self):
+        #: mirror url -> _MirrorSpecs
+        self._mirrors = {}
+
+    def refresh(self, mirror_url=None):
+        """Forget the specs read from one mirror, or from all of them."""
+        if mirror_url is None:
+            self._mirrors.clear()
+        else:
+            self._mirrors.pop(mirror_url, None)
+
+    def mirror_specs(self, mirror_url, force=False, spider=True):
+        """The specs in the build cache of a mirror, read again if they
+        are older than the TTL or if force is True.
+
+        If spider is False and the specs need to be read from a mirror
+        without an index, return None instead of listing its build cache.
+        """
+        ttl = spack.config.get('config:binary_index_ttl', 600)
+        entry = self._mirrors.get(mirror_url)
+        if force or entry is None or time.time() - entry.time > ttl:
+            entry = _MirrorSpecs.read(mirror_url, force, spider)
+            if entry is not None:
+                self._mirrors[mirror_url] = entry
+        else:
+            tty.debug("Using previously-retrieved specs of %s" % mirror_url)
+        return entry
+
+    def _mirror_urls(self, mirrors=None):
+        if mirrors is None:
+            mirrors = spack.config.get('mirrors')
+        return list(mirrors.values())
+
+    def specs(self, mirrors=None, force=False):
+        """All the specs in the build caches of the given mirrors, the
+        configured ones by default."""
+        specs = []
+        for mirror_url in self._mirror_urls(mirrors):
+            specs.extend(self.mirror_specs(mirror_url, force).specs)
+        return specs
+
+    def find(self, spec, mirrors=None):
+        """Return the (mirror url, spec) pairs of the build caches with
+        the same DAG hash as spec."""
+        dag_hash = spec.dag_hash()
+        found = []
+        for mirror_url in self._mirror_urls(mirrors):
+            entry = self.mirror_specs(mirror_url)
+            if dag_hash in entry.by_hash:
+                found.append((mirror_url, entry.by_hash[dag_hash]))
+        return found
+
+
+class _MirrorSpecs(object):
+    """The specs read from the build cache of one mirror."""
+
+    def __init__(self, mirror_url, spec_dicts, from_index):
+        self.time = time.time()
+        self.mirror_url = mirror_url
+        #: Whether the specs come from the index of the mirror, which
+        #: lists all of its build caches
+        self.from_index = from_index
+        #: dag hash -> spec
+        self.by_hash = {}
+        #: dag hash -> full hash in the spec.yaml, if any
+        self.full_hashes = {}
+        for spec_dict in spec_dicts:
+            # All specs in build caches are concrete (as they are built)
+            spec = Spec.from_dict(spec_dict)
+            spec._mark_concrete()
+            dag_hash = spec.dag_hash()
+            self.by_hash[dag_hash] = spec
+            self.full_hashes[dag_hash] = spec_dict.get('full_hash')
+
+    @property
+    def specs(self):
+        return list(self.by_hash.values())
+
+    @classmethod
+    def read(cls, mirror_url, force=False, spider=True):
+        """Read the specs of a mirror from its index, or else from each
+        spec.yaml if spider is True. Return None if neither is done."""
+        spec_dicts = _read_spec_index(mirror_url, force)
+        if spec_dicts is not None:
+            return cls(mirror_url, spec_dicts, True)
+        if not spider:
+            return None
+        return cls(mirror_url, _spider_specs(mirror_url, force), False)
+
+
+#: Index of the specs in the build caches of all mirrors
+binary_index = BinaryCacheIndex()
 
 
 def get_specs(force=False):
     """
     Get spec.yaml's for build caches available on mirror
     """
-    global _cached_specs
-
-    if _cached_specs:
-        tty.debug("Using previously-retrieved specs")
-        return _cached_specs
-
     mirrors = spack.config.get('mirrors')
     if len(mirrors) == 0:
         tty.warn("No Spack mirrors are currently configured")
         return {}
 
+    return binary_index.specs(mirrors, force)
+
+
+def _read_spec_index(mirror_url, force=False):
+    """
+    Get the contents of the spec.yaml files in the build cache of a mirror
+    from its index, which is cached locally and fetched again only when its
+    checksum changes. Return None if the mirror has no usable index.
+    """
+    build_cache_url = mirror_url + '/' + _build_cache_relative_path
+    try:
+        index_hash = read_from_url(
+            build_cache_url + '/' + _spec_index_hash_name).strip()
+    except (URLError, IOError) as e:
+        tty.debug('No spec index in %s, reading each spec.yaml' % mirror_url,
+                  e)
+        return None
+
+    url_hash = hashlib.sha1(mirror_url.encode('utf-8')).hexdigest()
+    key = 'buildcache-index/{0}.json.gz'.format(url_hash)
+    misc_cache = spack.caches.misc_cache
+
+    data = None
+    if not force and misc_cache.init_entry(key):
+        with misc_cache.read_transaction(key, binary=True) as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != index_hash:
+            data = None
+
+    if data is None:
+        tty.msg("Fetching the buildcache index of %s" % mirror_url)
+        index_url = build_cache_url + '/' + _spec_index_name
+        with Stage(index_url, name="build_cache_index") as stage:
+            try:
+                stage.fetch()
+            except fs.FetchError:
+                return None
+            with open(stage.save_filename, 'rb') as f:
+                data = f.read()
+
+        if hashlib.sha256(data).hexdigest() != index_hash:
+            tty.warn('The spec index of %s does not match its checksum' %
+                     mirror_url)
+            return None
+
+        misc_cache.init_entry(key)
+        with misc_cache.write_transaction(key, binary=True) as (old, new):
+            new.write(data)
+
+    try:
+        entries = _load_spec_index(data)['specs']
+    except Exception as e:
+        tty.warn('Cannot read the spec index of %s: %s' % (mirror_url, e))
+        return None
+
+    path = str(spack.architecture.sys_type())
+    return [spec_dict for filename, spec_dict in sorted(entries.items())
+            if mirror_url.startswith('file') or re.search(path, filename)]
+
+
+def _spider_specs(mirror_url, force=False):
+    """
+    Get the contents of the spec.yaml files in the build cache of a mirror
+    by listing and fetching each of them.
+    """
     path = str(spack.architecture.sys_type())
     urls = set()
-    for mirror_name, mirror_url in mirrors.items():
-        if mirror_url.startswith('file'):
-            mirror = mirror_url.replace(
-                'file://', '') + "/" + _build_cache_relative_path
-            tty.msg("Finding buildcaches in %s" % mirror)
-            if os.path.exists(mirror):
-                files = os.listdir(mirror)
-                for file in files:
-                    if re.search('spec.yaml', file):
-                        link = 'file://' + mirror + '/' + file
-                        urls.add(link)
-        else:
-            tty.msg("Finding buildcaches on %s" % mirror_url)
-            p, links = spider(mirror_url + "/" + _build_cache_relative_path)
-            for link in links:
-                if re.search("spec.yaml", link) and re.search(path, link):
+    if mirror_url.startswith('file'):
+        mirror = mirror_url.replace(
+            'file://', '') + "/" + _build_cache_relative_path
+        tty.msg("Finding buildcaches in %s" % mirror)
+        if os.path.exists(mirror):
+            files = os.listdir(mirror)
+            for file in files:
+                if re.search('spec.yaml', file):
+                    link = 'file://' + mirror + '/' + file
                     urls.add(link)
+    else:
+        tty.msg("Finding buildcaches on %s" % mirror_url)
+        p, links = spider(mirror_url + "/" + _build_cache_relative_path)
+        for link in links:
+            if re.search("spec.yaml", link) and re.search(path, link):
+                urls.add(link)
 
-    _cached_specs = []
+    spec_dicts = []
     for link in urls:
         with Stage(link, name="build_cache", keep=True) as stage:
             if force and os.path.exists(stage.save_filename):
@@ -634,14 +1078,9 @@ def get_specs(force=False):
                 except fs.FetchError:
                     continue
             with open(stage.save_filename, 'r') as f:
-                # read the spec from the build cache file. All specs
-                # in build caches are concrete (as they are built) so
-                # we need to mark this spec concrete on read-in.
-                spec = Spec.from_yaml(f)
-                spec._mark_concrete()
-                _cached_specs.append(spec)
+                spec_dicts.append(syaml.load(f))
 
-    return _cached_specs
+    return spec_dicts
 
 
 def get_keys(install=False, trust=False, force=False):
@@ -703,7 +1142,21 @@ def needs_rebuild(spec, mirror_url, rebuild_on_errors=False):
         pkg_name, pkg_version, pkg_hash, pkg_full_hash))
     tty.debug(spec.tree())
 
-    # Try to retrieve the .spec.yaml directly, based on the known
+    # Look the spec up in the build caches of the mirror, if they were
+    # already read or the mirror has an index: listing them all to check
+    # one spec costs more than reading its spec.yaml. If they come from
+    # the index, a missing spec is not in the mirror.
+    mirror_specs = binary_index.mirror_specs(mirror_url, spider=False)
+    if mirror_specs is not None:
+        if pkg_hash in mirror_specs.full_hashes:
+            return _full_hash_differs(
+                spec, mirror_specs.full_hashes[pkg_hash], pkg_full_hash)
+        elif mirror_specs.from_index:
+            tty.msg('Rebuilding {0}, reason: not in the build cache'.format(
+                spec.short_spec))
+            return True
+
+    # Otherwise try to retrieve the .spec.yaml directly, based on the known
     # format of the name, in order to determine if the package
     # needs to be rebuilt.
     build_cache_dir = build_cache_directory(mirror_url)
@@ -731,16 +1184,18 @@ def needs_rebuild(spec, mirror_url, rebuild_on_errors=False):
         return rebuild_on_errors
 
     spec_yaml = syaml.load(yaml_contents)
+    return _full_hash_differs(spec, spec_yaml.get('full_hash'), pkg_full_hash)
+
 
+def _full_hash_differs(spec, remote_full_hash, pkg_full_hash):
     # If either the full_hash didn't exist in the .spec.yaml file, or it
     # did, but didn't match the one we computed locally, then we should
     # just rebuild.  This can be simplified once the dag_hash and the
     # full_hash become the same thing.
-    if ('full_hash' not in spec_yaml or
-            spec_yaml['full_hash'] != pkg_full_hash):
-        if 'full_hash' in spec_yaml:
+    if remote_full_hash != pkg_full_hash:
+        if remote_full_hash:
             reason = 'hash mismatch, remote = {0}, local = {1}'.format(
-                spec_yaml['full_hash'], pkg_full_hash)
+                remote_full_hash, pkg_full_hash)
         else:
             reason = 'full_hash was missing from remote spec.yaml'
         tty.msg('Rebuilding {0}, reason: {1}'.format(
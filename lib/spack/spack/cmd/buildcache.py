@@ -16,6 +16,7 @@ import spack.relocate
 import spack.repo
 import spack.spec
 import spack.store
+import spack.util.compression
 
 from spack.error import SpecError
 import spack.config
@@ -59,6 +60,13 @@ def setup_parser(subparser):
                                             "building package(s)")
     create.add_argument('-y', '--spec-yaml', default=None,
                         help='Create buildcache entry for spec from yaml file')
+    create.add_argument('--stream', action='store_true', default=False,
+                        help="read, compress and checksum each prefix in a " +
+                             "single pass instead of copying it first")
+    create.add_argument('-c', '--compression', default=None,
+                        choices=list(spack.util.compression.codecs),
+                        help="compression of the tarballs " +
+                             "(default: config:buildcache_compression)")
     create.add_argument(
         'packages', nargs=argparse.REMAINDER,
         help="specs of packages to create buildcache for")
@@ -335,7 +343,12 @@ def createtarball(args):
         tty.msg('creating binary cache file for package %s ' % spec.format())
         bindist.build_tarball(spec, outdir, args.force, args.rel,
                               args.unsigned, args.allow_root, signkey,
-                              not args.no_rebuild_index)
+                              False, args.stream, args.compression)
+
+    # index all the new tarballs at once, rather than after each of them
+    if specs and not args.no_rebuild_index:
+        bindist.generate_package_index(
+            os.path.join(outdir, bindist.build_cache_relative_path()))
 
 
 def installtarball(args):
@@ -14,9 +14,12 @@ def setup_parser(subparser):
     subparser.add_argument(
         '-f', '--force', action='store_true',
         help="Re-concretize even if already concretized.")
+    subparser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help="Concretize up to JOBS specs at once, in separate processes.")
 
 
 def concretize(parser, args):
     env = ev.get_env(args, 'concretize', required=True)
-    env.concretize(force=args.force)
+    env.concretize(force=args.force, jobs=args.jobs)
     env.write()
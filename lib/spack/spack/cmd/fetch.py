@@ -9,6 +9,7 @@ import llnl.util.tty as tty
 
 import spack.cmd
 import spack.config
+import spack.prefetch
 import spack.repo
 import spack.cmd.common.arguments as arguments
 
@@ -38,6 +39,12 @@ def fetch(parser, args):
         spack.config.set('config:checksum', False, scope='command_line')
 
     specs = spack.cmd.parse_specs(args.packages, concretize=True)
+
+    # Download everything concurrently first; the loop below then only
+    # reports what was fetched, or fails on what could not be.
+    if args.missing or args.dependencies:
+        spack.prefetch.prefetch(specs)
+
     for spec in specs:
         if args.missing or args.dependencies:
             for s in spec.traverse():
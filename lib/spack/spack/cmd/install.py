@@ -61,6 +61,10 @@ alternatively one can decide to install only the package or only
 the dependencies"""
     )
     arguments.add_common_arguments(subparser, ['jobs', 'install_status'])
+    subparser.add_argument(
+        '-p', '--concurrent-packages', type=int, default=None,
+        metavar='N', dest='install_jobs',
+        help="build up to N independent dependencies at the same time")
     subparser.add_argument(
         '--overwrite', action='store_true',
         help="reinstall an existing spec, even if it has dependents")
@@ -217,6 +221,12 @@ def install_spec(cli_args, kwargs, abstract_spec, spec):
 
 
 def install(parser, args, **kwargs):
+    if args.install_jobs:
+        if args.install_jobs < 1:
+            tty.die('--concurrent-packages must be a positive integer')
+        spack.config.set('config:install_jobs', args.install_jobs,
+                         scope='command_line')
+
     if not args.package and not args.specfiles:
         # if there are no args but an active environment or spack.yaml file
         # then install the packages from it.
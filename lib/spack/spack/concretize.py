@@ -16,8 +16,11 @@ TODO: make this customizable and allow users to configure
 """
 from __future__ import print_function
 
+import multiprocessing
 import os.path
+import pickle
 import tempfile
+import time
 import llnl.util.filesystem as fs
 import llnl.util.tty as tty
 
@@ -35,6 +38,7 @@ import spack.compilers
 import spack.architecture
 import spack.error
 import spack.tengine
+import spack.util.spack_json as sjson
 from spack.config import config
 from spack.version import ver, Version, VersionList, VersionRange
 from spack.package_prefs import PackagePrefs, spec_externals, is_spec_buildable
@@ -58,6 +62,10 @@ class Concretizer(object):
         self.check_for_compiler_existence = not config.get(
             'config:install_missing_compilers', False)
 
+        #: Results of lookups shared by the specs concretized within
+        #: ``shared_lookups()``, or None outside of it
+        self._lookups = None
+
     @contextmanager
     def disable_compiler_existence_check(self):
         saved = self.check_for_compiler_existence
@@ -72,6 +80,38 @@ class Concretizer(object):
         yield
         self.check_for_compiler_existence = saved
 
+    @contextmanager
+    def shared_lookups(self):
+        """Share compiler lookups and version choices among all the specs
+        concretized in this context.
+
+        Configuration must not change within the context.
+        """
+        if self._lookups is not None:
+            yield
+            return
+
+        self._lookups = {}
+        try:
+            yield
+        finally:
+            self._lookups = None
+
+    def _lookup(self, key, function, *args):
+        """Return ``function(*args)``, memoized under ``key`` within
+        ``shared_lookups()``."""
+        if self._lookups is None:
+            return function(*args)
+
+        if key not in self._lookups:
+            self._lookups[key] = function(*args)
+        return self._lookups[key]
+
+    def _compilers_for_spec(self, compiler_spec, arch_spec):
+        key = ('compilers', str(compiler_spec), _arch_key(arch_spec))
+        return self._lookup(key, spack.compilers.compilers_for_spec,
+                            compiler_spec, arch_spec)
+
     def _valid_virtuals_and_externals(self, spec):
         """Returns a list of candidate virtual dep providers and external
            packages that coiuld be used to concretize a spec.
@@ -165,6 +205,14 @@ class Concretizer(object):
         if spec.versions.concrete:
             return False
 
+        key = ('version', spec.fullname, str(spec.versions))
+        versions = self._lookup(key, self._choose_version, spec)
+        spec.versions = versions.copy()
+
+        return True   # Things changed
+
+    def _choose_version(self, spec):
+        """The concrete VersionList that concretize_version() assigns."""
         # List of versions we could consider, in sorted order
         pkg_versions = spec.package_class.versions
         usable = [v for v in pkg_versions
@@ -201,27 +249,23 @@ class Concretizer(object):
         usable.sort(key=keyfn, reverse=True)
 
         if usable:
-            spec.versions = ver([usable[0]])
-        else:
-            # We don't know of any SAFE versions that match the given
-            # spec.  Grab the spec's versions and grab the highest
-            # *non-open* part of the range of versions it specifies.
-            # Someone else can raise an error if this happens,
-            # e.g. when we go to fetch it and don't know how.  But it
-            # *might* work.
-            if not spec.versions or spec.versions == VersionList([':']):
-                raise NoValidVersionError(spec)
-            else:
-                last = spec.versions[-1]
-                if isinstance(last, VersionRange):
-                    if last.end:
-                        spec.versions = ver([last.end])
-                    else:
-                        spec.versions = ver([last.start])
-                else:
-                    spec.versions = ver([last])
-
-        return True   # Things changed
+            return ver([usable[0]])
+
+        # We don't know of any SAFE versions that match the given
+        # spec.  Grab the spec's versions and grab the highest
+        # *non-open* part of the range of versions it specifies.
+        # Someone else can raise an error if this happens,
+        # e.g. when we go to fetch it and don't know how.  But it
+        # *might* work.
+        if not spec.versions or spec.versions == VersionList([':']):
+            raise NoValidVersionError(spec)
+
+        last = spec.versions[-1]
+        if isinstance(last, VersionRange):
+            if last.end:
+                return ver([last.end])
+            return ver([last.start])
+        return ver([last])
 
     def concretize_architecture(self, spec):
         """If the spec is empty provide the defaults of the platform. If the
@@ -303,7 +347,7 @@ class Concretizer(object):
         # compiler_for_spec Should think whether this can be more
         # efficient
         def _proper_compiler_style(cspec, aspec):
-            return spack.compilers.compilers_for_spec(cspec, arch_spec=aspec)
+            return self._compilers_for_spec(cspec, aspec)
 
         if spec.compiler and spec.compiler.concrete:
             if (self.check_for_compiler_existence and not
@@ -328,9 +372,8 @@ class Concretizer(object):
             return True
 
         if other_compiler:  # Another node has abstract compiler information
-            compiler_list = spack.compilers.find_specs_by_arch(
-                other_compiler, spec.architecture
-            )
+            compiler_list = [c.spec for c in self._compilers_for_spec(
+                other_compiler, spec.architecture)]
             if not compiler_list:
                 # We don't have a matching compiler installed
                 if not self.check_for_compiler_existence:
@@ -346,7 +389,8 @@ class Concretizer(object):
                     raise UnavailableCompilerVersionError(other_compiler)
         else:
             # We have no hints to go by, grab any compiler
-            compiler_list = spack.compilers.all_compiler_specs()
+            compiler_list = self._lookup(
+                ('all_compilers',), spack.compilers.all_compiler_specs)
             if not compiler_list:
                 # Spack has no compilers.
                 raise spack.compilers.NoCompilersError()
@@ -411,8 +455,10 @@ class Concretizer(object):
         # This ensures that spack will detect conflicts that stem from a change
         # in default compiler flags.
         try:
-            compiler = spack.compilers.compiler_for_spec(
-                spec.compiler, spec.architecture)
+            key = ('compiler', str(spec.compiler),
+                   _arch_key(spec.architecture))
+            compiler = self._lookup(key, spack.compilers.compiler_for_spec,
+                                    spec.compiler, spec.architecture)
         except spack.compilers.NoCompilerForSpecError:
             if self.check_for_compiler_existence:
                 raise
@@ -429,6 +475,13 @@ class Concretizer(object):
         return ret
 
 
+def _arch_key(arch_spec):
+    """Hashable key for an ArchSpec, or None."""
+    if arch_spec is None:
+        return None
+    return (arch_spec.platform, arch_spec.os, arch_spec.target)
+
+
 def find_spec(spec, condition, default=None):
     """Searches the dag from spec in an intelligent order and looks
        for a spec that matches a condition"""
@@ -472,6 +525,145 @@ def _compiler_concretization_failure(compiler_spec, arch):
         raise UnavailableCompilerVersionError(compiler_spec, arch)
 
 
+def concretize_specs(abstract_specs, jobs=1):
+    """Concretize many root specs separately, sharing work among them.
+
+    Each root is concretized on its own, as with ``Spec.concretized()``,
+    but compiler lookups, version choices, and node-level ``satisfies()``
+    and ``constrain()`` checks are shared by all of them.  Package classes
+    are loaded once per process anyway.
+
+    With more than one job, the roots are concretized by a pool of
+    processes. Repository indexes, compiler configuration and the classes
+    of the packages that can be in the DAGs are loaded before the pool
+    starts, so the workers inherit them instead of loading them each.
+
+    Args:
+        abstract_specs (list): abstract specs to be concretized, given
+            either as Specs or strings
+        jobs (int): number of processes concretizing specs at once
+
+    Yields:
+        (tuple): the abstract spec, its concrete counterpart, and the
+            time in seconds it took to concretize it, in the order of
+            ``abstract_specs``
+    """
+    abstract_specs = [s if isinstance(s, spack.spec.Spec) else
+                      spack.spec.Spec(s) for s in abstract_specs]
+
+    # daemonic processes (e.g. builds) cannot start worker processes
+    jobs = min(jobs, len(abstract_specs))
+    if multiprocessing.current_process().daemon:
+        jobs = 1
+
+    with concretizer.shared_lookups():
+        with spack.spec.memoized_checks() as checks:
+            if jobs > 1:
+                results = _concretize_in_pool(abstract_specs, jobs)
+            else:
+                results = _concretize_serially(abstract_specs)
+
+            for abstract, concrete, elapsed in results:
+                tty.debug('[CONCRETIZATION]: {0} took {1:.2f}s'.format(
+                    abstract, elapsed))
+                yield abstract, concrete, elapsed
+
+            tty.debug('[CONCRETIZATION]: {0}'.format(checks))
+
+
+def _concretize_serially(abstract_specs):
+    for abstract in abstract_specs:
+        start = time.time()
+        concrete = abstract.concretized()
+        yield abstract, concrete, time.time() - start
+
+
+def _concretize_in_pool(abstract_specs, jobs):
+    tty.debug('[CONCRETIZATION]: {0} specs with {1} processes'.format(
+        len(abstract_specs), jobs))
+    _load_for_concretization(abstract_specs)
+
+    pool = multiprocessing.Pool(processes=jobs)
+    try:
+        results = pool.imap(_concretize_in_worker,
+                            [str(s) for s in abstract_specs])
+        for abstract, (nodes, elapsed, error) in zip(abstract_specs, results):
+            if error is not None:
+                raise error
+            yield abstract, _spec_from_nodes(sjson.load(nodes)), elapsed
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _load_for_concretization(abstract_specs):
+    """Load the state every concretization needs: the provider index, the
+    compiler configuration and the classes of the packages that the specs
+    can depend on, without expanding virtual dependencies."""
+    repo = spack.repo.path
+    repo.provider_index
+    spack.compilers.all_compilers_config()
+
+    names = set()
+    for abstract in abstract_specs:
+        for s in abstract.traverse():
+            if s.name and not s.virtual and repo.exists(s.name):
+                names.add(s.name)
+    visited = {}
+    for name in sorted(names):
+        if name not in visited:
+            visited[name] = set()
+            repo.get_pkg_class(name).possible_dependencies(
+                expand_virtuals=False, visited=visited)
+
+
+def _concretize_in_worker(abstract):
+    """Concretize one spec in a worker of ``concretize_specs()``.
+
+    Returns:
+        (tuple): the nodes of the concrete spec as JSON, the time it took
+            and None, or None, the time and the error raised
+    """
+    start = time.time()
+    try:
+        concrete = spack.spec.Spec(abstract).concretized()
+        nodes = []
+        for s in concrete.traverse(deptype='all'):
+            node = s.to_node_dict(all_deps=True)
+            node[s.name]['hash'] = s.dag_hash()
+            nodes.append(node)
+        return sjson.dump(nodes), time.time() - start, None
+    except BaseException as e:
+        # Errors that end the worker, like SystemExit from tty.die(), must
+        # be sent back too, or pool.imap() would wait for them forever
+        error = e
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            error = spack.error.SpackError(
+                'Failed to concretize %s' % abstract, str(e))
+        return None, time.time() - start, error
+
+
+def _spec_from_nodes(nodes):
+    """Rebuild a concrete spec from the node dictionaries of its DAG, root
+    first, the way environments read their lockfile."""
+    specs_by_hash = {}
+    for node in nodes:
+        spec = spack.spec.Spec.from_node_dict(node)
+        specs_by_hash[spec.dag_hash()] = spec
+
+    for node in nodes:
+        name = next(iter(node))
+        spec = specs_by_hash[node[name]['hash']]
+        for dep_name, dep_hash, deptypes in (
+                spack.spec.Spec.dependencies_from_node_dict(node)):
+            spec._add_dependency(specs_by_hash[dep_hash], deptypes)
+
+    root = nodes[0]
+    return specs_by_hash[root[next(iter(root))]['hash']]
+
+
 def concretize_specs_together(*abstract_specs):
     """Given a number of specs as input, tries to concretize them together.
 
@@ -20,12 +20,14 @@ provides a cache and a sanity checking mechanism for what is in the
 filesystem.
 
 """
+import bisect
 import datetime
 import time
 import os
 import sys
 import socket
 import contextlib
+import json
 from six import string_types
 from six import iteritems
 
@@ -59,6 +61,10 @@ _db_lock_timeout = 120
 # Types of dependencies tracked by the database
 _tracked_deps = ('link', 'run')
 
+# In journal mode, the journal is compacted into a new index snapshot once
+# it grows past this fraction of the snapshot's size
+_db_journal_compaction_ratio = 0.5
+
 
 def _now():
     """Returns the time since the epoch"""
@@ -139,6 +145,125 @@ class InstallRecord(object):
         return InstallRecord(spec, **d)
 
 
+class RecordIndex(object):
+    """Secondary indexes over the install records of a database.
+
+    Maps package names, compiler names and the installed and explicit
+    flags to the hashes of the matching records, and keeps the hashes
+    sorted by installation date.  Queries use it to find the few records
+    worth testing with ``Spec.satisfies()`` instead of testing them all.
+    The hashes are also kept in sorted order, so that abbreviated hashes
+    can be resolved with a binary search.
+
+    The index must be told about every record whose installed or explicit
+    flags change, and about every record added or removed.
+    """
+
+    def __init__(self, data=None):
+        self.by_name = {}
+        self.by_compiler = {}
+        self.installed = set()
+        self.explicit = set()
+        self._by_date = []  # sorted list of (installation date, hash)
+        self._hashes = []  # sorted list of all hashes
+        self._entries = {}  # hash -> (name, compiler, date) indexed for it
+
+        for key, rec in (data or {}).items():
+            self.update(key, rec)
+
+    def update(self, key, rec):
+        """Index the current state of ``rec``, or drop ``key`` if None."""
+        self._discard(key)
+        if rec is None:
+            return
+
+        compiler = rec.spec.compiler.name if rec.spec.compiler else None
+        date = datetime.datetime.fromtimestamp(rec.installation_time)
+        self._entries[key] = (rec.spec.name, compiler, date)
+        bisect.insort(self._hashes, key)
+
+        self.by_name.setdefault(rec.spec.name, set()).add(key)
+        self.by_compiler.setdefault(compiler, set()).add(key)
+        bisect.insort(self._by_date, (date, key))
+        if rec.installed:
+            self.installed.add(key)
+        if rec.explicit:
+            self.explicit.add(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        name, compiler, date = entry
+        self.by_name[name].discard(key)
+        self.by_compiler[compiler].discard(key)
+        i = bisect.bisect_left(self._by_date, (date, key))
+        del self._by_date[i]
+        del self._hashes[bisect.bisect_left(self._hashes, key)]
+        self.installed.discard(key)
+        self.explicit.discard(key)
+
+    def hashes_with_prefix(self, prefix):
+        """Return the hashes starting with ``prefix``, in sorted order."""
+        matches = []
+        i = bisect.bisect_left(self._hashes, prefix)
+        while i < len(self._hashes) and self._hashes[i].startswith(prefix):
+            matches.append(self._hashes[i])
+            i += 1
+        return matches
+
+    def installed_between(self, start_date=None, end_date=None):
+        """Hashes of records installed strictly between the two dates."""
+        start = 0
+        if start_date is not None:
+            start = bisect.bisect_right(self._by_date, (start_date, chr(127)))
+        end = len(self._by_date)
+        if end_date is not None:
+            end = bisect.bisect_left(self._by_date, (end_date, ''))
+        return set(key for _, key in self._by_date[start:end])
+
+    def candidates(self, query_spec=any, installed=any, explicit=any,
+                   start_date=None, end_date=None, hashes=None):
+        """Return the hashes that may match a query, or None for all.
+
+        The result is a superset of the matching hashes: only the
+        conditions the index knows about are applied.
+        """
+        sets = []
+        if hashes is not None:
+            sets.append(set(hashes))
+
+        if isinstance(query_spec, spack.spec.Spec):
+            if query_spec.name and not query_spec.virtual:
+                sets.append(self.by_name.get(query_spec.name, set()))
+            if query_spec.compiler and query_spec.compiler.name:
+                sets.append(
+                    self.by_compiler.get(query_spec.compiler.name, set()))
+
+        if installed is True:
+            sets.append(self.installed)
+        elif installed is False:
+            sets.append(set(self._entries) - self.installed)
+
+        if explicit is True:
+            sets.append(self.explicit)
+        elif explicit is False:
+            sets.append(set(self._entries) - self.explicit)
+
+        if start_date is not None or end_date is not None:
+            sets.append(self.installed_between(start_date, end_date))
+
+        if not sets:
+            return None
+
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result.intersection_update(other)
+        return result
+
+
 class ForbiddenLockError(SpackError):
     """Raised when an upstream DB attempts to acquire a lock"""
 
@@ -189,6 +314,8 @@ class Database(object):
         # Set up layout of database files within the db dir
         self._old_yaml_index_path = os.path.join(self._db_dir, 'index.yaml')
         self._index_path = os.path.join(self._db_dir, 'index.json')
+        self._verifier_path = os.path.join(self._db_dir, 'index_verifier')
+        self._journal_path = os.path.join(self._db_dir, 'index_journal')
         self._lock_path = os.path.join(self._db_dir, 'lock')
 
         # This is for other classes to use to lock prefix directories.
@@ -218,8 +345,24 @@ class Database(object):
                   str(timeout_format_str)))
         self.lock = Lock(self._lock_path,
                          default_timeout=self.db_lock_timeout)
+        self._journal = bool(spack.config.get('config:db_journal', False))
         self._data = {}
 
+        # Keys of records changed by the current write transaction, or None
+        # if the whole index must be rewritten.
+        self._dirty = None
+
+        # Secondary indexes over ``_data``, built when first needed.
+        self._index = None
+
+        # Number of bytes of the journal already applied to ``_data``.
+        self._journal_offset = 0
+
+        # Identity of the index file as of the last time this process read
+        # or wrote it.  If it is unchanged at the start of a transaction,
+        # ``_data`` is still current and the index need not be parsed again.
+        self._last_seen_index = None
+
         self.upstream_dbs = list(upstream_dbs) if upstream_dbs else []
 
         # whether there was an error at the start of a read transaction
@@ -491,6 +634,7 @@ class Database(object):
             rec.spec._mark_concrete()
 
         self._data = data
+        self._index = None
 
     def reindex(self, directory_layout):
         """Build database index from scratch based on a directory layout.
@@ -507,10 +651,13 @@ class Database(object):
         def _read_suppress_error():
             try:
                 if os.path.isfile(self._index_path):
+                    self._journal_offset = 0
                     self._read_from_file(self._index_path)
+                    self._read_journal()
             except CorruptDatabaseError as e:
                 self._error = e
                 self._data = {}
+                self._index = None
 
         transaction = WriteTransaction(
             self.lock, _read_suppress_error, self._write
@@ -525,12 +672,15 @@ class Database(object):
                 self._error = None
 
             old_data = self._data
+            # The whole index is rebuilt, so it is written out in full.
+            self._dirty = None
             try:
                 self._construct_from_directory_layout(
                     directory_layout, old_data)
             except BaseException:
                 # If anything explodes, restore old data, skip write.
                 self._data = old_data
+                self._index = None
                 raise
 
     def _construct_from_directory_layout(self, directory_layout, old_data):
@@ -543,6 +693,7 @@ class Database(object):
         with directory_layout.disable_upstream_check():
             # Initialize data in the reconstructed DB
             self._data = {}
+            self._index = None
 
             # Start inspecting the installed prefixes
             processed_specs = set()
@@ -643,28 +794,206 @@ class Database(object):
         database *may* be left in an inconsistent state.  It will be consistent
         after the start of the next transaction, when it read from disk again.
 
+        In journal mode (``config:db_journal``), only the records changed by
+        the transaction are appended to the journal, unless the journal has
+        grown large enough to be compacted into a new snapshot.
+
         This routine does no locking.
 
         """
-        # Do not write if exceptions were raised
+        # Do not write if exceptions were raised.  The in-memory data may
+        # not match the file anymore, so force the next read to parse it.
         if type is not None:
+            self._last_seen_index = None
             return
 
+        if self._journal and self._dirty is not None and (
+                os.path.isfile(self._index_path)):
+            max_size = (os.path.getsize(self._index_path) *
+                        _db_journal_compaction_ratio)
+            if self._journal_offset < max_size:
+                self._append_to_journal()
+                return
+
+        self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Write the whole database to ``index.json`` and drop the journal.
+
+        This routine does no locking.
+        """
         temp_file = self._index_path + (
             '.%s.%s.temp' % (socket.getfqdn(), os.getpid()))
 
         # Write a temporary database file them move it into place
+        generation = self._read_generation() + 1
         try:
             with open(temp_file, 'w') as f:
                 self._write_to_file(f)
             os.rename(temp_file, self._index_path)
+            with open(self._verifier_path, 'w') as f:
+                f.write(str(generation))
+            # The new snapshot contains everything in the journal.
+            if os.path.exists(self._journal_path):
+                os.remove(self._journal_path)
         except BaseException as e:
             tty.debug(e)
+            self._last_seen_index = None
             # Clean up temp file if something goes wrong.
             if os.path.exists(temp_file):
                 os.remove(temp_file)
             raise
 
+        # What we have in memory is exactly what we just wrote.
+        self._last_seen_index = self._index_identity()
+        self._journal_offset = 0
+        self._dirty = set()
+
+    def _append_to_journal(self):
+        """Append the records changed by this transaction to the journal.
+
+        Each journal line holds the final state of every record touched by
+        one write transaction (``None`` for removed records), so replaying
+        a line is idempotent.  Anything after the last complete line is
+        left over from an interrupted writer and is discarded.
+
+        This routine does no locking.
+        """
+        if not self._dirty:
+            return
+
+        changes = dict(
+            (key, self._data[key].to_dict() if key in self._data else None)
+            for key in self._dirty)
+        line = json.dumps(
+            {'changes': changes}, sort_keys=True, separators=(',', ':'))
+        line = (line + '\n').encode('utf-8')
+
+        try:
+            with open(self._journal_path, 'ab') as f:
+                f.truncate(self._journal_offset)
+                f.write(line)
+        except BaseException as e:
+            tty.debug(e)
+            self._last_seen_index = None
+            raise
+
+        self._journal_offset += len(line)
+        self._dirty = set()
+
+    def _read_journal(self):
+        """Apply journal lines appended since the journal was last read.
+
+        Does not do any locking.
+        """
+        try:
+            with open(self._journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except (IOError, OSError):
+            return
+
+        # Only complete lines are valid transactions.
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                changes = sjson.load(line.decode('utf-8'))['changes']
+            except Exception as e:
+                raise CorruptDatabaseError(
+                    "error parsing database journal:", str(e))
+            self._apply_journal_changes(changes)
+        self._journal_offset += end
+
+    def _apply_journal_changes(self, changes):
+        """Apply one transaction's worth of journal records to ``_data``.
+
+        New records are built in the same passes as in ``_read_from_file``.
+        Records already present only have their installation data replaced,
+        as a spec cannot change without changing its hash.
+
+        Does not do any locking.
+        """
+        new_keys = []
+        for hash_key, rec in changes.items():
+            try:
+                if rec is None:
+                    self._data.pop(hash_key, None)
+                elif hash_key in self._data:
+                    spec = self._data[hash_key].spec
+                    self._data[hash_key] = InstallRecord.from_dict(spec, rec)
+                else:
+                    spec = self._read_spec_from_dict(hash_key, changes)
+                    self._data[hash_key] = InstallRecord.from_dict(spec, rec)
+                    new_keys.append(hash_key)
+            except Exception as e:
+                raise CorruptDatabaseError(
+                    "Invalid record in Spack database journal: hash: %s, "
+                    "cause: %s: %s" % (hash_key, type(e).__name__, str(e)),
+                    self._journal_path)
+
+        for hash_key in new_keys:
+            self._assign_dependencies(hash_key, changes, self._data)
+
+        for hash_key in new_keys:
+            self._data[hash_key].spec._mark_concrete()
+
+        if self._index is not None:
+            for hash_key in changes:
+                self._index.update(hash_key, self._data.get(hash_key))
+
+    def _record_changed(self, hash_key):
+        """Note that the record for a hash was just added, changed or removed.
+
+        Keeps the secondary indexes current, and marks the record as
+        changed by the current write transaction.
+        """
+        if self._index is not None:
+            self._index.update(hash_key, self._data.get(hash_key))
+        if self._dirty is not None:
+            self._dirty.add(hash_key)
+
+    def _get_index(self):
+        """Return the secondary indexes over ``_data``, building them if
+        they were dropped since the last query."""
+        if self._index is None:
+            self._index = RecordIndex(self._data)
+        return self._index
+
+    def _read_generation(self):
+        """Return the write generation stored next to the index.
+
+        The counter is bumped by every ``_write`` and, together with the
+        index file's own stat data, tells readers whether the index has
+        changed since they last parsed it.  Missing or garbled counters
+        read as 0.
+        """
+        try:
+            with open(self._verifier_path, 'r') as f:
+                return int(f.read().strip())
+        except (IOError, OSError, ValueError):
+            return 0
+
+    def _index_identity(self):
+        """Return a key identifying the current contents of the index.
+
+        The key is made of the mtime, size and inode of ``index.json`` and
+        the write generation.  Writers replace the index by renaming a new
+        file into place, so any write (from this or another process)
+        changes the key.  Returns None if there is no index file.
+        """
+        try:
+            st = os.stat(self._index_path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size, st.st_ino, self._read_generation())
+
+    def _journal_size(self):
+        """Return the size of the journal in bytes (0 if there is none)."""
+        try:
+            return os.path.getsize(self._journal_path)
+        except OSError:
+            return 0
+
     def _read(self):
         """Re-read Database from the data in the set location.
 
@@ -673,9 +1002,26 @@ class Database(object):
         taking a write lock.
 
         """
+        # Whatever happens below, memory matches the disk afterwards.
+        self._dirty = set()
+
         if os.path.isfile(self._index_path):
-            # Read from JSON file if a JSON database exists
-            self._read_from_file(self._index_path, format='json')
+            # Skip parsing if nobody touched the index since we last saw it.
+            # Upstream databases always re-read: downstream databases link
+            # their specs into ours, so our in-memory specs do not reflect
+            # the index alone.
+            identity = self._index_identity()
+            if (self.is_upstream or identity is None or
+                    identity != self._last_seen_index or
+                    self._journal_size() < self._journal_offset):
+                # Read from JSON file if a JSON database exists
+                self._last_seen_index = None
+                self._journal_offset = 0
+                self._read_from_file(self._index_path, format='json')
+                self._last_seen_index = self._index_identity()
+
+            # Changes made since the snapshot was written
+            self._read_journal()
 
         elif os.path.isfile(self._old_yaml_index_path):
             if (not self.is_upstream) and os.access(
@@ -783,6 +1129,7 @@ class Database(object):
                 new_spec._add_dependency(record.spec, dep.deptypes)
                 if not upstream:
                     record.ref_count += 1
+                    self._record_changed(dkey)
 
             # Mark concrete once everything is built, and preserve
             # the original hash of concrete specs.
@@ -794,6 +1141,7 @@ class Database(object):
             self._data[key].installed = True
 
         self._data[key].explicit = explicit
+        self._record_changed(key)
 
     @_autospec
     def add(self, spec, directory_layout, explicit=False):
@@ -840,6 +1188,8 @@ class Database(object):
             for dep in spec.dependencies(_tracked_deps):
                 self._decrement_ref_count(dep)
 
+        self._record_changed(key)
+
     def _remove(self, spec):
         """Non-locking version of remove(); does real work.
         """
@@ -848,9 +1198,11 @@ class Database(object):
 
         if rec.ref_count > 0:
             rec.installed = False
+            self._record_changed(key)
             return rec.spec
 
         del self._data[key]
+        self._record_changed(key)
         for dep in rec.spec.dependencies(_tracked_deps):
             self._decrement_ref_count(dep)
 
@@ -874,6 +1226,20 @@ class Database(object):
         with self.write_transaction():
             return self._remove(spec)
 
+    @_autospec
+    def update_explicit(self, spec, explicit):
+        """Update the explicit flag of a spec's install record.
+
+        Args:
+            spec (Spec): spec whose install record is updated
+            explicit (bool): whether the spec was installed explicitly
+        """
+        with self.write_transaction():
+            key = self._get_matching_spec_key(spec)
+            if key in self._data and self._data[key].explicit != explicit:
+                self._data[key].explicit = explicit
+                self._record_changed(key)
+
     @_autospec
     def installed_relatives(self, spec, direction='children', transitive=True,
                             deptype='all'):
@@ -1001,13 +1367,22 @@ class Database(object):
             else:
                 return []
 
-        # Abstract specs require more work -- currently we test
-        # against everything.
+        # Abstract specs require more work -- use the secondary indexes to
+        # narrow down the records to test against.
+        candidates = self._get_index().candidates(
+            query_spec, installed, explicit, start_date, end_date, hashes)
+        if candidates is None:
+            records = self._data.items()
+        else:
+            records = ((key, self._data[key]) for key in candidates
+                       if key in self._data)
+
         results = []
         start_date = start_date or datetime.datetime.min
         end_date = end_date or datetime.datetime.max
+        known_names = {}
 
-        for key, rec in self._data.items():
+        for key, rec in records:
             if hashes is not None and rec.spec.dag_hash() not in hashes:
                 continue
 
@@ -1017,9 +1392,12 @@ class Database(object):
             if explicit is not any and rec.explicit != explicit:
                 continue
 
-            if known is not any and spack.repo.path.exists(
-                    rec.spec.name) != known:
-                continue
+            if known is not any:
+                name = rec.spec.name
+                if name not in known_names:
+                    known_names[name] = spack.repo.path.exists(name)
+                if known_names[name] != known:
+                    continue
 
             inst_date = datetime.datetime.fromtimestamp(
                 rec.installation_time
@@ -1032,6 +1410,46 @@ class Database(object):
 
         return results
 
+    def _get_by_hash_local(self, dag_hash, installed=any):
+        index = self._get_index()
+        return [self._data[key].spec
+                for key in index.hashes_with_prefix(dag_hash)
+                if installed is any or self._data[key].installed == installed]
+
+    def get_by_hash_local(self, dag_hash, installed=any):
+        """Look up specs in *this DB* by DAG hash or DAG hash prefix.
+
+        Args:
+            dag_hash (str): hash, or prefix of a hash, to look up
+            installed (bool or any, optional): if ``True`` only installed
+                specs match, if ``False`` only missing ones, and if ``any``
+                every spec in the database (default: any)
+
+        Returns:
+            list of specs whose hash starts with ``dag_hash``
+        """
+        with self.read_transaction():
+            return self._get_by_hash_local(dag_hash, installed=installed)
+
+    def get_by_hash(self, dag_hash, installed=any):
+        """Look up specs by DAG hash or DAG hash prefix, in this DB and
+        in upstream DBs.
+
+        Specs found in more than one database are only returned once, from
+        the first database they are found in.  Arguments are the same as
+        for ``get_by_hash_local()``.
+        """
+        matches = self.get_by_hash_local(dag_hash, installed=installed)
+        seen = set(spec.dag_hash() for spec in matches)
+        for upstream_db in self.upstream_dbs:
+            # upstream DBs are not locked, see query()
+            for spec in upstream_db._get_by_hash_local(
+                    dag_hash, installed=installed):
+                if spec.dag_hash() not in seen:
+                    seen.add(spec.dag_hash())
+                    matches.append(spec)
+        return matches
+
     def query_local(self, *args, **kwargs):
         with self.read_transaction():
             return sorted(self._query(*args, **kwargs))
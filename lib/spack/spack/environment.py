@@ -15,10 +15,14 @@ import llnl.util.filesystem as fs
 import llnl.util.tty as tty
 from llnl.util.tty.color import colorize
 
+import spack.concretize
 import spack.error
+import spack.installer
+import spack.prefetch
 import spack.repo
 import spack.schema.env
 import spack.spec
+import spack.store
 import spack.util.spack_json as sjson
 import spack.config
 from spack.spec import Spec
@@ -629,7 +633,7 @@ class Environment(object):
                 del self.concretized_order[i]
                 del self.specs_by_hash[dag_hash]
 
-    def concretize(self, force=False):
+    def concretize(self, force=False, jobs=None):
         """Concretize user_specs in this environment.
 
         Only concretizes specs that haven't been concretized yet unless
@@ -641,7 +645,12 @@ class Environment(object):
         Arguments:
             force (bool): re-concretize ALL specs, even those that were
                already concretized
+            jobs (int): number of processes concretizing user specs at
+               once (default: ``config:concretize_jobs``)
         """
+        if jobs is None:
+            jobs = spack.config.get('config:concretize_jobs', 1)
+
         if force:
             # Clear previously concretized specs
             self.concretized_user_specs = []
@@ -663,18 +672,19 @@ class Environment(object):
                 self._add_concrete_spec(s, concrete, new=False)
 
         # concretize any new user specs that we haven't concretized yet
-        for uspec in self.user_specs:
-            if uspec not in old_concretized_user_specs:
-                tty.msg('Concretizing %s' % uspec)
-                concrete = uspec.concretized()
-                self._add_concrete_spec(uspec, concrete)
-
-                # Display concretized spec to the user
-                sys.stdout.write(concrete.tree(
-                    recurse_dependencies=True,
-                    status_fn=spack.spec.Spec.install_status,
-                    hashlen=7, hashes=True)
-                )
+        new_user_specs = [s for s in self.user_specs
+                          if s not in old_concretized_user_specs]
+        for uspec, concrete, seconds in spack.concretize.concretize_specs(
+                new_user_specs, jobs=jobs):
+            tty.msg('Concretized %s [%.2fs]' % (uspec, seconds))
+            self._add_concrete_spec(uspec, concrete)
+
+            # Display concretized spec to the user
+            sys.stdout.write(concrete.tree(
+                recurse_dependencies=True,
+                status_fn=spack.spec.Spec.install_status,
+                hashlen=7, hashes=True)
+            )
 
     def install(self, user_spec, concrete_spec=None, **install_args):
         """Install a single spec into an environment.
@@ -726,24 +736,54 @@ class Environment(object):
 
         self._view_path = view_path
 
-    def regenerate_view(self):
+    def regenerate_view(self, full=False):
+        """Link the installed specs of the environment into its view, and
+        unlink the specs that are no longer in the environment.
+
+        The view keeps a manifest of the specs linked in it, so only the
+        specs added or removed since the last update are linked or
+        unlinked. The view is scanned for linked specs instead if ``full``
+        is True, or if it has no manifest.
+        """
         if not self._view_path:
             tty.debug("Skip view update, this environment does not"
                       " maintain a view")
             return
 
-        specs_for_view = []
-        for spec in self._get_environment_specs():
-            # The view does not store build deps, so if we want it to
-            # recognize environment specs (which do store build deps), then
-            # they need to be stripped
-            specs_for_view.append(spack.spec.Spec.from_dict(
-                spec.to_dict(all_deps=False)
-            ))
-        installed_specs_for_view = set(s for s in specs_for_view
-                                       if s.package.installed)
+        with spack.store.db.read_transaction():
+            installed = dict((s.dag_hash(), s)
+                             for s in self._get_environment_specs()
+                             if s.package.installed)
 
         view = self.view()
+        linked = None if full else view.read_manifest()
+        if linked is None:
+            self._rescan_view(view, installed)
+            return
+
+        rm_hashes = [h for h in linked if h not in installed]
+        add_specs = [_view_spec(s) for h, s in installed.items()
+                     if h not in linked]
+        if not rm_hashes and not add_specs:
+            tty.debug("View at {0} is up to date".format(self._view_path))
+            return
+
+        tty.msg("Updating view at {0}".format(self._view_path))
+        for h in rm_hashes:
+            view.remove_manifest_entry(linked.pop(h))
+
+        view.add_specs(*add_specs, with_dependencies=False)
+        for spec in add_specs:
+            if view.check_added(spec):
+                linked[spec.dag_hash()] = view.manifest_entry(spec)
+        view.write_manifest(linked)
+
+    def _rescan_view(self, view, installed):
+        """Update the view by comparing the installed environment specs with
+        the specs found in it, and write its manifest."""
+        installed_specs_for_view = set(
+            _view_spec(s) for s in installed.values())
+
         view.clean()
         specs_in_view = set(view.get_all_specs())
         tty.msg("Updating view at {0}".format(self._view_path))
@@ -754,6 +794,9 @@ class Environment(object):
         add_specs = installed_specs_for_view - specs_in_view
         view.add_specs(*add_specs, with_dependencies=False)
 
+        view.write_manifest(dict((s.dag_hash(), view.manifest_entry(s))
+                                 for s in view.get_all_specs()))
+
     def _shell_vars(self):
         updates = [
             ('PATH', ['bin']),
@@ -813,18 +856,43 @@ class Environment(object):
         self.specs_by_hash[h] = concrete
 
     def install_all(self, args=None):
-        """Install all concretized specs in an environment."""
-        for concretized_hash in self.concretized_order:
-            spec = self.specs_by_hash[concretized_hash]
+        """Install all concretized specs in an environment.
 
-            # Parse cli arguments and construct a dictionary
-            # that will be passed to Package.do_install API
-            kwargs = dict()
-            if args:
-                spack.cmd.install.update_kwargs_from_args(args, kwargs)
-
-            self._install(spec, **kwargs)
+        The DAGs of all the roots are installed as a single DAG, with up
+        to ``config:install_jobs`` packages built at the same time.
+        """
+        # Parse cli arguments and construct a dictionary
+        # that will be passed to Package.do_install API
+        kwargs = dict()
+        if args:
+            spack.cmd.install.update_kwargs_from_args(args, kwargs)
+
+        roots = [self.specs_by_hash[h] for h in self.concretized_order]
+        if spack.config.get('config:install_missing_compilers', False):
+            # compilers are bootstrapped by the install of each root
+            for spec in roots:
+                spec.package.do_install(**kwargs)
+        else:
+            plan = spack.installer.InstallPlan(
+                roots, use_cache=kwargs.get('use_cache', True))
+            tty.msg('Installing ' + plan.summary())
+            for label, specs in (('From build cache', plan.from_cache),
+                                 ('From source', plan.from_source)):
+                if specs:
+                    tty.msg('{0}: {1}'.format(label, ' '.join(
+                        s.cformat('{name}{/hash:7}') for s in specs)))
+
+            if plan.missing and not kwargs.get('fake', False):
+                spack.prefetch.prefetch(
+                    plan.missing, use_cache=kwargs.get('use_cache', True))
+
+            kwargs['install_deps'] = False
+            spack.installer.install_plan(
+                plan, spack.config.get('config:install_jobs', 1), **kwargs)
 
+        # Make sure log directory exists
+        fs.mkdirp(self.log_path)
+        for spec in roots:
             if not spec.external:
                 # Link the resulting log file into logs dir
                 build_log_link = os.path.join(
@@ -1057,6 +1125,13 @@ class Environment(object):
             activate(self._previous_active)
 
 
+def _view_spec(spec):
+    """The view does not store build deps, so if we want it to recognize
+    environment specs (which do store build deps), then they need to be
+    stripped."""
+    return spack.spec.Spec.from_dict(spec.to_dict(all_deps=False))
+
+
 def make_repo_path(root):
     """Make a RepoPath from the repo subdirectories in an environment."""
     path = spack.repo.RepoPath()
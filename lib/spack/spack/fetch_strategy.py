@@ -27,9 +27,12 @@ import sys
 import re
 import shutil
 import copy
+import fcntl
+import socket
 import xml.etree.ElementTree
 from functools import wraps
 from six import string_types, with_metaclass
+from six.moves.urllib.error import URLError
 
 import llnl.util.tty as tty
 from llnl.util.filesystem import (
@@ -48,6 +51,12 @@ from spack.util.compression import decompressor_for, extension
 #: List of all fetch strategies, created by FetchStrategy metaclass.
 all_strategies = []
 
+#: Archives are downloaded and checksummed in blocks of this many bytes
+download_block_size = 1 << 20
+
+#: ioctl that clones a file on copy-on-write filesystems on Linux
+_FICLONE = 0x40049409
+
 
 def _needs_stage(fun):
     """Many methods on fetch strategies require a stage to be set
@@ -203,6 +212,11 @@ class URLFetchStrategy(FetchStrategy):
         self.extra_curl_options = kwargs.get('curl_options', [])
         self._curl = None
 
+        # (path, size, mtime) of the archive as it was downloaded, and
+        # the checksum computed while downloading it
+        self._fetched_archive = None
+        self._fetched_sum = None
+
         self.extension = kwargs.get('extension', None)
 
         if not self.url:
@@ -231,6 +245,69 @@ class URLFetchStrategy(FetchStrategy):
 
         tty.msg("Fetching %s" % self.url)
 
+        # Options like cookies (e.g. for jdk) only make sense to curl
+        if (save_file and not self.extra_curl_options and
+                spack.config.get('config:url_fetch_method') == 'urllib'):
+            self._fetch_urllib(save_file, partial_file)
+        else:
+            self._fetch_curl(save_file, partial_file)
+
+    def _fetch_urllib(self, save_file, partial_file):
+        """Download the archive in this process, computing its checksum
+        while it is written, so that check() need not read it again."""
+        # spack.util.web imports spack.stage, which imports this module
+        import spack.util.web
+
+        hasher = None
+        if self.digest:
+            try:
+                hasher = crypto.hash_fun_for_digest(self.digest)()
+            except ValueError:
+                pass  # check() reports the bad digest
+
+        try:
+            response = spack.util.web.open_url(self.url)
+        except (URLError, socket.error, ValueError) as e:
+            raise FailedDownloadError(self.url, str(e))
+
+        try:
+            with open(partial_file, 'wb') as f:
+                while True:
+                    chunk = response.read(download_block_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    if hasher:
+                        hasher.update(chunk)
+            content_type = response.info().get('Content-Type') or ''
+        except (URLError, socket.error, IOError) as e:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            raise FailedDownloadError(self.url, str(e))
+        finally:
+            response.close()
+
+        if 'text/html' in content_type:
+            self._warn_html(save_file)
+
+        os.rename(partial_file, save_file)
+        if hasher:
+            self._fetched_archive = self._archive_identity(save_file)
+            self._fetched_sum = hasher.hexdigest()
+
+    def _archive_identity(self, path):
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime)
+
+    def _warn_html(self, path):
+        msg = ("The contents of {0} look like HTML. Either the URL "
+               "you are trying to use does not exist or you have an "
+               "internet gateway issue. You can remove the bad archive "
+               "using 'spack clean <package>', then try again using "
+               "the correct URL.")
+        tty.warn(msg.format(path or "the archive"))
+
+    def _fetch_curl(self, save_file, partial_file):
         if partial_file:
             save_args = ['-C',
                          '-',  # continue partial downloads
@@ -299,12 +376,7 @@ class URLFetchStrategy(FetchStrategy):
         content_types = re.findall(r'Content-Type:[^\r\n]+', headers,
                                    flags=re.IGNORECASE)
         if content_types and 'text/html' in content_types[-1]:
-            msg = ("The contents of {0} look like HTML. Either the URL "
-                   "you are trying to use does not exist or you have an "
-                   "internet gateway issue. You can remove the bad archive "
-                   "using 'spack clean <package>', then try again using "
-                   "the correct URL.")
-            tty.warn(msg.format(self.archive_file or "the archive"))
+            self._warn_html(self.archive_file)
 
         if save_file:
             os.rename(partial_file, save_file)
@@ -393,11 +465,18 @@ class URLFetchStrategy(FetchStrategy):
             shutil.move(tarball_container, self.stage.source_path)
 
     def archive(self, destination):
-        """Just moves this archive to the destination."""
+        """Just copies this archive to the destination.
+
+        Archives that are expanded are only ever read, so they are
+        hardlinked (or reflinked) rather than copied when possible.
+        """
         if not self.archive_file:
             raise NoArchiveFileError("Cannot call archive() before fetching.")
 
-        shutil.copyfile(self.archive_file, destination)
+        if self.expand_archive:
+            link_or_copy(self.archive_file, destination)
+        else:
+            shutil.copyfile(self.archive_file, destination)
 
     @_needs_stage
     def check(self):
@@ -408,7 +487,13 @@ class URLFetchStrategy(FetchStrategy):
                 "Attempt to check URLFetchStrategy with no digest.")
 
         checker = crypto.Checker(self.digest)
-        if not checker.check(self.archive_file):
+        if (self._fetched_archive and self._fetched_archive ==
+                self._archive_identity(self.archive_file)):
+            # computed while downloading the archive, which is unchanged
+            checker.sum = self._fetched_sum
+        else:
+            checker.check(self.archive_file)
+        if checker.sum != self.digest:
             raise ChecksumError(
                 "%s checksum failed for %s" %
                 (checker.hash_name, self.archive_file),
@@ -1172,6 +1257,31 @@ def from_list_url(pkg):
             tty.msg("Could not determine url from list_url.")
 
 
+def link_or_copy(src, dest):
+    """Make dest a hardlink to src if they are on the same filesystem, or a
+    copy-on-write clone of src if the filesystem supports it, or a copy."""
+    src = os.path.realpath(src)
+    if os.path.lexists(dest):
+        os.remove(dest)
+
+    try:
+        os.link(src, dest)
+        return
+    except OSError as e:
+        tty.debug('Cannot link %s to %s: %s' % (dest, src, e))
+
+    if sys.platform.startswith('linux'):
+        try:
+            with open(src, 'rb') as s:
+                with open(dest, 'wb') as d:
+                    fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            return
+        except (IOError, OSError):
+            pass
+
+    shutil.copyfile(src, dest)
+
+
 class FsCache(object):
 
     def __init__(self, root):
@@ -15,8 +15,9 @@ from llnl.util import tty
 from llnl.util.lang import match_predicate, index_by
 from llnl.util.tty.color import colorize
 from llnl.util.filesystem import (
-    mkdirp, remove_dead_links, remove_empty_directories)
+    mkdirp, remove_dead_links, remove_empty_directories, write_tmp_and_move)
 
+import spack.util.spack_json as sjson
 import spack.util.spack_yaml as s_yaml
 
 import spack.spec
@@ -38,6 +39,10 @@ __all__ = ["FilesystemView", "YamlFilesystemView"]
 
 
 _projections_path = '.spack/projections.yaml'
+_manifest_path = '.spack/manifest.json'
+
+#: Version of the manifest format; manifests of other versions are ignored
+manifest_version = 1
 
 
 class FilesystemView(object):
@@ -218,6 +223,9 @@ class YamlFilesystemView(FilesystemView):
 
         self._croot = colorize_root(self._root) + " "
 
+        # files linked by merge(), by DAG hash of the merged spec
+        self._merged_files = {}
+
     def add_specs(self, *specs, **kwargs):
         assert all((s.concrete for s in specs))
         specs = set(specs)
@@ -314,9 +322,10 @@ class YamlFilesystemView(FilesystemView):
             self.layout.hidden_file_paths, ignore)
 
         # check for dir conflicts
-        conflicts = tree.find_dir_conflicts(view_dst, ignore_file)
+        scan = tree.scan(view_dst, ignore_file)
+        conflicts = list(scan.conflicts)
 
-        merge_map = tree.get_file_map(view_dst, ignore_file)
+        merge_map = scan.files
         if not self.ignore_conflicts:
             conflicts.extend(pkg.view_file_conflicts(self, merge_map))
 
@@ -324,9 +333,10 @@ class YamlFilesystemView(FilesystemView):
             raise MergeConflictError(conflicts[0])
 
         # merge directories with the tree
-        tree.merge_directories(view_dst, ignore_file)
+        tree.merge_directories(view_dst, ignore_file, scan=scan)
 
         pkg.add_files_to_view(self, merge_map)
+        self._merged_files[spec.dag_hash()] = list(merge_map.values())
 
     def unmerge(self, spec, ignore=None):
         pkg = spec.package
@@ -481,6 +491,102 @@ class YamlFilesystemView(FilesystemView):
                         specs.append(spec)
         return specs
 
+    def read_manifest(self):
+        """Return the manifest entries of the specs linked in this view,
+        keyed by DAG hash, or None if the view has no (usable) manifest."""
+        path = os.path.join(self._root, _manifest_path)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path) as f:
+                data = sjson.load(f)
+        except (IOError, ValueError) as e:
+            tty.debug('Ignoring manifest of view %s: %s' % (self._root, e))
+            return None
+
+        if data.get('version') != manifest_version:
+            return None
+        return data['specs']
+
+    def write_manifest(self, entries):
+        """Write the manifest of this view.
+
+        Arguments:
+            entries (dict): ``manifest_entry()`` of the specs linked in the
+                view, keyed by DAG hash
+        """
+        path = os.path.join(self._root, _manifest_path)
+        mkdirp(os.path.dirname(path))
+        with write_tmp_and_move(path) as f:
+            sjson.dump({'version': manifest_version, 'specs': entries},
+                       stream=f)
+
+    def manifest_entry(self, spec):
+        """Return the manifest entry of a spec linked in this view: its
+        prefix, its meta folder and the files it linked, relative to the
+        root of the view."""
+        files = self._merged_files.get(spec.dag_hash())
+        if files is None:
+            # linked before this view was opened: list the files of the
+            # prefix that merge() links
+            pkg = spec.package
+            tree = LinkTree(pkg.view_source())
+            ignore_file = match_predicate(self.layout.hidden_file_paths)
+            files = tree.get_file_map(
+                pkg.view_destination(self), ignore_file).values()
+
+        def relative(path):
+            return os.path.relpath(path, self._root)
+
+        return {
+            'name': spec.name,
+            'prefix': str(spec.prefix),
+            'meta': relative(self.get_path_meta_folder(spec)),
+            'files': sorted(relative(f) for f in files),
+        }
+
+    def remove_manifest_entry(self, entry):
+        """Unlink the spec of a manifest entry from this view.
+
+        If the spec is still installed it is removed as usual. Otherwise its
+        prefix is gone, and only the files the entry lists that are now
+        broken links are removed, without scanning the rest of the view.
+        """
+        meta = os.path.join(self._root, entry['meta'])
+        spec = None
+        if os.path.isdir(entry['prefix']):
+            spec = get_spec_from_file(
+                os.path.join(meta, spack.store.layout.spec_file_name))
+
+        if spec:
+            if spec.package.is_extension:
+                self.remove_extension(spec, with_dependents=False)
+            else:
+                self.remove_standalone(spec)
+            return
+
+        dirs = set()
+        for name in entry['files']:
+            path = os.path.join(self._root, name)
+            if os.path.islink(path) and not os.path.exists(path):
+                os.remove(path)
+                dirs.add(os.path.dirname(path))
+        shutil.rmtree(meta, ignore_errors=True)
+        dirs.add(os.path.dirname(meta))
+
+        # remove the directories left empty, deepest first
+        for path in sorted(dirs, key=len, reverse=True):
+            while path.startswith(self._root + os.sep):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    break
+                path = os.path.dirname(path)
+
+        if self.verbose:
+            tty.info(self._croot + 'Removed package: %s' % entry['name'])
+
     def get_conflicts(self, *specs):
         """
             Return list of tuples (<spec>, <spec in view>) where the spec
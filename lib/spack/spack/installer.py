@@ -0,0 +1,263 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Install the dependencies of a package, or whole environments,
+concurrently.
+
+``PackageBase.do_install`` installs dependencies one at a time, in post
+order. With ``config:install_jobs`` greater than one, it uses
+``install_dependencies()`` instead, which keeps a queue of the packages
+whose dependencies are all installed and runs up to ``install_jobs`` of
+them at once, each in its own process. The processes run the usual
+``do_install``, so prefixes are protected by the database's prefix
+locks and the database is updated under its own lock as usual.
+
+Environments install all their roots from a single ``InstallPlan``: the
+DAGs of the roots are merged into one, with each package appearing once
+whatever the number of roots depending on it, and the packages missing
+from the database are looked up once, before anything is built.
+``install_plan()`` then schedules the missing packages the same way.
+
+The cores on the machine are shared between the concurrent builds: each
+of them runs ``make`` with ``cpu_count / install_jobs`` jobs, or fewer if
+``config:build_jobs`` is lower.
+
+When a package fails to build, the packages that depend on it are not
+built; everything else is. The error of the first failure is raised once
+all the other builds are done.
+"""
+import multiprocessing
+import pickle
+import select
+
+import llnl.util.tty as tty
+
+import spack.binary_distribution
+import spack.config
+import spack.error
+import spack.store
+
+
+def install_dependencies(pkg, jobs, **kwargs):
+    """Install the dependencies of pkg, up to jobs of them at once.
+
+    Arguments:
+        pkg (PackageBase): package whose dependencies are installed
+        jobs (int): maximum number of packages built at the same time
+        kwargs: arguments for ``do_install`` of each dependency
+    """
+    specs = list(pkg.spec.traverse(order='post', root=False))
+    tty.debug('Installing {0} dependencies of {1}'.format(
+        len(specs), pkg.name))
+    _install_dag(specs, jobs, kwargs)
+
+
+class InstallPlan(object):
+    """The packages in the DAGs of a list of root specs, merged into a
+    single DAG, and how each of them is going to be installed.
+
+    Attributes:
+        roots (list): the root specs
+        specs (list): all the specs of the DAG, each once, in post order
+        installed (list): specs that are installed already, or external
+        from_cache (list): specs that will be installed from a build cache
+        from_source (list): specs that will be built from source
+    """
+
+    def __init__(self, roots, use_cache=True):
+        self.roots = list(roots)
+        self.specs = []
+        visited = set()
+        for root in self.roots:
+            for spec in root.traverse(order='post'):
+                if spec.dag_hash() not in visited:
+                    visited.add(spec.dag_hash())
+                    self.specs.append(spec)
+
+        self.installed, self.from_cache, self.from_source = [], [], []
+        with spack.store.db.read_transaction():
+            for spec in self.specs:
+                if _installs_in_place(spec.package):
+                    self.installed.append(spec)
+                elif use_cache and spack.binary_distribution.binary_index.find(
+                        spec):
+                    self.from_cache.append(spec)
+                else:
+                    self.from_source.append(spec)
+
+    @property
+    def missing(self):
+        """Specs of the DAG that need to be installed."""
+        return self.from_cache + self.from_source
+
+    def summary(self):
+        """One line description of the plan."""
+        return ('{0} packages: {1} installed, {2} from build cache, '
+                '{3} from source'.format(
+                    len(self.specs), len(self.installed),
+                    len(self.from_cache), len(self.from_source)))
+
+
+def install_plan(plan, jobs, **kwargs):
+    """Install the missing packages of an ``InstallPlan``, up to jobs of
+    them at once.
+
+    The roots are installed with the ``explicit`` argument in kwargs, and
+    the other packages as implicit. With a single job, packages are
+    installed in this process one after the other.
+
+    Arguments:
+        plan (InstallPlan): packages to install
+        jobs (int): maximum number of packages built at the same time
+        kwargs: arguments for ``do_install`` of each package
+    """
+    roots = set(s.dag_hash() for s in plan.roots)
+    missing = set(s.dag_hash() for s in plan.missing)
+    specs = [s for s in plan.specs
+             if s.dag_hash() in missing or s.dag_hash() in roots]
+    explicit = roots if kwargs.pop('explicit', False) else ()
+    _install_dag(specs, jobs, kwargs, explicit)
+
+
+def _install_dag(specs, jobs, kwargs, explicit=()):
+    """Install specs, given in post order, each after the ones it depends
+    on, with up to jobs processes.
+
+    Dependencies that are not in specs are assumed to be installed. Specs
+    whose hash is in explicit are installed as explicit, others are not.
+    """
+    order = [s.dag_hash() for s in specs]
+    specs = dict((s.dag_hash(), s) for s in specs)
+
+    # dependencies of each package, and dependents of each package, that
+    # are still to be installed
+    waiting_on = dict((h, set()) for h in specs)
+    dependents = dict((h, set()) for h in specs)
+    for h, spec in specs.items():
+        for dep in spec.dependencies():
+            if dep.dag_hash() in specs:
+                waiting_on[h].add(dep.dag_hash())
+                dependents[dep.dag_hash()].add(h)
+
+    build_jobs = max(1, min(spack.config.get('config:build_jobs', 1),
+                            multiprocessing.cpu_count() // jobs))
+    tty.debug('Installing {0} packages, {1} at a time with {2} make jobs '
+              'each'.format(len(specs), jobs, build_jobs))
+
+    # post order, so that ready packages start in the usual order
+    ready = [h for h in order if not waiting_on[h]]
+    running = {}
+    errors = []
+    skipped = []
+
+    def done(h):
+        for d in dependents[h]:
+            if d in waiting_on:  # not cancelled
+                waiting_on[d].discard(h)
+                if not waiting_on[d]:
+                    ready.append(d)
+
+    def cancel(h):
+        for d in dependents[h]:
+            if d in waiting_on:
+                skipped.append(specs[d])
+                del waiting_on[d]
+                cancel(d)
+
+    try:
+        while ready or running:
+            while ready and len(running) < jobs:
+                h = ready.pop(0)
+                del waiting_on[h]
+                dep_pkg = specs[h].package
+                dep_kwargs = dict(kwargs, explicit=h in explicit)
+                if jobs == 1 or _installs_in_place(dep_pkg):
+                    # nothing to build, or nothing to build concurrently:
+                    # no need for another process
+                    try:
+                        dep_pkg.do_install(**dep_kwargs)
+                    except spack.error.SpackError as e:
+                        errors.append((specs[h], e))
+                        cancel(h)
+                        continue
+                    done(h)
+                else:
+                    running[h] = _start(dep_pkg, build_jobs, dep_kwargs)
+
+            if not running:
+                continue
+
+            conns = dict((conn.fileno(), h)
+                         for h, (process, conn) in running.items())
+            readable, _, _ = select.select(list(conns), [], [])
+            for fd in readable:
+                h = conns[fd]
+                process, conn = running.pop(h)
+                try:
+                    error = conn.recv()
+                except Exception:
+                    error = InstallProcessError(
+                        'Failed to install %s' % specs[h].name,
+                        'The install process exited unexpectedly')
+                conn.close()
+                process.join()
+
+                if error is None:
+                    done(h)
+                else:
+                    errors.append((specs[h], error))
+                    cancel(h)
+    finally:
+        for process, conn in running.values():
+            process.terminate()
+            process.join()
+
+    if errors:
+        for spec, error in errors[1:]:
+            tty.error('Failed to install %s: %s' % (spec.name, error))
+        if skipped:
+            tty.error('Not installed because a dependency failed: ' +
+                      ', '.join(sorted(s.name for s in skipped)))
+        raise errors[0][1]
+
+
+def _installs_in_place(pkg):
+    """True if do_install does not build pkg, but only checks or
+    registers it."""
+    return pkg.spec.external or pkg.installed_upstream or pkg.installed
+
+
+def _start(pkg, build_jobs, kwargs):
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_install_process, args=(pkg, build_jobs, kwargs, child_conn))
+    process.start()
+    child_conn.close()
+    return process, parent_conn
+
+
+def _install_process(pkg, build_jobs, kwargs, conn):
+    """Run ``pkg.do_install(**kwargs)`` in a child process and send back
+    None, or the exception it raised."""
+    error = None
+    try:
+        spack.config.set('config:build_jobs', build_jobs,
+                         scope='command_line')
+        pkg.do_install(**kwargs)
+    except BaseException as e:
+        error = e
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            error = InstallProcessError(
+                'Failed to install %s' % pkg.name, str(e))
+    finally:
+        conn.send(error)
+        conn.close()
+
+
+class InstallProcessError(spack.error.SpackError):
+    """Raised when the process installing a package fails in a way that
+    cannot be passed back to Spack."""
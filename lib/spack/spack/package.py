@@ -47,8 +47,11 @@ import spack.url
 import spack.util.web
 import spack.multimethod
 import spack.binary_distribution as binary_distribution
+import spack.installer
+import spack.prefetch
 
 from llnl.util.filesystem import mkdirp, touch, chgrp
+from llnl.util.filesystem import write_file_listing, remove_file_listing
 from llnl.util.filesystem import working_dir, install_tree, install
 from llnl.util.lang import memoized
 from llnl.util.link_tree import LinkTree
@@ -1397,19 +1400,16 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
 
     def _update_explicit_entry_in_db(self, rec, explicit):
         if explicit and not rec.explicit:
-            with spack.store.db.write_transaction():
-                rec = spack.store.db.get_record(self.spec)
-                rec.explicit = True
-                message = '{s.name}@{s.version} : marking the package explicit'
-                tty.msg(message.format(s=self))
+            spack.store.db.update_explicit(self.spec, True)
+            message = '{s.name}@{s.version} : marking the package explicit'
+            tty.msg(message.format(s=self))
 
     def try_install_from_binary_cache(self, explicit):
         tty.msg('Searching for binary cache of %s' % self.name)
-        specs = binary_distribution.get_specs()
+        if not binary_distribution.binary_index.find(self.spec):
+            return False
         binary_spec = spack.spec.Spec.from_dict(self.spec.to_dict())
         binary_spec._mark_concrete()
-        if binary_spec not in specs:
-            return False
         tarball = binary_distribution.download_tarball(binary_spec)
         # see #10063 : install from source if tarball doesn't exist
         if tarball is None:
@@ -1526,22 +1526,34 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
 
         self._do_install_pop_kwargs(kwargs)
 
+        # Download the sources of the whole DAG before building any of it
+        if install_deps and not fake:
+            spack.prefetch.prefetch(
+                [self.spec], use_cache=kwargs.get('use_cache', True))
+
         # First, install dependencies recursively.
         if install_deps:
             tty.debug('Installing {0} dependencies'.format(self.name))
             dep_kwargs = kwargs.copy()
             dep_kwargs['explicit'] = False
             dep_kwargs['install_deps'] = False
-            for dep in self.spec.traverse(order='post', root=False):
-                if spack.config.get('config:install_missing_compilers', False):
-                    tty.debug('Bootstrapping {0} compiler for {1}'.format(
-                        self.spec.compiler, self.name
-                    ))
-                    comp_kwargs = kwargs.copy()
-                    comp_kwargs['explicit'] = False
-                    comp_kwargs['install_deps'] = True
-                    dep.package.bootstrap_compiler(**comp_kwargs)
-                dep.package.do_install(**dep_kwargs)
+            install_jobs = spack.config.get('config:install_jobs', 1)
+            if install_jobs > 1 and not spack.config.get(
+                    'config:install_missing_compilers', False):
+                spack.installer.install_dependencies(
+                    self, install_jobs, **dep_kwargs)
+            else:
+                for dep in self.spec.traverse(order='post', root=False):
+                    if spack.config.get(
+                            'config:install_missing_compilers', False):
+                        tty.debug('Bootstrapping {0} compiler for {1}'.format(
+                            self.spec.compiler, self.name
+                        ))
+                        comp_kwargs = kwargs.copy()
+                        comp_kwargs['explicit'] = False
+                        comp_kwargs['install_deps'] = True
+                        dep.package.bootstrap_compiler(**comp_kwargs)
+                    dep.package.do_install(**dep_kwargs)
 
         # Then, install the package proper
         tty.msg(colorize('@*{Installing} @*g{%s}' % self.name))
@@ -1630,6 +1642,10 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
                     echo = logger.echo
                     self.log()
 
+                # Save the list of installed files, so that finding
+                # libraries and headers does not walk the prefix
+                write_file_listing(self.prefix)
+
                 # Run post install hooks before build stage is removed.
                 spack.hooks.post_install(self.spec)
 
@@ -2106,6 +2122,8 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
         if not view:
             view = YamlFilesystemView(
                 self.extendee_spec.prefix, spack.store.layout)
+            # the files of the extendee change
+            remove_file_listing(self.extendee_spec.prefix)
 
         extensions_layout = view.extensions_layout
 
@@ -2165,6 +2183,7 @@ class PackageBase(with_metaclass(PackageMeta, PackageViewMixin, object)):
         if not view:
             view = YamlFilesystemView(
                 self.extendee_spec.prefix, spack.store.layout)
+            remove_file_listing(self.extendee_spec.prefix)
         extensions_layout = view.extensions_layout
 
         # Allow a force deactivate to happen.  This can unlink
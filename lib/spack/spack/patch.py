@@ -318,7 +318,15 @@ class PatchCache(object):
         patch_dict['sha256'] = sha256
         return from_dict(patch_dict)
 
-    def update_package(self, pkg_fullname):
+    def update_package(self, pkg_fullname, package_index=None):
+        """Replace the patches of a package in the index.
+
+        Arguments:
+            pkg_fullname (str): fully qualified name of the package
+            package_index (dict, optional): patches of the package, as
+                returned by ``index_package()``.  Computed by loading the
+                package if not provided.
+        """
         # remove this package from any patch entries that reference it.
         empty = []
         for sha256, package_to_patch in self.index.items():
@@ -338,9 +346,9 @@ class PatchCache(object):
             del self.index[sha256]
 
         # update the index with per-package patch indexes
-        pkg = spack.repo.get(pkg_fullname)
-        partial_index = self._index_patches(pkg)
-        for sha256, package_to_patch in partial_index.items():
+        if package_index is None:
+            package_index = self.index_package(pkg_fullname)
+        for sha256, package_to_patch in package_index.items():
             p2p = self.index.setdefault(sha256, {})
             p2p.update(package_to_patch)
 
@@ -350,6 +358,11 @@ class PatchCache(object):
             p2p = self.index.setdefault(sha256, {})
             p2p.update(package_to_patch)
 
+    @staticmethod
+    def index_package(pkg_fullname):
+        """Return the patch index entries for a single package."""
+        return PatchCache._index_patches(spack.repo.get(pkg_fullname))
+
     @staticmethod
     def _index_patches(pkg_class):
         index = {}
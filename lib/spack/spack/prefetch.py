@@ -0,0 +1,192 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Download the sources of many packages concurrently.
+
+Builds fetch their sources one package at a time, in the process forked
+for each build, so network waits add up with compile times. ``prefetch()``
+downloads the sources, resources and patches of all the packages that are
+going to be built ahead of the builds, with a bounded pool of processes
+and a limit on the concurrent downloads from each host. Sources end up in
+the stage of each package and in the fetch cache, where the builds find
+them.
+
+Processes are used rather than threads because fetch strategies change
+the working directory of the process while they run.
+"""
+import multiprocessing
+import os
+import time
+
+from six.moves import queue
+from six.moves.urllib.parse import urlparse
+
+import llnl.util.tty as tty
+
+import spack.binary_distribution
+import spack.config
+import spack.error
+import spack.repo
+from spack.spec import Spec
+
+
+class PrefetchResult(object):
+    """Outcome of the prefetch of the sources of one package."""
+
+    def __init__(self, name, host, nbytes=0, seconds=0.0, error=None):
+        self.name = name
+        self.host = host
+        self.nbytes = nbytes
+        self.seconds = seconds
+        self.error = error
+
+
+def prefetch(specs, use_cache=False, mirror_only=False):
+    """Fetch the sources of the packages in the DAGs of specs that are not
+    installed yet, concurrently.
+
+    Failures are reported but not raised: the build of the package will
+    fetch its sources again, and fail there if they cannot be fetched.
+
+    Arguments:
+        specs (list): concrete specs whose DAGs are fetched
+        use_cache (bool): skip packages available from a binary cache
+        mirror_only (bool): fetch only from mirrors
+
+    Returns:
+        (list): a ``PrefetchResult`` for each package that was fetched
+    """
+    jobs = spack.config.get('config:fetch_jobs', 4)
+    per_host = spack.config.get('config:fetch_jobs_per_host', 2)
+    # daemonic processes (e.g. builds) cannot start worker processes
+    if jobs <= 1 or multiprocessing.current_process().daemon:
+        return []
+
+    todo = _packages_to_fetch(specs, use_cache)
+    if len(todo) < 2:
+        # the build fetches a single package just as fast
+        return []
+
+    tty.msg('Fetching the sources of {0} packages with {1} processes'
+            .format(len(todo), min(jobs, len(todo))))
+    start = time.time()
+    results = _fetch_all(todo, min(jobs, len(todo)), per_host, mirror_only)
+
+    fetched = [r for r in results if not r.error]
+    for r in results:
+        if r.error:
+            tty.warn('Could not fetch the sources of %s: %s' %
+                     (r.name, r.error))
+    tty.msg('Fetched {0} of {1} packages ({2:.1f} MB) in {3:.2f}s'.format(
+        len(fetched), len(results),
+        sum(r.nbytes for r in fetched) / float(1 << 20),
+        time.time() - start))
+    for r in sorted(fetched, key=lambda r: -r.seconds):
+        tty.debug('{0}: {1} bytes from {2} in {3:.2f}s'.format(
+            r.name, r.nbytes, r.host, r.seconds))
+    return results
+
+
+def _packages_to_fetch(specs, use_cache):
+    """Return the packages in the DAGs of specs whose sources need to be
+    fetched, with the host each of them is fetched from."""
+    todo = []
+    visited = set()
+    checksum = spack.config.get('config:checksum')
+    for root in specs:
+        for spec in root.traverse():
+            if spec.dag_hash() in visited:
+                continue
+            visited.add(spec.dag_hash())
+
+            if spec.external or spec.virtual:
+                continue
+            pkg = spec.package
+            if pkg.installed or pkg.installed_upstream:
+                continue
+            # do_fetch() asks whether to fetch packages without a checksum
+            if checksum and pkg.version not in pkg.versions:
+                continue
+            if use_cache and spack.binary_distribution.binary_index.find(
+                    spec):
+                continue
+            try:
+                if pkg.stage.archive_file or pkg.stage.expanded:
+                    continue
+                host = _fetch_host(pkg)
+            except spack.error.SpackError as e:
+                tty.debug('Not prefetching %s: %s' % (spec.name, e))
+                continue
+            todo.append((host, spec))
+    return todo
+
+
+def _fetch_host(pkg):
+    """Host the sources of a package are downloaded from."""
+    url = getattr(pkg.fetcher[0], 'url', None) or ''
+    return urlparse(url).netloc or 'localhost'
+
+
+def _fetch_all(todo, jobs, per_host, mirror_only):
+    """Fetch the packages in todo with a pool of jobs processes, with at
+    most per_host of them downloading from the same host."""
+    pending = list(todo)
+    running = {}
+    done = queue.Queue()
+    results = []
+
+    pool = multiprocessing.Pool(processes=jobs)
+    try:
+        while pending or running:
+            # start as many fetches as the limits allow, in order
+            for item in list(pending):
+                host, spec = item
+                if sum(running.values()) >= jobs:
+                    break
+                if running.get(host, 0) >= per_host:
+                    continue
+                pending.remove(item)
+                running[host] = running.get(host, 0) + 1
+                pool.apply_async(
+                    _fetch_package,
+                    ((spec.name, spec.to_dict(), host, mirror_only),),
+                    callback=done.put)
+
+            result = done.get()
+            running[result.host] -= 1
+            if not running[result.host]:
+                del running[result.host]
+            results.append(result)
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def _fetch_package(args):
+    """Fetch the sources and patches of one package, in a worker process.
+
+    Errors are returned rather than raised, so the parent gets a result
+    for every package, even if the worker exits (e.g. with ``tty.die``)."""
+    name, spec_dict, host, mirror_only = args
+    start = time.time()
+    try:
+        tty.set_msg_enabled(False)
+        spec = Spec.from_dict(spec_dict)
+        spec._mark_concrete()
+        pkg = spack.repo.get(spec)
+        pkg.do_fetch(mirror_only)
+
+        stages = list(pkg.stage)
+        stages.extend(p.stage for p in spec.patches if hasattr(p, 'stage'))
+        nbytes = sum(os.path.getsize(os.path.realpath(s.archive_file))
+                     for s in stages if s.archive_file)
+    except BaseException as e:
+        error = str(e)
+        if isinstance(e, SystemExit):
+            error = 'exited with status %s' % e.code
+        return PrefetchResult(name, host, seconds=time.time() - start,
+                              error=error)
+    return PrefetchResult(name, host, nbytes, time.time() - start)
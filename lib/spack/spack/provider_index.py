@@ -169,17 +169,20 @@ class ProviderIndex(object):
 
         return all(c in result for c in common)
 
-    def to_json(self, stream=None):
+    def to_dict(self):
+        """Return a plain, serializable dictionary for this index."""
         provider_list = self._transform(
             lambda vpkg, pset: [
                 vpkg.to_node_dict(), [p.to_node_dict() for p in pset]], list)
 
-        sjson.dump({'provider_index': {'providers': provider_list}}, stream)
+        return {'provider_index': {'providers': provider_list}}
 
-    @staticmethod
-    def from_json(stream):
-        data = sjson.load(stream)
+    def to_json(self, stream=None):
+        sjson.dump(self.to_dict(), stream)
 
+    @staticmethod
+    def from_dict(data):
+        """Construct a ProviderIndex from the output of ``to_dict()``."""
         if not isinstance(data, dict):
             raise ProviderIndexError("JSON ProviderIndex data was not a dict.")
 
@@ -196,6 +199,10 @@ class ProviderIndex(object):
                 set(spack.spec.Spec.from_node_dict(p) for p in plist)))
         return index
 
+    @staticmethod
+    def from_json(stream):
+        return ProviderIndex.from_dict(sjson.load(stream))
+
     def merge(self, other):
         """Merge `other` ProviderIndex into this one."""
         other = other.copy()   # defensive copy.
@@ -4,16 +4,29 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 
+import mmap
+import multiprocessing
 import os
+import pickle
 import platform
 import re
+import shutil
+import tempfile
+from contextlib import closing
+
 import spack.repo
 import spack.cmd
 import llnl.util.lang
-import llnl.util.filesystem as fs
+import spack.util.elf
 from spack.util.executable import Executable, ProcessError
 import llnl.util.tty as tty
 
+#: Relocate files in parallel only if there are at least this many
+min_parallel_relocation_files = 32
+
+#: Text files are relocated in chunks of (at least) this many bytes
+text_chunk_size = 1 << 20
+
 
 class InstallRootStringException(spack.error.SpackError):
     """
@@ -51,19 +64,20 @@ def get_patchelf():
 
 def get_existing_elf_rpaths(path_name):
     """
-    Return the RPATHS returned by patchelf --print-rpath path_name
-    as a list of strings.
+    Return the RPATHS of path_name, as patchelf --print-rpath path_name
+    would, as a list of strings.
     """
     if platform.system() == 'Linux':
-        patchelf = Executable(get_patchelf())
         try:
-            output = patchelf('--print-rpath', '%s' %
-                              path_name, output=str, error=str)
-            return output.rstrip('\n').split(':')
-        except ProcessError as e:
-            tty.debug('patchelf --print-rpath produced an error on %s' %
-                      path_name, e)
+            elf = spack.util.elf.read_elf(path_name)
+        except (EnvironmentError, spack.util.elf.ElfParsingError) as e:
+            tty.debug('cannot read the RPATH of %s' % path_name, e)
+            return []
+        if elf is None:
+            tty.debug('cannot read the RPATH of %s: not an ELF file' %
+                      path_name)
             return []
+        return elf.rpaths or ['']
     else:
         tty.die('relocation not supported for this platform')
     return
@@ -247,10 +261,9 @@ def strings_contains_installroot(path_name, root_dir):
     """
     Check if the file contain the install root string.
     """
-    strings = Executable('strings')
-    output = strings('%s' % path_name,
-                     output=str, err=str)
-    return (root_dir in output or spack.paths.prefix in output)
+    return spack.util.elf.contains(path_name,
+                                   root_dir.encode('utf-8'),
+                                   spack.paths.prefix.encode('utf-8'))
 
 
 def modify_elf_object(path_name, new_rpaths):
@@ -258,6 +271,11 @@ def modify_elf_object(path_name, new_rpaths):
     Replace orig_rpath with new_rpath in RPATH of elf object path_name
     """
     if platform.system() == 'Linux':
+        # Overwrite the RPATH in place when it fits, which is the common
+        # case, and only call patchelf when the file needs to grow
+        if modify_elf_object_in_place(path_name, new_rpaths):
+            return
+
         new_joined = ':'.join(new_rpaths)
         patchelf = Executable(get_patchelf())
         try:
@@ -271,6 +289,19 @@ def modify_elf_object(path_name, new_rpaths):
         tty.die('relocation not supported for this platform')
 
 
+def modify_elf_object_in_place(path_name, new_rpaths):
+    """
+    Replace the RPATH of elf object path_name without patchelf, if it fits.
+    Return True if the RPATH was replaced.
+    """
+    try:
+        return spack.util.elf.set_rpath_in_place(path_name,
+                                                 ':'.join(new_rpaths))
+    except spack.util.elf.ElfParsingError as e:
+        tty.debug('cannot set the RPATH of %s in place' % path_name, e)
+        return False
+
+
 def needs_binary_relocation(m_type, m_subtype):
     """
     Check whether the given filetype is a binary that may need relocation.
@@ -295,23 +326,163 @@ def replace_prefix_bin(path_name, old_dir, new_dir):
     in binary files by replacing with null terminated string
     that is the same length unless the old path is shorter
     """
-
-    def replace(match):
-        occurances = match.group().count(old_dir)
-        padding = (len(old_dir) - len(new_dir)) * occurances
-        if padding < 0:
-            return data
-        return match.group().replace(old_dir, new_dir) + b'\0' * padding
+    old_dir, new_dir = _as_bytes(old_dir), _as_bytes(new_dir)
 
     with open(path_name, 'rb+') as f:
-        data = f.read()
-        f.seek(0)
-        original_data_len = len(data)
-        pat = re.compile(re.escape(old_dir) + b'([^\0]*?)\0')
-        data = pat.sub(replace, data)
-        assert(len(data) == original_data_len)
-        f.write(data)
-        f.truncate()
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+
+        # Map the file instead of reading it, and only touch the strings
+        # that contain the old prefix
+        with closing(mmap.mmap(f.fileno(), 0)) as data:
+            start = data.find(old_dir)
+            while start >= 0:
+                end = data.find(b'\0', start)
+                if end < 0:
+                    break
+                string = data[start:end]
+                new_string = string.replace(old_dir, new_dir)
+                if len(new_string) <= len(string):
+                    data[start:end] = new_string.ljust(len(string), b'\0')
+                start = data.find(old_dir, end)
+
+
+def _as_bytes(string):
+    if isinstance(string, bytes):
+        return string
+    return string.encode('utf-8')
+
+
+def _relocation_jobs(nfiles):
+    """Number of processes to use to relocate ``nfiles`` files."""
+    if nfiles < min_parallel_relocation_files:
+        return 1
+
+    # daemonic processes (e.g. builds) cannot start worker processes
+    if multiprocessing.current_process().daemon:
+        return 1
+
+    return min(multiprocessing.cpu_count(), nfiles)
+
+
+def _map_files(function, args):
+    """Return ``[function(a) for a in args]``, computed by a pool of
+    processes when there are many files to relocate."""
+    args = list(args)
+    jobs = _relocation_jobs(len(args))
+    if jobs <= 1:
+        return [function(a) for a in args]
+
+    pool = multiprocessing.Pool(processes=jobs)
+    try:
+        results = pool.map(_relocate_in_worker,
+                           [(function, a) for a in args],
+                           chunksize=max(1, len(args) // (4 * jobs)))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    for _, error in results:
+        if error is not None:
+            raise error
+    return [result for result, _ in results]
+
+
+def _relocate_in_worker(args):
+    """Call ``function(arg)`` in a worker process.
+
+    Returns a (result, error) tuple.  Errors are returned rather than
+    raised, as an error that ends a worker (e.g. ``SystemExit`` from
+    ``tty.die``) would never return from ``Pool.map``.
+    """
+    function, arg = args
+    try:
+        return function(arg), None
+    except BaseException as e:
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            e = spack.error.SpackError(
+                'Failed to relocate %s' % arg[0], str(e))
+        return None, e
+
+
+def _relocate_macho_binary(args):
+    """Relocate one Mach-O file, possibly in a worker process."""
+    path_name, old_dir, new_dir = args
+    placeholder = set_placeholder(old_dir)
+    (rpaths, deps, idpath) = macho_get_paths(path_name)
+    # one pass to replace placeholder
+    (n_rpaths,
+     n_deps,
+     n_idpath) = macho_replace_paths(placeholder,
+                                     new_dir,
+                                     rpaths,
+                                     deps,
+                                     idpath)
+    # another pass to replace old_dir
+    (new_rpaths,
+     new_deps,
+     new_idpath) = macho_replace_paths(old_dir,
+                                       new_dir,
+                                       n_rpaths,
+                                       n_deps,
+                                       n_idpath)
+    modify_macho_object(path_name,
+                        rpaths, deps, idpath,
+                        new_rpaths, new_deps, new_idpath)
+    replace_prefix_bin(path_name, old_dir, new_dir)
+
+
+def _relocate_elf_binary(args):
+    """Relocate one ELF file, possibly in a worker process.
+
+    Returns None when done, or the new RPATHs if the file has to be
+    modified with patchelf.  This is left to the parent process, which
+    may need to install patchelf first.
+    """
+    path_name, old_dir, new_dir = args
+    placeholder = set_placeholder(old_dir)
+    orig_rpaths = get_existing_elf_rpaths(path_name)
+    if not orig_rpaths:
+        return None
+
+    # one pass to replace placeholder
+    n_rpaths = substitute_rpath(orig_rpaths, placeholder, new_dir)
+    # one pass to replace old_dir
+    new_rpaths = substitute_rpath(n_rpaths, old_dir, new_dir)
+    if not modify_elf_object_in_place(path_name, new_rpaths):
+        return new_rpaths
+
+    replace_prefix_bin(path_name, old_dir, new_dir)
+    return None
+
+
+def _relocate_text_file(args):
+    """Apply (old, new) ``replacements`` to one text file, possibly in a
+    worker process."""
+    path_name, replacements = args
+    if not spack.util.elf.contains(path_name, *[o for o, _ in replacements]):
+        return
+
+    # Stream the file to a temporary copy, which is then written back into
+    # the file, so that its inode, hardlinks, owner and ACLs are kept.
+    # Chunks end at a newline, as the strings to be replaced never span
+    # lines.
+    with tempfile.TemporaryFile() as tmp:
+        with open(path_name, 'rb+') as f:
+            chunk = f.read(text_chunk_size)
+            while chunk:
+                chunk += f.readline()
+                for old, new in replacements:
+                    chunk = chunk.replace(old, new)
+                tmp.write(chunk)
+                chunk = f.read(text_chunk_size)
+
+            tmp.seek(0)
+            f.seek(0)
+            shutil.copyfileobj(tmp, f, text_chunk_size)
+            f.truncate()
 
 
 def relocate_binary(path_names, old_dir, new_dir, allow_root):
@@ -319,41 +490,15 @@ def relocate_binary(path_names, old_dir, new_dir, allow_root):
     Change old_dir to new_dir in RPATHs of elf or mach-o files
     Account for the case where old_dir is now a placeholder
     """
-    placeholder = set_placeholder(old_dir)
+    path_names = list(path_names)
+    args = [(path_name, old_dir, new_dir) for path_name in path_names]
     if platform.system() == 'Darwin':
-        for path_name in path_names:
-            (rpaths, deps, idpath) = macho_get_paths(path_name)
-            # one pass to replace placeholder
-            (n_rpaths,
-             n_deps,
-             n_idpath) = macho_replace_paths(placeholder,
-                                             new_dir,
-                                             rpaths,
-                                             deps,
-                                             idpath)
-            # another pass to replace old_dir
-            (new_rpaths,
-             new_deps,
-             new_idpath) = macho_replace_paths(old_dir,
-                                               new_dir,
-                                               n_rpaths,
-                                               n_deps,
-                                               n_idpath)
-            modify_macho_object(path_name,
-                                rpaths, deps, idpath,
-                                new_rpaths, new_deps, new_idpath)
-            replace_prefix_bin(path_name, old_dir, new_dir)
+        _map_files(_relocate_macho_binary, args)
 
     elif platform.system() == 'Linux':
-        for path_name in path_names:
-            orig_rpaths = get_existing_elf_rpaths(path_name)
-            if orig_rpaths:
-                # one pass to replace placeholder
-                n_rpaths = substitute_rpath(orig_rpaths,
-                                            placeholder, new_dir)
-                # one pass to replace old_dir
-                new_rpaths = substitute_rpath(n_rpaths,
-                                              old_dir, new_dir)
+        results = _map_files(_relocate_elf_binary, args)
+        for path_name, new_rpaths in zip(path_names, results):
+            if new_rpaths is not None:
                 modify_elf_object(path_name, new_rpaths)
                 replace_prefix_bin(path_name, old_dir, new_dir)
     else:
@@ -366,12 +511,19 @@ def make_link_relative(cur_path_names, orig_path_names):
     """
     for cur_path, orig_path in zip(cur_path_names, orig_path_names):
         old_src = os.readlink(orig_path)
-        new_src = os.path.relpath(old_src, orig_path)
+        new_src = relative_link_target(old_src, orig_path)
 
         os.unlink(cur_path)
         os.symlink(new_src, cur_path)
 
 
+def relative_link_target(link_target, orig_path):
+    """
+    Return the relative version of absolute link_target for orig_path.
+    """
+    return os.path.relpath(link_target, orig_path)
+
+
 def make_binary_relative(cur_path_names, orig_path_names, old_dir, allow_root):
     """
     Replace old RPATHs with paths relative to old_dir in binary files
@@ -430,17 +582,25 @@ def make_link_placeholder(cur_path_names, cur_dir, old_dir):
     Links in ``cur_path_names`` must link to absolute paths.
     """
     for cur_path in cur_path_names:
-        placeholder = set_placeholder(spack.store.layout.root)
-        placeholder_prefix = old_dir.replace(spack.store.layout.root,
-                                             placeholder)
         cur_src = os.readlink(cur_path)
-        rel_src = os.path.relpath(cur_src, cur_dir)
-        new_src = os.path.join(placeholder_prefix, rel_src)
+        new_src = placeholder_link_target(cur_src, cur_dir, old_dir)
 
         os.unlink(cur_path)
         os.symlink(new_src, cur_path)
 
 
+def placeholder_link_target(link_target, cur_dir, old_dir):
+    """
+    Return link_target, an absolute path in cur_dir, as a path in old_dir
+    with the install root replaced by a placeholder.
+    """
+    placeholder = set_placeholder(spack.store.layout.root)
+    placeholder_prefix = old_dir.replace(spack.store.layout.root,
+                                         placeholder)
+    rel_src = os.path.relpath(link_target, cur_dir)
+    return os.path.join(placeholder_prefix, rel_src)
+
+
 def relocate_links(path_names, old_dir, new_dir):
     """
     Replace old path with new path in link sources.
@@ -462,14 +622,12 @@ def relocate_text(path_names, oldpath, newpath, oldprefix, newprefix):
     """
     Replace old path with new path in text file path_name
     """
-    fs.filter_file('%s' % oldpath, '%s' % newpath, *path_names,
-                   backup=False, string=True)
     sbangre = '#!/bin/bash %s/bin/sbang' % oldprefix
     sbangnew = '#!/bin/bash %s/bin/sbang' % newprefix
-    fs.filter_file(sbangre, sbangnew, *path_names,
-                   backup=False, string=True)
-    fs.filter_file(oldprefix, newprefix, *path_names,
-                   backup=False, string=True)
+    replacements = [(_as_bytes(old), _as_bytes(new)) for old, new in (
+        (oldpath, newpath), (sbangre, sbangnew), (oldprefix, newprefix))]
+    _map_files(_relocate_text_file,
+               [(path_name, replacements) for path_name in path_names])
 
 
 def substitute_rpath(orig_rpath, topdir, new_root_path):
@@ -541,41 +699,33 @@ def file_is_relocatable(file):
     if not os.path.isabs(file):
         raise ValueError('{0} is not an absolute path'.format(file))
 
-    strings = Executable('strings')
-    patchelf = Executable(get_patchelf())
-
-    # Remove the RPATHS from the strings in the executable
-    set_of_strings = set(strings(file, output=str).split())
-
     m_type, m_subtype = mime_type(file)
     if m_type == 'application':
         tty.debug('{0},{1}'.format(m_type, m_subtype))
 
+    # The RPATHS are allowed to contain the install root
+    allowed_strings = set()
     if platform.system().lower() == 'linux':
         if m_subtype == 'x-executable' or m_subtype == 'x-sharedlib':
-            rpaths = patchelf('--print-rpath', file, output=str).strip()
-            set_of_strings.discard(rpaths.strip())
+            allowed_strings.add(':'.join(get_existing_elf_rpaths(file)))
     if platform.system().lower() == 'darwin':
         if m_subtype == 'x-mach-binary':
             rpaths, deps, idpath = macho_get_paths(file)
-            set_of_strings.discard(set(rpaths))
-            set_of_strings.discard(set(deps))
+            allowed_strings.update(rpaths)
+            allowed_strings.update(deps)
             if idpath is not None:
-                set_of_strings.discard(idpath)
-
-    if any(spack.store.layout.root in x for x in set_of_strings):
-        # One binary has the root folder not in the RPATH,
-        # meaning that this spec is not relocatable
-        msg = 'Found "{0}" in {1} strings'
-        tty.debug(msg.format(spack.store.layout.root, file))
-        return False
-
-    if any(spack.paths.prefix in x for x in set_of_strings):
-        # One binary has the root folder not in the RPATH,
-        # meaning that this spec is not relocatable
-        msg = 'Found "{0}" in {1} strings'
-        tty.debug(msg.format(spack.paths.prefix, file))
-        return False
+                allowed_strings.add(idpath)
+
+    with spack.util.elf.mapped(file) as data:
+        for root in (spack.store.layout.root, spack.paths.prefix):
+            for _, string in spack.util.elf.find_strings(
+                    data, root.encode('utf-8')):
+                if string.decode('utf-8') not in allowed_strings:
+                    # One binary has the root folder not in the RPATH,
+                    # meaning that this spec is not relocatable
+                    msg = 'Found "{0}" in {1} strings'
+                    tty.debug(msg.format(root, file))
+                    return False
 
     return True
 
@@ -610,9 +760,6 @@ def mime_type(file):
     Returns:
         Tuple containing the MIME type and subtype
     """
-    file_cmd = Executable('file')
-    output = file_cmd('-b', '-h', '--mime-type', file, output=str, error=str)
-    tty.debug('[MIME_TYPE] {0} -> {1}'.format(file, output.strip()))
-    if '/' not in output:
-        output += '/'
-    return tuple(output.strip().split('/'))
+    m_type, m_subtype = spack.util.elf.file_type(file)
+    tty.debug('[MIME_TYPE] {0} -> {1}/{2}'.format(file, m_type, m_subtype))
+    return m_type, m_subtype
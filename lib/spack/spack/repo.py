@@ -8,15 +8,20 @@ import collections
 import contextlib
 import errno
 import functools
+import hashlib
 import inspect
+import mmap
+import multiprocessing
 import os
+import pickle
 import re
 import shutil
 import stat
+import struct
 import sys
 import traceback
 
-from six import string_types, add_metaclass
+from six import string_types, add_metaclass, StringIO
 
 try:
     from collections.abc import Mapping
@@ -62,6 +67,15 @@ repo_index_name    = 'index.yaml'  # Top-level filename for repository index.
 packages_dir_name  = 'packages'    # Top-level repo directory containing pkgs.
 package_file_name  = 'package.py'  # Filename for packages in a repository.
 
+#: Version of the format of the file caching the indexes of a repository.
+#: Bump it whenever the layout of that file or the format of one of the
+#: indexes changes, so that older caches are regenerated.
+repo_index_format_version = 1
+
+#: Fewest packages that need reindexing for it to be done in parallel.
+#: Below this, starting worker processes costs more than it saves.
+min_parallel_index_packages = 64
+
 #: Guaranteed unused default value for some functions.
 NOT_PROVIDED = object()
 
@@ -113,59 +127,142 @@ class SpackNamespace(ModuleType):
 
 
 class FastPackageChecker(Mapping):
-    """Cache that maps package names to the stats obtained on the
+    """Cache that maps package names to the modification times of the
     'package.py' files associated with them.
 
     For each repository a cache is maintained at class level, and shared among
     all instances referring to it. Update of the global cache is done lazily
     during instance initialization.
+
+    The modification times are also persisted in the ``misc_cache``, along
+    with the modification time of each package directory.  A package file
+    is only stat'ed again when its directory has changed, and the listing
+    of the repository is only read again when the repository directory
+    itself has changed.  Directory stats are served by the metadata server
+    alone on parallel filesystems like Lustre, so this is much cheaper than
+    stat'ing every ``package.py``.  Note that editing a ``package.py`` in
+    place does not change the mtime of its directory (whereas a git
+    checkout or an editor that saves by renaming does); run ``spack clean
+    -m`` if such an edit is not picked up.
     """
     #: Global cache, reused by every instance
     _paths_cache = {}
 
+    #: Latest package file mtime of each repository in the global cache
+    _last_mtimes = {}
+
     def __init__(self, packages_path):
         # The path of the repository managed by this instance
         self.packages_path = packages_path
 
         # If the cache we need is not there yet, then build it appropriately
         if packages_path not in self._paths_cache:
-            self._paths_cache[packages_path] = self._create_new_cache()
+            cache = self._create_new_cache()
+            self._paths_cache[packages_path] = cache
+            self._last_mtimes[packages_path] = max(cache.values() or [0])
 
         #: Reference to the appropriate entry in the global cache
-        self._packages_to_stats = self._paths_cache[packages_path]
+        self._packages_to_mtimes = self._paths_cache[packages_path]
+
+    @property
+    def _stats_cache_key(self):
+        """Key of the persisted stats for this repository in misc_cache."""
+        path_hash = hashlib.sha1(self.packages_path.encode('utf-8'))
+        return 'package-stats/{0}.json'.format(path_hash.hexdigest())
+
+    def _read_persisted_stats(self):
+        """Read the stats persisted by a previous run, if there are any.
+
+        Returns:
+            (dict): with the mtime of the packages directory under
+                ``'mtime'`` and, under ``'packages'``, a mapping from package
+                names to ``[directory mtime, package file mtime]``
+        """
+        misc_cache = spack.caches.misc_cache
+        key = self._stats_cache_key
+        try:
+            if not misc_cache.init_entry(key):
+                return {}
+            with misc_cache.read_transaction(key) as f:
+                stats = sjson.load(f)
+            if stats.get('path') != self.packages_path:
+                return {}
+            return stats
+        except Exception as e:
+            tty.debug('Ignoring package stats in misc cache: {0}'.format(e))
+            return {}
+
+    def _persist_stats(self, stats):
+        misc_cache = spack.caches.misc_cache
+        key = self._stats_cache_key
+        try:
+            misc_cache.init_entry(key)
+            with misc_cache.write_transaction(key) as (old, new):
+                sjson.dump(stats, new)
+        except Exception as e:
+            tty.debug('Could not persist package stats: {0}'.format(e))
+
+    def _list_packages(self):
+        """Names of the valid package directories in the repository."""
+        names = []
+        for pkg_name in os.listdir(self.packages_path):
+            # Warn about invalid names that look like packages.
+            if not valid_module_name(pkg_name):
+                pkg_dir = os.path.join(self.packages_path, pkg_name)
+                msg = 'Skipping package at {0}. '
+                msg += '"{1}" is not a valid Spack module name.'
+                tty.warn(msg.format(pkg_dir, pkg_name))
+                continue
+            names.append(pkg_name)
+        return names
 
     def _create_new_cache(self):
         """Create a new cache for packages in a repo.
 
         The implementation here should try to minimize filesystem
         calls.  At the moment, it is O(number of packages) and makes
-        about one stat call per package.  This is reasonably fast, and
-        avoids actually importing packages in Spack, which is slow.
+        about one stat call per package directory, plus one per package
+        file that changed since the stats were last persisted.  This is
+        reasonably fast, and avoids actually importing packages in Spack,
+        which is slow.
         """
+        persisted = self._read_persisted_stats()
+        old_packages = persisted.get('packages', {})
+
+        # Only list the repository if packages were added or removed
+        repo_mtime = os.stat(self.packages_path).st_mtime
+        if persisted and persisted.get('mtime') == repo_mtime:
+            pkg_names = list(old_packages)
+        else:
+            pkg_names = self._list_packages()
+
         # Create a dictionary that will store the mapping between a
-        # package name and its stat info
+        # package name and the mtime of its package file
         cache = {}
-        for pkg_name in os.listdir(self.packages_path):
-            # Skip non-directories in the package root.
+        packages = {}
+        for pkg_name in pkg_names:
             pkg_dir = os.path.join(self.packages_path, pkg_name)
 
-            # Warn about invalid names that look like packages.
-            if not valid_module_name(pkg_name):
-                msg = 'Skipping package at {0}. '
-                msg += '"{1}" is not a valid Spack module name.'
-                tty.warn(msg.format(pkg_dir, pkg_name))
+            # Use stat here to avoid lots of calls to the filesystem.
+            try:
+                dir_mtime = os.stat(pkg_dir).st_mtime
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    continue
+                raise e
+
+            old = old_packages.get(pkg_name)
+            if old and old[0] == dir_mtime:
+                packages[pkg_name] = old
+                cache[pkg_name] = old[1]
                 continue
 
             # Construct the file name from the directory
-            pkg_file = os.path.join(
-                self.packages_path, pkg_name, package_file_name
-            )
-
-            # Use stat here to avoid lots of calls to the filesystem.
+            pkg_file = os.path.join(pkg_dir, package_file_name)
             try:
                 sinfo = os.stat(pkg_file)
             except OSError as e:
-                if e.errno == errno.ENOENT:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
                     # No package.py file here.
                     continue
                 elif e.errno == errno.EACCES:
@@ -177,24 +274,32 @@ class FastPackageChecker(Mapping):
             if stat.S_ISDIR(sinfo.st_mode):
                 continue
 
-            # If it is a file, then save the stats under the
+            # If it is a file, then save its mtime under the
             # appropriate key
-            cache[pkg_name] = sinfo
+            packages[pkg_name] = [dir_mtime, sinfo.st_mtime]
+            cache[pkg_name] = sinfo.st_mtime
+
+        if packages != old_packages or persisted.get('mtime') != repo_mtime:
+            self._persist_stats({
+                'path': self.packages_path,
+                'mtime': repo_mtime,
+                'packages': packages
+            })
 
         return cache
 
     def last_mtime(self):
-        return max(
-            sinfo.st_mtime for sinfo in self._packages_to_stats.values())
+        """Time of the most recent change to a package file."""
+        return self._last_mtimes[self.packages_path]
 
     def __getitem__(self, item):
-        return self._packages_to_stats[item]
+        return self._packages_to_mtimes[item]
 
     def __iter__(self):
-        return iter(self._packages_to_stats)
+        return iter(self._packages_to_mtimes)
 
     def __len__(self):
-        return len(self._packages_to_stats)
+        return len(self._packages_to_mtimes)
 
 
 class TagIndex(Mapping):
@@ -226,23 +331,32 @@ class TagIndex(Mapping):
     def __len__(self):
         return len(self._tag_dict)
 
-    def update_package(self, pkg_name):
+    @staticmethod
+    def package_tags(pkg_name):
+        """Returns the short name of a package and the list of its tags."""
+        package = path.get(pkg_name)
+        return package.name, list(getattr(package, 'tags', []))
+
+    def update_package(self, pkg_name, package_tags=None):
         """Updates a package in the tag index.
 
         Args:
-            pkg_name (str): name of the package to be removed from the index
+            pkg_name (str): name of the package to be updated in the index
+            package_tags (tuple, optional): name and tags of the package,
+                as returned by ``package_tags()``.  Computed by loading the
+                package if not provided.
 
         """
-        package = path.get(pkg_name)
+        name, tags = package_tags or self.package_tags(pkg_name)
 
         # Remove the package from the list of packages, if present
         for pkg_list in self._tag_dict.values():
-            if pkg_name in pkg_list:
-                pkg_list.remove(pkg_name)
+            if name in pkg_list:
+                pkg_list.remove(name)
 
         # Add it again under the appropriate tags
-        for tag in getattr(package, 'tags', []):
-            self._tag_dict[tag].append(package.name)
+        for tag in tags:
+            self._tag_dict[tag].append(name)
 
 
 @add_metaclass(abc.ABCMeta)
@@ -276,9 +390,23 @@ class Indexer(object):
     def read(self, stream):
         """Read this index from a provided file object."""
 
-    @abc.abstractmethod
     def update(self, pkg_fullname):
         """Update the index in memory with information about a package."""
+        self.merge(pkg_fullname, self.package_entry(pkg_fullname))
+
+    @abc.abstractmethod
+    def package_entry(self, pkg_fullname):
+        """Compute the information this index holds about a package.
+
+        This is where packages get loaded.  It may run in a worker process
+        with a fresh indexer, so it must not use ``self.index``, and the
+        result must be picklable.
+        """
+
+    @abc.abstractmethod
+    def merge(self, pkg_fullname, entry):
+        """Replace what the index holds about a package with ``entry``,
+        the result of ``package_entry()``."""
 
     @abc.abstractmethod
     def write(self, stream):
@@ -293,8 +421,11 @@ class TagIndexer(Indexer):
     def read(self, stream):
         self.index = TagIndex.from_json(stream)
 
-    def update(self, pkg_fullname):
-        self.index.update_package(pkg_fullname)
+    def package_entry(self, pkg_fullname):
+        return TagIndex.package_tags(pkg_fullname)
+
+    def merge(self, pkg_fullname, entry):
+        self.index.update_package(pkg_fullname, entry)
 
     def write(self, stream):
         self.index.to_json(stream)
@@ -308,9 +439,14 @@ class ProviderIndexer(Indexer):
     def read(self, stream):
         self.index = ProviderIndex.from_json(stream)
 
-    def update(self, pkg_fullname):
+    def package_entry(self, pkg_fullname):
+        package_index = ProviderIndex()
+        package_index.update(pkg_fullname)
+        return package_index.to_dict()
+
+    def merge(self, pkg_fullname, entry):
         self.index.remove_provider(pkg_fullname)
-        self.index.update(pkg_fullname)
+        self.index.merge(ProviderIndex.from_dict(entry))
 
     def write(self, stream):
         self.index.to_json(stream)
@@ -334,8 +470,102 @@ class PatchIndexer(Indexer):
     def write(self, stream):
         self.index.to_json(stream)
 
-    def update(self, pkg_fullname):
-        self.index.update_package(pkg_fullname)
+    def package_entry(self, pkg_fullname):
+        return spack.patch.PatchCache.index_package(pkg_fullname)
+
+    def merge(self, pkg_fullname, entry):
+        self.index.update_package(pkg_fullname, entry)
+
+
+class RepoIndexFile(object):
+    """Reader and writer for the file in which a ``RepoIndex`` caches
+    all of its indexes.
+
+    The file starts with a fixed-size header holding magic bytes, the
+    format version and the length of a JSON table of contents.  The table
+    maps the name of each index to the offset and length of its section,
+    and the sections follow it.  Each section holds what the index's
+    ``Indexer`` writes.
+
+    The file is memory-mapped when it is read, and sections are only
+    decoded when their index is used, so reading one index does not
+    touch the pages holding the others.
+    """
+
+    #: Magic bytes that start a repository index file
+    magic = b'SPKRIDX\0'
+
+    #: Header of the file: magic, format version, table of contents length
+    header = struct.Struct('<8sII')
+
+    def __init__(self, stream):
+        """Map the index file open in ``stream`` in memory.
+
+        Raises:
+            RepoIndexFileError: if the file is not a valid repository
+                index of the current format version
+        """
+        fileno = stream.fileno()
+        size = os.fstat(fileno).st_size
+        if size < self.header.size:
+            raise RepoIndexFileError('file is truncated')
+
+        self._buffer = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+        magic, version, toc_size = self.header.unpack_from(self._buffer, 0)
+        if magic != self.magic:
+            raise RepoIndexFileError('not a repository index')
+        if version != repo_index_format_version:
+            raise RepoIndexFileError(
+                'format version {0} is not {1}'.format(
+                    version, repo_index_format_version))
+
+        toc_start = self.header.size
+        data_start = toc_start + toc_size
+        try:
+            toc = sjson.load(
+                self._buffer[toc_start:data_start].decode('utf-8'))
+        except ValueError as e:
+            raise RepoIndexFileError(str(e))
+
+        #: Maps index names to the (start, end) of their section
+        self.sections = {}
+        for name, (offset, length) in toc.items():
+            start = data_start + offset
+            if start + length > size:
+                raise RepoIndexFileError('section %s is truncated' % name)
+            self.sections[name] = (start, start + length)
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def read(self, name, indexer):
+        """Decode the section of the index ``name`` with ``indexer``."""
+        start, end = self.sections[name]
+        indexer.read(StringIO(self._buffer[start:end].decode('utf-8')))
+
+    @classmethod
+    def write(cls, stream, indexers):
+        """Write the indexes of ``indexers``, a dict of Indexers by name,
+        to the binary file object ``stream``."""
+        toc = {}
+        sections = []
+        offset = 0
+        for name in sorted(indexers):
+            section = StringIO()
+            indexers[name].write(section)
+            data = section.getvalue().encode('utf-8')
+
+            toc[name] = [offset, len(data)]
+            sections.append(data)
+            offset += len(data)
+
+        toc_data = sjson.dump(toc).encode('utf-8')
+        stream.write(cls.header.pack(
+            cls.magic, repo_index_format_version, len(toc_data)))
+        stream.write(toc_data)
+        for data in sections:
+            stream.write(data)
 
 
 class RepoIndex(object):
@@ -350,6 +580,10 @@ class RepoIndex(object):
     defined by ``Indexer``, so that the ``RepoIndex`` can read, generate,
     and update stored indices.
 
+    All the indexes of a repository are cached together in a single
+    ``RepoIndexFile``, and each of them is only read from it the first
+    time it is accessed.
+
     Generated indexes are accessed by name via ``__getitem__()``.
 
     """
@@ -361,6 +595,9 @@ class RepoIndex(object):
         self.indexers = {}
         self.indexes = {}
 
+        #: Up-to-date cached indexes, not read yet
+        self._index_file = None
+
     def add_indexer(self, name, indexer):
         """Add an indexer to the repo index.
 
@@ -380,7 +617,12 @@ class RepoIndex(object):
             raise KeyError('no such index: %s' % name)
 
         if name not in self.indexes:
-            self._build_all_indexes()
+            if self._index_file is None or name not in self._index_file:
+                self._build_all_indexes()
+
+            if name not in self.indexes:
+                self._index_file.read(name, indexer)
+                self.indexes[name] = indexer.index
 
         return self.indexes[name]
 
@@ -391,47 +633,183 @@ class RepoIndex(object):
         because the main bottleneck here is loading all the packages.  It
         can take tens of seconds to regenerate sequentially, and we'd
         rather only pay that cost once rather than on several
-        invocations.
+        invocations.  Packages are loaded once for all indexes, in
+        parallel worker processes if there are enough of them (see
+        ``config:repo_index_jobs``).
+
+        If the cached indexes are up to date, they are left to be read
+        lazily by ``__getitem__()``.
 
         """
-        for name, indexer in self.indexers.items():
-            self.indexes[name] = self._build_index(name, indexer)
+        cache_filename = self._cache_filename()
+        misc_cache = spack.caches.misc_cache
+
+        index_file = None
+        if misc_cache.init_entry(cache_filename):
+            with misc_cache.read_transaction(cache_filename, True) as f:
+                index_file = self._open_index_file(f)
+
+        needs_update = self._needs_update(index_file)
+        if index_file is not None and not any(needs_update.values()):
+            self._index_file = index_file
+            return
+
+        # Load packages before taking the lock, as it's the slow part
+        entries = self._package_entries(needs_update)
+
+        with misc_cache.write_transaction(cache_filename, True) as (old, new):
+            # Another process may have rewritten the index meanwhile
+            index_file = self._open_index_file(old) if old else None
+            needs_update = self._needs_update(index_file)
+            entries.update(self._package_entries(dict(
+                (name, [x for x in pkg_list if (name, x) not in entries])
+                for name, pkg_list in needs_update.items())))
 
-    def _build_index(self, name, indexer):
-        """Determine which packages need an update, and update indexes."""
+            for name, indexer in self.indexers.items():
+                self.indexes[name] = self._build_index(
+                    name, indexer, index_file, needs_update[name], entries)
 
-        # Filename of the provider index cache (we assume they're all json)
-        cache_filename = '{0}/{1}-index.json'.format(name, self.namespace)
+            RepoIndexFile.write(new, self.indexers)
 
-        # Compute which packages needs to be updated in the cache
+        self._index_file = None
+
+    def _cache_filename(self):
+        # Filename of the cache holding all the indexes
+        return 'indexes/{0}-index.bin'.format(self.namespace)
+
+    def _open_index_file(self, stream):
+        """Open a cached index file, or return None if it is unusable."""
+        try:
+            return RepoIndexFile(stream)
+        except RepoIndexFileError as e:
+            tty.debug('Regenerating index of {0}: {1}'.format(
+                self.namespace, e.message))
+            return None
+
+    def _needs_update(self, index_file):
+        """Names of the packages changed since each index was cached.
+
+        Returns:
+            (dict): maps the name of each index to the list of packages
+                that need updating in it
+        """
         misc_cache = spack.caches.misc_cache
-        index_mtime = misc_cache.mtime(cache_filename)
+        index_mtime = misc_cache.mtime(self._cache_filename())
 
-        needs_update = [
-            x for x, sinfo in self.checker.items()
-            if sinfo.st_mtime > index_mtime
+        changed = [
+            x for x, mtime in self.checker.items()
+            if mtime > index_mtime
         ]
+        return dict(
+            (name, changed if index_file and name in index_file
+             else list(self.checker))
+            for name in self.indexers)
 
-        index_existed = misc_cache.init_entry(cache_filename)
-        if index_existed and not needs_update:
-            # If the index exists and doesn't need an update, read it
-            with misc_cache.read_transaction(cache_filename) as f:
-                indexer.read(f)
+    def _package_entries(self, needs_update):
+        """Load packages and compute what they contribute to each index.
 
-        else:
-            # Otherwise update it and rewrite the cache file
-            with misc_cache.write_transaction(cache_filename) as (old, new):
-                indexer.read(old) if old else indexer.create()
+        Arguments:
+            needs_update (dict): maps index names to the names of the
+                packages that need updating in that index
 
-                for pkg_name in needs_update:
-                    namespaced_name = '%s.%s' % (self.namespace, pkg_name)
-                    indexer.update(namespaced_name)
+        Returns:
+            (dict): maps (index name, package name) to the package's
+                ``Indexer.package_entry()`` for that index
+        """
+        # Load each package once for all the indexes that need it
+        pkg_names = []
+        pkg_indexers = {}
+        for name, pkg_list in needs_update.items():
+            for pkg_name in pkg_list:
+                if pkg_name not in pkg_indexers:
+                    pkg_names.append(pkg_name)
+                    pkg_indexers[pkg_name] = []
+                pkg_indexers[pkg_name].append(
+                    (name, type(self.indexers[name])))
+
+        args = [('%s.%s' % (self.namespace, pkg_name), pkg_indexers[pkg_name])
+                for pkg_name in pkg_names]
+
+        jobs = _repo_index_jobs(len(args))
+        if jobs > 1:
+            tty.debug('Indexing {0} packages in {1} with {2} processes'
+                      .format(len(args), self.namespace, jobs))
+            pool = multiprocessing.Pool(processes=jobs)
+            try:
+                results = pool.map(_package_index_entries, args,
+                                   chunksize=max(1, len(args) // (4 * jobs)))
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            results = [_package_index_entries(a) for a in args]
+
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        entries = {}
+        for pkg_name, result in zip(pkg_names, results):
+            for name, entry in result.items():
+                entries[(name, pkg_name)] = entry
+        return entries
+
+    def _build_index(self, name, indexer, index_file, needs_update, entries):
+        """Update an index with the packages that changed since it was
+        cached in ``index_file``, or create it from scratch."""
+        if index_file and name in index_file:
+            index_file.read(name, indexer)
+        else:
+            indexer.create()
 
-                indexer.write(new)
+        for pkg_name in needs_update:
+            namespaced_name = '%s.%s' % (self.namespace, pkg_name)
+            indexer.merge(namespaced_name, entries[(name, pkg_name)])
 
         return indexer.index
 
 
+def _repo_index_jobs(npackages):
+    """Number of processes to use to index ``npackages`` packages."""
+    if npackages < min_parallel_index_packages:
+        return 1
+
+    # daemonic processes (e.g. builds) cannot start worker processes
+    if multiprocessing.current_process().daemon:
+        return 1
+
+    jobs = spack.config.get('config:repo_index_jobs')
+    if not jobs:
+        jobs = min(16, multiprocessing.cpu_count())
+    return min(jobs, npackages)
+
+
+def _package_index_entries(args):
+    """Compute the index entries of one package, possibly in a worker.
+
+    Arguments:
+        args (tuple): fully qualified package name, and a list of
+            (index name, indexer class) for the indexes to compute
+
+    Returns:
+        (dict): maps index names to the package's entry in that index, or
+            the exception raised while loading the package.  Errors are
+            returned rather than raised, as an error that ends a worker
+            (e.g. ``SystemExit`` from ``tty.die``) would never return from
+            ``Pool.map``.
+    """
+    pkg_fullname, indexers = args
+    try:
+        return dict((name, indexer_cls().package_entry(pkg_fullname))
+                    for name, indexer_cls in indexers)
+    except BaseException as e:
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            return RepoError('Failed to index %s' % pkg_fullname, str(e))
+        return e
+
+
 class RepoPath(object):
     """A RepoPath is a list of repos that function as one.
 
@@ -1273,6 +1651,10 @@ class IndexError(RepoError):
     """Raised when there's an error with an index."""
 
 
+class RepoIndexFileError(IndexError):
+    """Raised when a cached repository index file can't be used."""
+
+
 class UnknownPackageError(UnknownEntityError):
     """Raised when we encounter a package spack doesn't have."""
 
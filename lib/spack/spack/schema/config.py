@@ -52,8 +52,24 @@ properties = {
             'dirty': {'type': 'boolean'},
             'build_language': {'type': 'string'},
             'build_jobs': {'type': 'integer', 'minimum': 1},
+            'repo_index_jobs': {'type': 'integer', 'minimum': 1},
+            'install_jobs': {'type': 'integer', 'minimum': 1},
+            'concretize_jobs': {'type': 'integer', 'minimum': 1},
+            'fetch_jobs': {'type': 'integer', 'minimum': 1},
+            'fetch_jobs_per_host': {'type': 'integer', 'minimum': 1},
+            'url_fetch_method': {
+                'type': 'string',
+                'enum': ['urllib', 'curl']
+            },
             'ccache': {'type': 'boolean'},
+            'memoize_spec_checks': {'type': 'boolean'},
+            'buildcache_compression': {
+                'type': 'string',
+                'enum': ['gzip', 'pgzip', 'xz', 'zstd']
+            },
+            'binary_index_ttl': {'type': 'integer', 'minimum': 0},
             'db_lock_timeout': {'type': 'integer', 'minimum': 1},
+            'db_journal': {'type': 'boolean'},
             'package_lock_timeout': {
                 'anyOf': [
                     {'type': 'integer', 'minimum': 1},
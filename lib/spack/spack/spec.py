@@ -79,7 +79,7 @@ expansion when it is the first character in an id typed on the command line.
 import base64
 import sys
 import collections
-import ctypes
+import contextlib
 import hashlib
 import itertools
 import os
@@ -100,6 +100,7 @@ import spack.paths
 import spack.architecture
 import spack.compiler
 import spack.compilers as compilers
+import spack.config
 import spack.error
 import spack.parse
 import spack.repo
@@ -185,14 +186,71 @@ _separators = '[\\%s]' % '\\'.join(color_formats.keys())
 #: every time we call str()
 _any_version = VersionList([':'])
 
-#: Max integer helps avoid passing too large a value to cyaml.
-maxint = 2 ** (ctypes.sizeof(ctypes.c_int) * 8 - 1) - 1
+#: Memoized node-level checks, active within ``memoized_checks()``
+_check_cache = None
 
 default_format = '{name}{@version}'
 default_format += '{%compiler.name}{@compiler.version}{compiler_flags}'
 default_format += '{variants}{arch=architecture}'
 
 
+class SpecCheckCache(object):
+    """Memoizes ``satisfies()`` and ``constrain()`` checks between nodes.
+
+    Results are keyed on node fingerprints (see
+    ``Spec._node_fingerprint()``), which are immutable snapshots of the
+    nodes.  A spec that is mutated after a check gets a new fingerprint,
+    so stale results are never returned.
+    """
+
+    def __init__(self):
+        #: Maps (node, constraint, strict) to the result of satisfies()
+        self.satisfies = {}
+
+        #: (node, constraint) pairs for which constrain() changes nothing
+        self.constrained = set()
+
+        self.hits = collections.defaultdict(int)
+        self.misses = collections.defaultdict(int)
+
+    def hit_rate(self, check):
+        """Fraction of ``check`` ('satisfies' or 'constrain') calls that
+        were answered from the cache."""
+        total = self.hits[check] + self.misses[check]
+        return float(self.hits[check]) / total if total else 0.0
+
+    def __str__(self):
+        return ', '.join(
+            '{0}: {1} hits, {2} misses ({3:.0%})'.format(
+                check, self.hits[check], self.misses[check],
+                self.hit_rate(check))
+            for check in ('satisfies', 'constrain'))
+
+
+@contextlib.contextmanager
+def memoized_checks():
+    """Memoize node-level ``Spec.satisfies()`` and ``Spec.constrain()``
+    checks within this context.
+
+    Nested contexts share the cache of the outermost one, whose hit and
+    miss counts are shown in debug output when it exits.
+
+    Yields:
+        SpecCheckCache: the cache in use
+    """
+    global _check_cache
+    if _check_cache is not None:
+        yield _check_cache
+        return
+
+    _check_cache = SpecCheckCache()
+    try:
+        yield _check_cache
+    finally:
+        tty.debug('Memoized spec checks: {0}'.format(_check_cache))
+        _check_cache = None
+
+
 def colorize_spec(spec):
     """Returns a spec colorized according to the colors specified in
        color_formats."""
@@ -1290,8 +1348,7 @@ class Spec(object):
         if self._hash:
             return self._hash[:length]
         else:
-            yaml_text = syaml.dump(
-                self.to_node_dict(), default_flow_style=True, width=maxint)
+            yaml_text = syaml.dump_flow(self.to_node_dict())
             sha = hashlib.sha1(yaml_text.encode('utf-8'))
 
             b32_hash = base64.b32encode(sha.digest()).lower()
@@ -1311,9 +1368,8 @@ class Spec(object):
             raise SpecError("Spec is not concrete: " + str(self))
 
         if not self._full_hash:
-            yaml_text = syaml.dump(
-                self.to_node_dict(hash_function=lambda s: s.full_hash()),
-                default_flow_style=True, width=maxint)
+            yaml_text = syaml.dump_flow(
+                self.to_node_dict(hash_function=lambda s: s.full_hash()))
             package_hash = self.package.content_hash()
             sha = hashlib.sha1(yaml_text.encode('utf-8') + package_hash)
 
@@ -1895,7 +1951,18 @@ class Spec(object):
         Concretizing ensures that it is self-consistent and that it's
         consistent with requirements of its packages. See flatten() and
         normalize() for more details on this.
+
+        If ``config:memoize_spec_checks`` is set, node-level checks made
+        while concretizing are memoized (see ``memoized_checks()``).
         """
+        if _check_cache is None and spack.config.get(
+                'config:memoize_spec_checks', False):
+            with memoized_checks():
+                return self._concretize(tests)
+
+        return self._concretize(tests)
+
+    def _concretize(self, tests=False):
         if not self.name:
             raise SpecError("Attempting to concretize anonymous spec")
 
@@ -2428,6 +2495,25 @@ class Spec(object):
 
         other = self._autospec(other)
 
+        cache = _check_cache
+        if cache is None or (deps and other._dependencies):
+            return self._constrain(other, deps)
+
+        key = (self._node_fingerprint(), other._node_fingerprint())
+        if key in cache.constrained:
+            cache.hits['constrain'] += 1
+            return False
+
+        cache.misses['constrain'] += 1
+        changed = self._constrain(other, deps)
+
+        # constraining self with other again would change nothing
+        if changed:
+            key = (self._node_fingerprint(), key[1])
+        cache.constrained.add(key)
+        return changed
+
+    def _constrain(self, other, deps):
         if not (self.name == other.name or
                 (not self.name) or
                 (not other.name)):
@@ -2564,9 +2650,28 @@ class Spec(object):
 
           * `strict`: strict means that we *must* meet all the
             constraints specified on other.
+
+        Within ``memoized_checks()``, results for single nodes are
+        memoized.
         """
         other = self._autospec(other)
 
+        cache = _check_cache
+        if (cache is None or other.concrete or
+                (deps and other._dependencies)):
+            return self._satisfies(other, deps, strict)
+
+        key = (self._node_fingerprint(), other._node_fingerprint(), strict)
+        if key in cache.satisfies:
+            cache.hits['satisfies'] += 1
+            return cache.satisfies[key]
+
+        cache.misses['satisfies'] += 1
+        result = self._satisfies(other, deps, strict)
+        cache.satisfies[key] = result
+        return result
+
+    def _satisfies(self, other, deps, strict):
         # The only way to satisfy a concrete spec is to match its hash exactly.
         if other.concrete:
             return self.concrete and self.dag_hash() == other.dag_hash()
@@ -2796,9 +2901,15 @@ class Spec(object):
         # Cached fields are results of expensive operations.
         # If we preserved the original structure, we can copy them
         # safely. If not, they need to be recomputed.
+        hashes = False
         if caches is None:
             caches = (deps is True or deps == all_deptypes)
 
+            # DAG hashes only cover link and run dependencies, so they
+            # are still valid if we copy at least those.
+            hashes = (isinstance(deps, (tuple, list)) and
+                      all(t in deps for t in ('link', 'run')))
+
         # If we copy dependencies, preserve DAG structure in the new spec
         if deps:
             # If caller restricted deptypes to be copied, adjust that here.
@@ -2821,6 +2932,12 @@ class Spec(object):
             self._normal = False
             self._full_hash = None
 
+        if hashes and not caches:
+            copies = dict((s.name, s) for s in self.traverse())
+            for s in other.traverse(deptype=deps):
+                copies[s.name]._hash = s._hash
+                copies[s.name]._full_hash = s._full_hash
+
         return changed
 
     def _dup_deps(self, other, deptypes, caches):
@@ -2997,6 +3114,24 @@ class Spec(object):
                 self.compiler,
                 self.compiler_flags)
 
+    def _node_fingerprint(self):
+        """Immutable snapshot of the constraints on just *this node*.
+
+        Unlike ``_cmp_node()``, this holds no references to mutable
+        objects, so it remains a valid key if this spec is modified.
+        """
+        arch, compiler = self.architecture, self.compiler
+        return (self.name,
+                self.namespace,
+                tuple(self.versions),
+                tuple((name, type(v), v.value)
+                      for name, v in sorted(self.variants.items())),
+                arch._cmp_key() if arch is not None else None,
+                ((compiler.name, tuple(compiler.versions))
+                 if compiler is not None else None),
+                self.compiler_flags._cmp_key(),
+                self._concrete)
+
     def eq_node(self, other):
         """Equality with another spec, not including dependencies."""
         return self._cmp_node() == other._cmp_node()
@@ -3781,9 +3916,7 @@ class SpecParser(spack.parse.Parser):
     def spec_by_hash(self):
         self.expect(ID)
 
-        specs = spack.store.db.query()
-        matches = [spec for spec in specs if
-                   spec.dag_hash()[:len(self.token.value)] == self.token.value]
+        matches = spack.store.db.get_by_hash(self.token.value, installed=True)
 
         if not matches:
             raise NoSuchHashError(self.token.value)
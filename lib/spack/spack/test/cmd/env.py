@@ -4,6 +4,7 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import os
+import shutil
 from six import StringIO
 
 import pytest
@@ -13,6 +14,7 @@ import llnl.util.filesystem as fs
 import spack.modules
 import spack.environment as ev
 from spack.cmd.env import _env_create
+from spack.filesystem_view import YamlFilesystemView
 from spack.spec import Spec
 from spack.main import SpackCommand
 
@@ -41,7 +43,8 @@ def check_mpileaks_install(viewdir):
 def check_viewdir_removal(viewdir):
     """Check that the uninstall/removal worked."""
     assert (not os.path.exists(str(viewdir.join('.spack'))) or
-            os.listdir(str(viewdir.join('.spack'))) == ['projections.yaml'])
+            set(os.listdir(str(viewdir.join('.spack')))) <=
+            set(['projections.yaml', 'manifest.json']))
 
 
 def test_add():
@@ -105,6 +108,21 @@ def test_concretize():
     assert any(x.name == 'mpileaks' for x in env_specs)
 
 
+def test_concretize_in_processes():
+    env('create', 'test')
+    with ev.read('test'):
+        for spec in ('mpileaks', 'libelf@0.8.12', 'callpath ^mpich2'):
+            add(spec)
+        concretize('-j', '2')
+
+    e = ev.read('test')
+    assert [str(s) for s in e.concretized_user_specs] == [
+        'mpileaks', 'libelf@0.8.12', 'callpath ^mpich2']
+    for user_spec, concrete in e.concretized_specs():
+        assert concrete.concrete
+        assert concrete.dag_hash() == user_spec.concretized().dag_hash()
+
+
 def test_env_install_all(install_mockery, mock_fetch):
     e = ev.create('test')
     e.add('cmake-client')
@@ -115,6 +133,24 @@ def test_env_install_all(install_mockery, mock_fetch):
     assert spec.package.installed
 
 
+def test_env_install_plan(install_mockery, mock_fetch, capfd):
+    install('--fake', 'libelf')
+    env('create', 'test')
+    with ev.read('test'):
+        add('mpileaks')
+        add('callpath')
+        add('libelf')
+        with capfd.disabled():
+            out = install('--fake')
+
+    assert 'Installing 6 packages: 1 installed, 0 from build cache, ' \
+        '5 from source' in out
+    assert 'libelf is already installed' in out
+    e = ev.read('test')
+    for spec in e.all_specs():
+        assert spec.package.installed
+
+
 def test_env_install_single_spec(install_mockery, mock_fetch):
     env('create', 'test')
     install = SpackCommand('install')
@@ -758,6 +794,64 @@ def test_env_updates_view_force_remove(
     check_viewdir_removal(view_dir)
 
 
+def test_env_updates_view_from_manifest(
+        tmpdir, mock_stage, mock_fetch, install_mockery, monkeypatch):
+    view_dir = tmpdir.mkdir('view')
+    env('create', '--with-view=%s' % view_dir, 'test')
+    with ev.read('test'):
+        install('--fake', 'libelf')
+
+    view = ev.read('test').view()
+    assert set(e['name'] for e in view.read_manifest().values()) == set(
+        ['libelf'])
+
+    # later updates only link and unlink what changed
+    def get_all_specs(self):
+        raise AssertionError('the view was rescanned')
+    monkeypatch.setattr(YamlFilesystemView, 'get_all_specs', get_all_specs)
+
+    with ev.read('test'):
+        install('--fake', 'mpileaks')
+    check_mpileaks_install(view_dir)
+    linked = ev.read('test').view().read_manifest()
+    assert 'mpileaks' in set(e['name'] for e in linked.values())
+
+    # packages uninstalled outside of the environment are unlinked too
+    test = ev.read('test')
+    mpileaks = next(s for s in test._get_environment_specs()
+                    if s.name == 'mpileaks')
+    mpileaks.package.do_uninstall(force=True)
+    test.regenerate_view()
+    assert not os.path.exists(str(view_dir.join('.spack', 'mpileaks')))
+    for root, dirs, files in os.walk(str(view_dir)):
+        assert all(os.path.exists(os.path.join(root, f)) for f in files)
+
+    with ev.read('test'):
+        uninstall('-ay')
+    check_viewdir_removal(view_dir)
+    assert not ev.read('test').view().read_manifest()
+
+
+def test_env_view_regenerate_rescans(
+        tmpdir, mock_stage, mock_fetch, install_mockery):
+    view_dir = tmpdir.mkdir('view')
+    env('create', '--with-view=%s' % view_dir, 'test')
+    with ev.read('test'):
+        install('--fake', 'mpileaks')
+
+    # the manifest does not know about changes made behind its back
+    shutil.rmtree(str(view_dir.join('.spack', 'mpileaks')))
+    ev.read('test').regenerate_view()
+    assert not os.path.exists(str(view_dir.join('.spack', 'mpileaks')))
+
+    with ev.read('test'):
+        env('view', 'regenerate')
+
+    check_mpileaks_install(view_dir)
+    linked = ev.read('test').view().read_manifest()
+    assert 'mpileaks' in set(e['name'] for e in linked.values())
+
+
 def test_env_activate_view_fails(
         tmpdir, mock_stage, mock_fetch, install_mockery):
     """Sanity check on env activate to make sure it requires shell support"""
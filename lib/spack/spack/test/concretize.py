@@ -5,9 +5,11 @@
 
 import pytest
 import llnl.util.lang
+import llnl.util.tty as tty
 
 import spack.architecture
 import spack.concretize
+import spack.error
 import spack.repo
 
 from spack.concretize import find_spec
@@ -564,3 +566,56 @@ class TestConcretize(object):
         # Make sure the concrete spec are top-level specs with no dependents
         for spec in concrete_specs:
             assert not spec.dependents()
+
+    def test_concretize_specs_shares_lookups(self):
+        abstract_specs = ['mpileaks', 'callpath ^mpich2', 'dyninst%gcc',
+                          'libelf@0.8.12', 'mpileaks ^mpich']
+
+        results = list(spack.concretize.concretize_specs(abstract_specs))
+        assert [str(a) for a, _, _ in results] == abstract_specs
+
+        # Concretizing in a batch gives the same result as one at a time
+        for abstract, concrete, seconds in results:
+            assert concrete.concrete
+            assert concrete == abstract.concretized()
+            assert concrete.dag_hash() == abstract.concretized().dag_hash()
+            assert seconds >= 0
+
+        # Lookups are not shared outside of the batch
+        assert spack.concretize.concretizer._lookups is None
+
+    def test_concretize_specs_in_processes(self):
+        abstract_specs = ['mpileaks', 'callpath ^mpich2', 'dyninst%gcc',
+                          'libelf@0.8.12', 'mpileaks ^mpich']
+
+        results = list(spack.concretize.concretize_specs(
+            abstract_specs, jobs=3))
+        assert [str(a) for a, _, _ in results] == abstract_specs
+
+        for abstract, concrete, seconds in results:
+            expected = abstract.concretized()
+            assert concrete.concrete
+            assert concrete == expected
+            assert concrete.dag_hash() == expected.dag_hash()
+            assert concrete.tree(deptypes='all') == expected.tree(
+                deptypes='all')
+            assert all(d.dependents() for d in concrete.traverse(root=False))
+
+    def test_concretize_specs_in_processes_error(self):
+        with pytest.raises(spack.error.SpackError):
+            list(spack.concretize.concretize_specs(
+                ['mpileaks', 'libelf@0.8.12 ^mpich'], jobs=2))
+
+    def test_concretize_specs_in_processes_exit(self, monkeypatch):
+        concretized = Spec.concretized
+
+        def die_on_libelf(spec):
+            if spec.name == 'libelf':
+                tty.die('libelf.Libelf is not a class')
+            return concretized(spec)
+        monkeypatch.setattr(Spec, 'concretized', die_on_libelf)
+
+        # A worker that exits must not leave the pool waiting for it
+        with pytest.raises(SystemExit):
+            list(spack.concretize.concretize_specs(
+                ['mpileaks', 'libelf@0.8.12'], jobs=2))
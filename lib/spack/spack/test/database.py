@@ -158,6 +158,32 @@ def test_add_to_upstream_after_downstream(upstream_and_downstream_db):
             spack.store.db = orig_db
 
 
+@pytest.mark.usefixtures('config')
+def test_get_by_hash_with_upstream(upstream_and_downstream_db):
+    upstream_db, upstream_layout, downstream_db, downstream_layout = (
+        upstream_and_downstream_db)
+
+    default = ('build', 'link')
+    z = MockPackage('z', [], [])
+    y = MockPackage('y', [z], [default])
+    mock_repo = MockPackageMultiRepo([y, z])
+
+    with spack.repo.swap(mock_repo):
+        spec = spack.spec.Spec('y')
+        spec.concretize()
+        upstream_db.add(spec['z'], upstream_layout)
+        downstream_db.add(spec, downstream_layout)
+
+        for s in spec.traverse():
+            assert downstream_db.get_by_hash(s.dag_hash()[:7]) == [s]
+        assert upstream_db.get_by_hash(spec.dag_hash()) == []
+        assert downstream_db.get_by_hash_local(spec['z'].dag_hash()) == []
+
+        # the empty prefix matches everything, once
+        assert sorted(downstream_db.get_by_hash('')) == sorted(
+            spec.traverse())
+
+
 @pytest.mark.usefixtures('config')
 def test_recursive_upstream_dbs(tmpdir_factory, test_store, gen_mock_layout):
     roots = [str(tmpdir_factory.mktemp(x)) for x in ['a', 'b', 'c']]
@@ -452,11 +478,214 @@ def test_030_db_sanity_from_another_process(mutable_database):
         assert len(mutable_database.query('mpileaks ^zmpi')) == 0
 
 
+def test_035_unchanged_index_is_not_reparsed(mutable_database, monkeypatch):
+    # make sure the in-memory data is in sync with the index file
+    with mutable_database.read_transaction():
+        pass
+
+    reads = []
+    read_from_file = mutable_database._read_from_file
+
+    def _read_from_file(*args, **kwargs):
+        reads.append(args)
+        return read_from_file(*args, **kwargs)
+
+    monkeypatch.setattr(mutable_database, '_read_from_file', _read_from_file)
+
+    # neither reading nor writing from this process requires a re-parse
+    with mutable_database.read_transaction():
+        pass
+    with mutable_database.write_transaction():
+        pass
+    with mutable_database.read_transaction():
+        pass
+    assert not reads
+
+    # a write from another Database instance invalidates the cached data
+    other_db = spack.database.Database(
+        mutable_database.root, db_dir=mutable_database._db_dir)
+    other_db.remove('mpileaks ^zmpi')
+
+    with mutable_database.read_transaction():
+        assert len(mutable_database.query('mpileaks ^zmpi')) == 0
+    assert len(reads) == 1
+
+
+def test_036_failed_write_invalidates_cache(mutable_database):
+    with pytest.raises(Exception):
+        with mutable_database.write_transaction():
+            _mock_remove('mpileaks ^zmpi')
+            raise Exception()
+
+    assert mutable_database._last_seen_index is None
+    with mutable_database.read_transaction():
+        assert len(mutable_database.query('mpileaks ^zmpi')) == 1
+
+
+@pytest.fixture()
+def journaled_database(mutable_database):
+    mutable_database._journal = True
+    yield mutable_database
+    mutable_database._journal = False
+
+
+def _check_same_records(db, other_db):
+    with other_db.read_transaction():
+        other_db._check_ref_counts()
+        assert sorted(other_db._data) == sorted(db._data)
+        for key, rec in db._data.items():
+            assert other_db._data[key].to_dict() == rec.to_dict()
+
+
+def test_037_journal_appends_changes(journaled_database):
+    db = journaled_database
+    identity = db._index_identity()
+
+    _mock_remove('mpileaks ^zmpi')
+    db.update_explicit('externaltool', True)
+
+    # the snapshot is untouched, changes went to the journal
+    assert db._index_identity() == identity
+    with open(db._journal_path) as f:
+        assert len(f.readlines()) == 2
+
+    # another instance replays the journal on top of the snapshot
+    other_db = spack.database.Database(db.root, db_dir=db._db_dir)
+    _check_same_records(db, other_db)
+    assert other_db.query('mpileaks ^zmpi', installed=any) == []
+    assert other_db.get_record('externaltool').explicit
+
+    # and picks up further journal entries incrementally
+    _mock_remove('mpileaks ^mpich')
+    with other_db.read_transaction():
+        assert other_db.query('mpileaks ^mpich', installed=any) == []
+    _check_same_records(db, other_db)
+
+
+def test_038_journal_is_compacted(journaled_database, monkeypatch):
+    db = journaled_database
+    _mock_remove('mpileaks ^zmpi')
+    assert os.path.isfile(db._journal_path)
+
+    # the journal is now over the threshold
+    monkeypatch.setattr(spack.database, '_db_journal_compaction_ratio', 1e-9)
+    _mock_remove('mpileaks ^mpich')
+    assert not os.path.exists(db._journal_path)
+
+    other_db = spack.database.Database(db.root, db_dir=db._db_dir)
+    _check_same_records(db, other_db)
+
+
+def test_039_journal_ignores_interrupted_write(journaled_database):
+    db = journaled_database
+    _mock_remove('mpileaks ^zmpi')
+    with open(db._journal_path, 'a') as f:
+        f.write('{"changes": {"abc')
+
+    # readers skip the partial line
+    other_db = spack.database.Database(db.root, db_dir=db._db_dir)
+    _check_same_records(db, other_db)
+
+    # and the next writer drops it
+    _mock_remove('mpileaks ^mpich')
+    with open(db._journal_path) as f:
+        assert len(f.readlines()) == 2
+    _check_same_records(db, other_db)
+
+
 def test_040_ref_counts(database):
     """Ensure that we got ref counts right when we read the DB."""
     database._check_ref_counts()
 
 
+def _check_record_index(db):
+    """Check the incrementally maintained index against a fresh one."""
+    index = db._get_index()
+    fresh = spack.database.RecordIndex(db._data)
+
+    def nonempty(d):
+        return dict((k, v) for k, v in d.items() if v)
+
+    assert nonempty(index.by_name) == nonempty(fresh.by_name)
+    assert nonempty(index.by_compiler) == nonempty(fresh.by_compiler)
+    assert index.installed == fresh.installed
+    assert index.explicit == fresh.explicit
+    assert index.installed_between() == set(db._data)
+
+
+def test_041_record_index_is_maintained(mutable_database):
+    with mutable_database.read_transaction():
+        _check_record_index(mutable_database)
+
+    _mock_remove('mpileaks ^zmpi')
+    mutable_database.remove('callpath ^mpich')
+    mutable_database.update_explicit('externaltool', True)
+    with mutable_database.read_transaction():
+        _check_record_index(mutable_database)
+
+    _mock_install('mpileaks ^zmpi')
+    with mutable_database.read_transaction():
+        _check_record_index(mutable_database)
+
+
+@pytest.mark.parametrize('query_args', [
+    {'query_spec': 'mpileaks'},
+    {'query_spec': 'mpi'},
+    {'query_spec': 'callpath ^mpich'},
+    {'query_spec': '%gcc'},
+    {'query_spec': '%clang'},
+    {'query_spec': 'mpileaks', 'installed': any},
+    {'query_spec': 'mpileaks', 'installed': False},
+    {'explicit': True},
+    {'explicit': False, 'known': True},
+    {'start_date': datetime.datetime.min, 'end_date': datetime.datetime.max},
+    {'end_date': datetime.datetime.min},
+])
+def test_042_indexed_query(database, query_args):
+    # reference results from a plain scan over all the records
+    query_spec = query_args.get('query_spec', any)
+    if query_spec is not any:
+        query_spec = query_args['query_spec'] = spack.spec.Spec(query_spec)
+    installed = query_args.setdefault('installed', True)
+    explicit = query_args.get('explicit', any)
+    known = query_args.get('known', any)
+    start = query_args.get('start_date', datetime.datetime.min)
+    end = query_args.get('end_date', datetime.datetime.max)
+
+    expected = []
+    with database.read_transaction():
+        for rec in database._data.values():
+            date = datetime.datetime.fromtimestamp(rec.installation_time)
+            if ((installed is any or rec.installed == installed) and
+                (explicit is any or rec.explicit == explicit) and
+                (known is any or
+                 spack.repo.path.exists(rec.spec.name) == known) and
+                start < date < end and
+                (query_spec is any or rec.spec.satisfies(query_spec))):
+                expected.append(rec.spec)
+
+    assert database.query(**query_args) == sorted(expected)
+
+
+def test_043_get_by_hash(mutable_database):
+    specs = mutable_database.query(installed=any)
+    for spec in specs:
+        for length in (1, 7, 32):
+            prefix = spec.dag_hash()[:length]
+            expected = [s for s in specs if s.dag_hash().startswith(prefix)]
+            assert (sorted(mutable_database.get_by_hash(prefix)) ==
+                    sorted(expected))
+
+    spec = mutable_database.query_one('callpath ^mpich')
+    mutable_database.remove(spec)
+    assert mutable_database.get_by_hash(spec.dag_hash()) == [spec]
+    assert mutable_database.get_by_hash(
+        spec.dag_hash(), installed=True) == []
+
+    _mock_remove('mpileaks ^mpich')
+    assert mutable_database.get_by_hash(spec.dag_hash()) == []
+
+
 def test_050_basic_query(database):
     """Ensure querying database is consistent with what is installed."""
     # query everything
@@ -8,6 +8,7 @@ import pytest
 import shutil
 
 from llnl.util.filesystem import mkdirp, touch, working_dir
+from llnl.util.filesystem import file_listing_path, find_libraries
 
 import spack.patch
 import spack.repo
@@ -262,6 +263,16 @@ def test_store(install_mockery, mock_fetch):
     pkg.do_install()
 
 
+def test_install_writes_file_listing(install_mockery, mock_fetch):
+    spec = Spec('libelf').concretized()
+    spec.package.do_install(fake=True)
+
+    listing = os.path.join(spec.prefix, file_listing_path)
+    assert os.path.isfile(listing)
+    assert find_libraries('libelf', spec.prefix, recursive=True)
+    spec.package.do_uninstall()
+
+
 @pytest.mark.disable_clean_stage_check
 def test_failing_build(install_mockery, mock_fetch):
     spec = Spec('failing-build').concretized()
@@ -0,0 +1,98 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import pytest
+
+import spack.config
+import spack.error
+import spack.installer
+import spack.package
+import spack.store
+from spack.spec import Spec
+
+
+@pytest.fixture()
+def install_jobs():
+    spack.config.set('config:install_jobs', 3, scope='command_line')
+    yield
+    spack.config.set('config:install_jobs', 1, scope='command_line')
+
+
+@pytest.mark.usefixtures('install_mockery', 'mock_fetch', 'install_jobs')
+def test_install_dependencies_concurrently():
+    spec = Spec('mpileaks')
+    spec.concretize()
+    spec.package.do_install(fake=True, explicit=True)
+
+    for s in spec.traverse():
+        assert s.package.installed
+        rec = spack.store.db.get_record(s)
+        assert rec.explicit == (s.name == 'mpileaks')
+
+
+@pytest.mark.usefixtures('install_mockery', 'mock_fetch', 'install_jobs')
+def test_failure_cancels_only_dependents(monkeypatch):
+    do_install = spack.package.PackageBase.do_install
+
+    def failing_install(self, **kwargs):
+        if self.name == 'libdwarf':
+            raise spack.error.SpackError('libdwarf failed to build')
+        return do_install(self, **kwargs)
+    monkeypatch.setattr(spack.package.PackageBase, 'do_install',
+                        failing_install)
+
+    spec = Spec('mpileaks')
+    spec.concretize()
+    with pytest.raises(spack.error.SpackError) as e:
+        spec.package.do_install(fake=True)
+    assert 'libdwarf failed to build' in str(e.value)
+
+    installed = set(s.name for s in spec.traverse() if s.package.installed)
+    assert installed == set(['libelf', spec['mpi'].name])
+
+
+@pytest.mark.usefixtures('install_mockery', 'mock_fetch')
+def test_install_plan_merges_roots():
+    roots = [Spec('mpileaks'), Spec('callpath'), Spec('libelf')]
+    for spec in roots:
+        spec.concretize()
+    roots[2].package.do_install(fake=True)
+
+    plan = spack.installer.InstallPlan(roots, use_cache=False)
+    names = [s.name for s in plan.specs]
+    assert sorted(names) == sorted(s.name for s in roots[0].traverse())
+    assert names.index('libelf') < names.index('callpath')
+    assert [s.name for s in plan.installed] == ['libelf']
+    assert not plan.from_cache
+    assert len(plan.missing) == len(plan.specs) - 1
+    assert '1 installed, 0 from build cache' in plan.summary()
+
+
+@pytest.mark.usefixtures('install_mockery', 'mock_fetch')
+def test_install_plan_installs_roots_once(monkeypatch):
+    roots = [Spec('mpileaks'), Spec('callpath'), Spec('libelf')]
+    for spec in roots:
+        spec.concretize()
+    roots[2].package.do_install(fake=True)
+    plan = spack.installer.InstallPlan(roots, use_cache=False)
+
+    installs = []
+    do_install = spack.package.PackageBase.do_install
+
+    def counting_install(self, **kwargs):
+        installs.append(self.name)
+        return do_install(self, **kwargs)
+    monkeypatch.setattr(spack.package.PackageBase, 'do_install',
+                        counting_install)
+
+    spack.installer.install_plan(
+        plan, 1, fake=True, explicit=True, install_deps=False)
+
+    assert sorted(installs) == sorted(s.name for s in plan.specs)
+    for spec in plan.specs:
+        assert spec.package.installed
+        rec = spack.store.db.get_record(spec)
+        assert rec.explicit == (spec.name in ('mpileaks', 'callpath',
+                                              'libelf'))
@@ -5,12 +5,15 @@
 
 import os
 import fnmatch
+import shutil
 
 import six
 import pytest
 
 from llnl.util.filesystem import LibraryList, HeaderList
 from llnl.util.filesystem import find_libraries, find_headers, find
+from llnl.util.filesystem import write_file_listing, remove_file_listing
+import llnl.util.filesystem
 
 import spack.paths
 
@@ -278,3 +281,56 @@ def test_searching_order(search_fn, search_list, root, kwargs):
 def test_find_with_globbing(root, search_list, kwargs, expected):
     matches = find(root, search_list, **kwargs)
     assert sorted(matches) == sorted(expected)
+
+
+@pytest.fixture()
+def search_tree(tmpdir):
+    """A copy of the data for the searches, with hidden files."""
+    root = str(tmpdir.join('search'))
+    shutil.copytree(search_dir, root)
+    tmpdir.join('search', 'b', '.libhidden.so').ensure()
+    tmpdir.join('search', 'c', 'lib.so').ensure(dir=True)
+    return root
+
+
+@pytest.mark.parametrize('search_list,recursive', [
+    (['*.so', '*.h'], True),
+    (['lib*.so', '.lib*', 'b.h', 'missing.h'], True),
+    (['*.so'], False),
+    (['*'], True),
+])
+def test_find_matches_glob(search_tree, search_list, recursive):
+    # a single walk finds what globbing each pattern in each directory finds
+    if recursive:
+        expected = llnl.util.filesystem._find_recursive(
+            search_tree, search_list)
+    else:
+        expected = llnl.util.filesystem._find_non_recursive(
+            os.path.join(search_tree, 'b'), search_list)
+        search_tree = os.path.join(search_tree, 'b')
+    assert find(search_tree, search_list, recursive) == expected
+
+
+def test_find_with_file_listing(search_tree, monkeypatch):
+    expected = {
+        'libs': find_libraries(['liba', 'libb'], search_tree, recursive=True),
+        'headers': find_headers('*', search_tree, recursive=True),
+        'non-recursive': find(os.path.join(search_tree, 'b'), '*.h', False),
+    }
+
+    write_file_listing(search_tree)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('the tree was walked')
+    monkeypatch.setattr(llnl.util.filesystem, '_scandir', fail)
+    monkeypatch.setattr(os, 'listdir', fail)
+
+    assert expected == {
+        'libs': find_libraries(['liba', 'libb'], search_tree, recursive=True),
+        'headers': find_headers('*', search_tree, recursive=True),
+        'non-recursive': find(os.path.join(search_tree, 'b'), '*.h', False),
+    }
+
+    remove_file_listing(search_tree)
+    with pytest.raises(AssertionError):
+        find(search_tree, '*.h')
@@ -7,7 +7,8 @@ import os
 
 import pytest
 from llnl.util.filesystem import working_dir, mkdirp, touchp
-from llnl.util.link_tree import LinkTree
+import llnl.util.link_tree
+from llnl.util.link_tree import LinkTree, MergeConflictError
 from spack.stage import Stage
 
 
@@ -166,3 +167,87 @@ def test_ignore(stage, link_tree):
 
         assert os.path.isfile('source/.spec')
         assert os.path.isfile('dest/.spec')
+
+
+def test_merge_threads(stage, link_tree):
+    with working_dir(stage.path):
+        link_tree.merge('dest', jobs=4)
+
+        check_file_link('dest/1',       'source/1')
+        check_file_link('dest/a/b/2',   'source/a/b/2')
+        check_file_link('dest/c/d/e/7', 'source/c/d/e/7')
+
+
+def test_merge_walks_tree_once(stage, link_tree, monkeypatch):
+    listed = []
+    scandir = llnl.util.link_tree._scandir
+
+    def counting_scandir(path):
+        listed.append(os.path.normpath(path))
+        return scandir(path)
+    monkeypatch.setattr(llnl.util.link_tree, '_scandir', counting_scandir)
+
+    with working_dir(stage.path):
+        touchp('dest/a/x')
+        link_tree.merge('dest')
+
+    # each source directory, and each destination directory that existed
+    expected = [os.path.join(stage.path, 'source', d) for d in
+                ('.', 'a', 'a/b', 'c', 'c/d', 'c/d/e')]
+    expected = [os.path.normpath(d) for d in expected] + ['dest', 'dest/a']
+    assert sorted(listed) == sorted(expected)
+
+
+def test_merge_conflicts(stage, link_tree):
+    with working_dir(stage.path):
+        touchp('dest/c/d/5')
+        touchp('dest/a')
+        mkdirp('dest/1')
+
+        scan = link_tree.scan('dest')
+        assert sorted(scan.conflicts) == [
+            'Directory blocks file: dest/1',
+            'File blocks directory: dest/a']
+        assert scan.existing == set(['dest/1', 'dest/c/d/5'])
+
+        with pytest.raises(MergeConflictError):
+            link_tree.merge('dest')
+
+        os.remove('dest/a')
+        os.rmdir('dest/1')
+        assert link_tree.find_conflict('dest') == 'dest/c/d/5'
+        link_tree.merge('dest', ignore_conflicts=True)
+        check_file_link('dest/a/b/2', 'source/a/b/2')
+        assert not os.path.islink('dest/c/d/5')
+
+
+@pytest.mark.parametrize('order', [('a', 'b'), ('b', 'a')])
+def test_merge_symlinked_directories(stage, order):
+    """A symlinked directory in a prefix is merged as a real directory, so
+    no file is ever linked through it into another prefix."""
+    with working_dir(stage.path):
+        touchp('a/lib64/x')
+        touchp('b/lib/y')
+        os.symlink('lib', 'b/lib64')
+
+        for prefix in order:
+            LinkTree(os.path.abspath(prefix)).merge('view')
+
+        assert not os.path.islink('view/lib64')
+        check_file_link('view/lib64/x', 'a/lib64/x')
+        check_file_link('view/lib64/y', 'b/lib/y')
+        check_file_link('view/lib/y', 'b/lib/y')
+        assert sorted(os.listdir('b/lib')) == ['y']
+
+
+def test_merge_through_view_symlink_conflicts(stage, link_tree):
+    with working_dir(stage.path):
+        mkdirp('elsewhere')
+        mkdirp('dest')
+        os.symlink('../elsewhere', 'dest/a')
+
+        assert link_tree.find_dir_conflicts('dest', None) == [
+            'File blocks directory: dest/a']
+        with pytest.raises(MergeConflictError):
+            link_tree.merge('dest')
+        assert os.listdir('elsewhere') == []
@@ -833,6 +833,42 @@ def test_transaction_with_exception(lock_path):
     assert vals['exception']
 
 
+def test_transaction_exits_before_unlock(lock_path):
+    def exit_fn(t, v, tb):
+        # other processes must not see the lock free before this is done
+        vals['locked'] = lock._file is not None
+
+    lock = lk.Lock(lock_path)
+    vals = {'locked': False}
+    with lk.WriteTransaction(lock, release_fn=exit_fn):
+        pass
+    assert vals['locked']
+    assert lock._file is None
+
+    vals = {'locked': False}
+    with lk.ReadTransaction(lock, release_fn=exit_fn):
+        pass
+    assert vals['locked']
+    assert lock._file is None
+
+
+def test_write_transaction_nested_in_read(lock_path):
+    def enter_fn():
+        vals['entered'] += 1
+
+    def exit_fn(t, v, tb):
+        vals['exited'] += 1
+        vals['locked'] = lock._file is not None
+
+    lock = lk.Lock(lock_path)
+    vals = {'entered': 0, 'exited': 0, 'locked': False}
+    with lk.ReadTransaction(lock):
+        with lk.WriteTransaction(lock, enter_fn, exit_fn):
+            pass
+        assert vals == {'entered': 1, 'exited': 1, 'locked': True}
+    assert lock._file is None
+
+
 def test_transaction_with_context_manager(lock_path):
     class TestContextManager(object):
 
@@ -12,17 +12,25 @@ import sys
 import shutil
 import pytest
 import argparse
+import hashlib
+import io
+import tarfile
+from contextlib import closing
 
 from llnl.util.filesystem import mkdirp
 
+import spack.caches
 import spack.repo
 import spack.store
 import spack.binary_distribution as bindist
 import spack.cmd.buildcache as buildcache
+import spack.util.compression
+import spack.util.spack_yaml as syaml
 from spack.spec import Spec
 from spack.paths import mock_gpg_keys_path
 from spack.fetch_strategy import URLFetchStrategy, FetchStrategyComposite
 from spack.util.executable import ProcessError
+from spack.util.file_cache import FileCache
 from spack.relocate import needs_binary_relocation, needs_text_relocation
 from spack.relocate import strings_contains_installroot
 from spack.relocate import get_patchelf, relocate_text, relocate_links
@@ -232,7 +240,7 @@ echo $PATH"""
     stage.destroy()
 
     # Remove cached binary specs since we deleted the mirror
-    bindist._cached_specs = None
+    bindist.binary_index.refresh()
 
 
 def test_relocate_text(tmpdir):
@@ -401,3 +409,287 @@ def test_relocate_macho(tmpdir):
             'libncurses.5.4.dylib',
             rpaths, deps, idpath,
             nrpaths, ndeps, nid)
+
+
+@pytest.mark.usefixtures('install_mockery')
+@pytest.mark.parametrize('rel', [False, True])
+def test_buildcache_stream(mock_archive, tmpdir, rel):
+    # Install the test package, with a text file and a link to relocate
+    spec = Spec('trivial-install-test-package')
+    spec.concretize()
+    pkg = spec.package
+    fake_fetchify(mock_archive.url, pkg)
+    pkg.do_install()
+
+    filename = os.path.join(spec.prefix, "dummy.txt")
+    with open(filename, "w") as script:
+        script.write(spec.prefix)
+    linkname = os.path.join(spec.prefix, "link_to_dummy.txt")
+    os.symlink(filename, linkname)
+
+    # Create a streamed and a regular build cache for the package
+    parser = argparse.ArgumentParser()
+    buildcache.setup_parser(parser)
+    mirrors = {}
+    for mode in ('stream', 'copy'):
+        mirror_path = str(tmpdir.join(mode))
+        args = ['create', '-d', mirror_path, '-u']
+        if mode == 'stream':
+            args.append('--stream')
+        if rel:
+            args.append('-r')
+        buildcache.buildcache(parser, parser.parse_args(args + [str(spec)]))
+        mirrors[mode] = mirror_path
+
+    # Both contain the same files
+    def tarball_contents(mirror_path):
+        spackfile = os.path.join(
+            mirror_path, 'build_cache',
+            bindist.tarball_path_name(spec, '.spack'))
+        with closing(tarfile.open(spackfile)) as outer:
+            names = outer.getnames()
+            tgz = outer.extractfile(bindist.tarball_name(spec, '.tar.gz'))
+            data = tgz.read()
+            specfile = outer.extractfile(
+                bindist.tarball_name(spec, '.spec.yaml'))
+            spec_dict = syaml.load(specfile.read())
+
+        # The checksum in spec.yaml is the one of the tarball
+        assert spec_dict['binary_cache_checksum']['hash'] == \
+            hashlib.sha256(data).hexdigest()
+
+        with closing(tarfile.open(fileobj=io.BytesIO(data))) as inner:
+            members = dict((m.name, m) for m in inner.getmembers())
+            buildinfo = syaml.load(inner.extractfile(os.path.join(
+                os.path.basename(spec.prefix),
+                '.spack', 'binary_distribution')).read())
+        return names, members, buildinfo
+
+    stream_names, stream_members, stream_info = tarball_contents(
+        mirrors['stream'])
+    copy_names, copy_members, copy_info = tarball_contents(mirrors['copy'])
+    assert stream_names == copy_names
+    assert sorted(stream_members) == sorted(copy_members)
+    assert stream_info == copy_info
+    for name, member in copy_members.items():
+        assert stream_members[name].type == member.type
+        assert stream_members[name].size == member.size
+        assert stream_members[name].linkname == member.linkname
+
+    # The prefix was not modified
+    assert os.readlink(linkname) == filename
+
+    # The streamed build cache can be installed
+    mirror_url = 'file://' + mirrors['stream']
+    spack.config.set('mirrors', {'stream': mirror_url})
+    stage = spack.stage.Stage(mirror_url, name="build_cache", keep=True)
+    stage.create()
+
+    pkg.do_uninstall(force=True)
+    args = parser.parse_args(['install', '-u', str(spec)])
+    buildcache.install_tarball(spec, args)
+    assert os.path.lexists(linkname)
+    if not rel:
+        assert os.path.realpath(linkname) == os.path.realpath(filename)
+        with open(filename) as f:
+            assert f.read() == spec.prefix
+
+    spack.config.set('mirrors', {})
+    stage.destroy()
+    bindist.binary_index.refresh()
+
+
+@pytest.mark.usefixtures('install_mockery')
+@pytest.mark.parametrize('codec', ['pgzip', 'xz'])
+def test_buildcache_compression(mock_archive, tmpdir, codec):
+    if not spack.util.compression.codec_for(codec).available():
+        pytest.skip('%s is not available' % codec)
+
+    spec = Spec('trivial-install-test-package')
+    spec.concretize()
+    pkg = spec.package
+    fake_fetchify(mock_archive.url, pkg)
+    pkg.do_install()
+    filename = os.path.join(spec.prefix, "dummy.txt")
+    with open(filename, "w") as script:
+        script.write(spec.prefix)
+
+    parser = argparse.ArgumentParser()
+    buildcache.setup_parser(parser)
+    mirror_path = str(tmpdir.join('mirror'))
+    args = parser.parse_args(
+        ['create', '-d', mirror_path, '-u', '-c', codec, str(spec)])
+    buildcache.buildcache(parser, args)
+
+    # The codec is recorded in spec.yaml
+    specfile = os.path.join(mirror_path, 'build_cache',
+                            bindist.tarball_name(spec, '.spec.yaml'))
+    with open(specfile) as f:
+        assert syaml.load(f)['binary_cache_compression'] == codec
+
+    # ...and used to install the package
+    mirror_url = 'file://' + mirror_path
+    spack.config.set('mirrors', {'test': mirror_url})
+    stage = spack.stage.Stage(mirror_url, name="build_cache", keep=True)
+    stage.create()
+
+    pkg.do_uninstall(force=True)
+    args = parser.parse_args(['install', '-u', str(spec)])
+    buildcache.install_tarball(spec, args)
+    with open(filename) as f:
+        assert f.read() == spec.prefix
+
+    spack.config.set('mirrors', {})
+    stage.destroy()
+    bindist.binary_index.refresh()
+
+
+@pytest.mark.usefixtures('install_mockery')
+def test_buildcache_index(mock_archive, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+
+    spec = Spec('trivial-install-test-package')
+    spec.concretize()
+    pkg = spec.package
+    fake_fetchify(mock_archive.url, pkg)
+    pkg.do_install()
+
+    parser = argparse.ArgumentParser()
+    buildcache.setup_parser(parser)
+    mirror_path = str(tmpdir.join('mirror'))
+    args = parser.parse_args(['create', '-d', mirror_path, '-u', str(spec)])
+    buildcache.buildcache(parser, args)
+
+    # The index has the contents of the spec.yaml, and its checksum
+    build_cache_dir = os.path.join(mirror_path, 'build_cache')
+    index_path = os.path.join(build_cache_dir, 'index.json.gz')
+    with open(index_path, 'rb') as f:
+        data = f.read()
+    with open(os.path.join(build_cache_dir, 'index.json.hash')) as f:
+        assert f.read() == hashlib.sha256(data).hexdigest()
+    specfile_name = bindist.tarball_name(spec, '.spec.yaml')
+    specs = bindist._load_spec_index(data)['specs']
+    assert list(specs) == [specfile_name]
+
+    # Regenerating it gives the same index
+    bindist.generate_package_index(build_cache_dir)
+    with open(index_path, 'rb') as f:
+        assert f.read() == data
+
+    # Specs are read from the index, without listing the build cache
+    def no_spider(*args, **kwargs):
+        raise AssertionError('the build cache should not be spidered')
+    monkeypatch.setattr(bindist, '_spider_specs', no_spider)
+    os.remove(os.path.join(build_cache_dir, specfile_name))
+    spack.config.set('mirrors', {'test': 'file://' + mirror_path})
+    bindist.binary_index.refresh()
+    assert [s.dag_hash() for s in bindist.get_specs()] == [spec.dag_hash()]
+
+    # ...and then from the local copy of the index
+    os.remove(index_path)
+    bindist.binary_index.refresh()
+    assert [s.dag_hash() for s in bindist.get_specs()] == [spec.dag_hash()]
+
+    # Without an index, the spec.yaml files are read
+    monkeypatch.undo()
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+    os.remove(os.path.join(build_cache_dir, 'index.json.hash'))
+    bindist.binary_index.refresh()
+    assert bindist.get_specs() == []
+
+    spack.config.set('mirrors', {})
+    bindist.binary_index.refresh()
+
+
+@pytest.mark.usefixtures('install_mockery')
+def test_binary_index(mock_archive, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+
+    spec = Spec('trivial-install-test-package')
+    spec.concretize()
+    pkg = spec.package
+    fake_fetchify(mock_archive.url, pkg)
+    pkg.do_install()
+
+    parser = argparse.ArgumentParser()
+    buildcache.setup_parser(parser)
+    mirror_path = str(tmpdir.join('mirror'))
+    args = parser.parse_args(['create', '-d', mirror_path, '-u', str(spec)])
+    buildcache.buildcache(parser, args)
+
+    mirror_url = 'file://' + mirror_path
+    mirrors = {'test': mirror_url}
+    spack.config.set('mirrors', mirrors)
+    index = bindist.BinaryCacheIndex()
+    found = index.find(spec)
+    assert [(url, s.dag_hash()) for url, s in found] == \
+        [(mirror_url, spec.dag_hash())]
+
+    # The specs of the mirror are reused until they expire...
+    index_path = os.path.join(mirror_path, 'build_cache', 'index.json.gz')
+    os.rename(index_path, index_path + '.bak')
+    assert index.find(spec)
+    assert not index.find(spec, mirrors={'other': 'file://' + str(tmpdir)})
+
+    # ...or are refreshed
+    spack.config.set('config:binary_index_ttl', 0)
+    os.rename(index_path + '.bak', index_path)
+    assert index.find(spec)
+    spack.config.set('config:binary_index_ttl', 600)
+    shutil.rmtree(mirror_path)
+    assert index.find(spec)
+    index.refresh(mirror_url)
+    assert not index.find(spec)
+
+    spack.config.set('mirrors', {})
+
+
+@pytest.mark.usefixtures('install_mockery')
+def test_needs_rebuild_from_index(mock_archive, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        FileCache(str(tmpdir.join('cache'))))
+
+    spec = Spec('trivial-install-test-package')
+    spec.concretize()
+    pkg = spec.package
+    fake_fetchify(mock_archive.url, pkg)
+    pkg.do_install()
+    other = Spec('trivial-install-test-package@0:')
+    other.concretize()
+    other._hash = 'x' * 32
+
+    parser = argparse.ArgumentParser()
+    buildcache.setup_parser(parser)
+    mirror_path = str(tmpdir.join('mirror'))
+    args = parser.parse_args(['create', '-d', mirror_path, '-u', str(spec)])
+    buildcache.buildcache(parser, args)
+
+    mirror_url = 'file://' + mirror_path
+    bindist.binary_index.refresh()
+
+    # With an index, no spec.yaml is read, and specs missing from it
+    # need to be rebuilt
+    os.remove(os.path.join(mirror_path, 'build_cache',
+                           bindist.tarball_name(spec, '.spec.yaml')))
+    assert not bindist.needs_rebuild(spec, mirror_url)
+    assert bindist.needs_rebuild(other, mirror_url)
+    assert bindist.check_specs_against_mirrors(
+        {'test': mirror_url}, [spec]) == 0
+    assert bindist.check_specs_against_mirrors(
+        {'test': mirror_url}, [spec, other]) == 1
+
+    # Without an index, only the spec.yaml of the spec is read
+    def no_spider(*args, **kwargs):
+        raise AssertionError('the build cache should not be listed')
+    monkeypatch.setattr(bindist, '_spider_specs', no_spider)
+    args = parser.parse_args(
+        ['create', '-d', mirror_path, '-u', '-f', str(spec)])
+    buildcache.buildcache(parser, args)
+    os.remove(os.path.join(mirror_path, 'build_cache', 'index.json.hash'))
+    bindist.binary_index.refresh()
+    assert not bindist.needs_rebuild(spec, mirror_url)
+
+    bindist.binary_index.refresh()
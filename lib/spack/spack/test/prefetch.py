@@ -0,0 +1,89 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+import llnl.util.tty as tty
+
+import spack.prefetch
+from spack.spec import Spec
+
+
+@pytest.mark.usefixtures('install_mockery', 'mock_fetch')
+def test_prefetch_dag():
+    spec = Spec('mpileaks')
+    spec.concretize()
+
+    results = spack.prefetch.prefetch([spec])
+
+    names = set(s.name for s in spec.traverse())
+    assert set(r.name for r in results) == names
+    assert all(not r.error and r.nbytes > 0 for r in results)
+
+    # The sources are in the stages, and are not fetched again
+    assert spack.prefetch._packages_to_fetch([spec], False) == []
+    for s in spec.traverse():
+        assert s.package.stage.archive_file
+        s.package.stage.destroy()
+
+
+@pytest.mark.usefixtures('install_mockery', 'mock_fetch')
+def test_prefetch_skips_installed():
+    spec = Spec('mpileaks')
+    spec.concretize()
+    spec['callpath'].package.do_install(fake=True)
+
+    todo = spack.prefetch._packages_to_fetch([spec], False)
+    assert set(s.name for host, s in todo) == set(['mpileaks'])
+
+
+def test_prefetch_reports_exits(monkeypatch):
+    def die(*args, **kwargs):
+        tty.die('Insufficient permissions')
+    monkeypatch.setattr(spack.prefetch.Spec, 'from_dict', staticmethod(die))
+    monkeypatch.setattr(tty, '_msg_enabled', tty.msg_enabled())
+
+    # A worker that dies still reports a result, or _fetch_all would hang
+    result = spack.prefetch._fetch_package(('a', {}, 'a.org', False))
+    assert result.name == 'a' and result.host == 'a.org'
+    assert result.error == 'exited with status 1'
+
+
+def test_prefetch_host_limits(monkeypatch):
+    lock = threading.Lock()
+    running = {}
+    most = {}
+
+    def fetch(args):
+        name, spec_dict, host, mirror_only = args
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            most[host] = max(most.get(host, 0), running[host])
+            most['all'] = max(most.get('all', 0), sum(running.values()))
+        time.sleep(0.05)
+        with lock:
+            running[host] -= 1
+        return spack.prefetch.PrefetchResult(name, host, 1, 0.05)
+
+    class FakeSpec(object):
+        def __init__(self, name):
+            self.name = name
+
+        def to_dict(self):
+            return {}
+
+    monkeypatch.setattr(spack.prefetch.multiprocessing, 'Pool', ThreadPool)
+    monkeypatch.setattr(spack.prefetch, '_fetch_package', fetch)
+    todo = [('a.org', FakeSpec('a%d' % i)) for i in range(6)]
+    todo += [('b.org', FakeSpec('b%d' % i)) for i in range(2)]
+
+    results = spack.prefetch._fetch_all(todo, 3, 2, False)
+    assert sorted(r.name for r in results) == sorted(s.name for h, s in todo)
+    assert most['a.org'] == 2
+    assert most['all'] == 3
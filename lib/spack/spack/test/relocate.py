@@ -3,9 +3,11 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import multiprocessing
 import os.path
 import platform
 import shutil
+import sys
 
 import pytest
 
@@ -45,9 +47,7 @@ def source_file(tmpdir, is_relocatable):
     return src
 
 
-@pytest.mark.requires_executables(
-    '/usr/bin/gcc', 'patchelf', 'strings', 'file'
-)
+@pytest.mark.requires_executables('/usr/bin/gcc')
 def test_file_is_relocatable(source_file, is_relocatable):
     compiler = spack.util.executable.Executable('/usr/bin/gcc')
     executable = str(source_file).replace('.c', '.x')
@@ -78,3 +78,109 @@ def test_file_is_relocatable_errors(tmpdir):
         with pytest.raises(ValueError) as exc_info:
             spack.relocate.file_is_relocatable('delete.me')
         assert 'is not an absolute path' in str(exc_info.value)
+
+
+@pytest.fixture(params=[True, False])
+def parallel(request, monkeypatch):
+    """Relocates files with a pool of processes, or without."""
+    if request.param:
+        monkeypatch.setattr(spack.relocate, 'min_parallel_relocation_files', 1)
+        monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 4)
+    return request.param
+
+
+def test_relocate_text_files(tmpdir, parallel):
+    old_dir, new_dir = '/home/spack/opt/spack', '/opt/rh/devtoolset'
+    contents = [
+        '#!/bin/bash {0}/bin/sbang\n'.format(old_dir),
+        'prefix={0}/bin\n'.format(old_dir),
+        'unrelated line\n',
+        'no trailing newline {0}'.format(old_dir),
+    ]
+
+    path_names = []
+    for i in range(8):
+        path_name = tmpdir.join('script%d.sh' % i)
+        path_name.write(''.join(contents))
+        path_name.chmod(0o755)
+        path_names.append(str(path_name))
+    # files are edited in place, so hardlinks are not split
+    os.link(path_names[0], str(tmpdir.join('hardlink.sh')))
+    inode = os.stat(path_names[0]).st_ino
+    untouched = tmpdir.join('untouched.txt')
+    untouched.write('nothing to relocate\n')
+    path_names.append(str(untouched))
+    mtime = os.stat(str(untouched)).st_mtime
+
+    spack.relocate.relocate_text(path_names, oldpath=old_dir,
+                                 newpath=new_dir, oldprefix=old_dir,
+                                 newprefix=new_dir)
+
+    for path_name in path_names[:-1]:
+        with open(path_name) as f:
+            assert f.read() == ''.join(contents).replace(old_dir, new_dir)
+        assert os.stat(path_name).st_mode & 0o777 == 0o755
+    assert os.stat(str(untouched)).st_mtime == mtime
+    assert os.stat(path_names[0]).st_ino == inode
+    assert tmpdir.join('hardlink.sh').read() == ''.join(contents).replace(
+        old_dir, new_dir)
+    assert sorted(os.listdir(str(tmpdir))) == sorted(
+        [os.path.basename(p) for p in path_names] + ['hardlink.sh'])
+
+
+def test_relocation_errors_are_raised(parallel):
+    # Workers that exit, e.g. with tty.die, must not hang the pool
+    with pytest.raises(SystemExit):
+        spack.relocate._map_files(sys.exit, range(4))
+
+    assert spack.relocate._map_files(abs, [-1, 2]) == [1, 2]
+
+
+def test_replace_prefix_bin(tmpdir):
+    old_dir, new_dir = b'/home/spack/opt/spack', b'/opt/spack'
+    data = (b'\x7fELF\0' + old_dir + b'/lib:' + old_dir + b'/lib64\0\x01' +
+            b'/usr/lib\0' + old_dir + b'\0')
+    binary = tmpdir.join('binary')
+    binary.write(data, mode='wb')
+
+    spack.relocate.replace_prefix_bin(str(binary), old_dir, new_dir)
+    padding = b'\0' * (len(old_dir) - len(new_dir))
+    assert binary.read(mode='rb') == (
+        b'\x7fELF\0' + new_dir + b'/lib:' + new_dir + b'/lib64' +
+        padding * 2 + b'\0\x01/usr/lib\0' + new_dir + padding + b'\0')
+
+    # Longer prefixes are left alone, and so are empty files
+    spack.relocate.replace_prefix_bin(str(binary), new_dir, old_dir + b'/x')
+    assert len(binary.read(mode='rb')) == len(data)
+    empty = tmpdir.join('empty')
+    empty.write('')
+    spack.relocate.replace_prefix_bin(str(empty), old_dir, new_dir)
+
+
+@pytest.mark.skipif(
+    platform.system().lower() != 'linux', reason='ELF binaries only'
+)
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_relocate_elf_binaries(tmpdir, parallel):
+    old_dir = str(tmpdir.join('old', 'opt', 'spack'))
+    new_dir = str(tmpdir.join('new'))
+    source = tmpdir.join('main.c')
+    source.write('const char* p = "%s/share"; int main(){ return 0; }' %
+                 old_dir)
+
+    compiler = spack.util.executable.Executable('/usr/bin/gcc')
+    path_names = []
+    for i in range(4):
+        binary = str(tmpdir.join('hello%d' % i))
+        compiler(str(source), '-o', binary,
+                 '-Wl,-rpath,%s/lib:/usr/lib' % old_dir)
+        path_names.append(binary)
+
+    spack.relocate.relocate_binary(path_names, old_dir, new_dir, False)
+
+    for binary in path_names:
+        assert spack.relocate.get_existing_elf_rpaths(binary) == [
+            new_dir + '/lib', '/usr/lib']
+        assert not spack.relocate.strings_contains_installroot(
+            binary, old_dir)
+        spack.util.executable.Executable(binary)()
@@ -6,8 +6,12 @@
 import os
 import pytest
 
-import spack.repo
+import spack.caches
+import spack.config
+import spack.patch
 import spack.paths
+import spack.repo
+import spack.util.file_cache
 
 
 # Unlike the repo_path fixture defined in conftest, this has a test-level
@@ -64,3 +68,143 @@ def test_repo_last_mtime():
     latest_mtime = max(os.path.getmtime(p.module.__file__)
                        for p in spack.repo.path.all_packages())
     assert spack.repo.path.last_mtime() == latest_mtime
+
+
+def _build_repo_index(cache_dir, jobs, monkeypatch):
+    """Build the indexes of the mock repo from scratch in ``cache_dir``."""
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(str(cache_dir)))
+    repo = spack.repo.Repo(spack.paths.mock_packages_path)
+    with spack.config.override('config:repo_index_jobs', jobs):
+        return (repo.provider_index, repo.tag_index, repo.patch_index)
+
+
+@pytest.mark.usefixtures('mock_packages', 'config')
+def test_parallel_repo_index_matches_serial(tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.repo, 'min_parallel_index_packages', 1)
+
+    providers, tags, patches = _build_repo_index(
+        tmpdir.join('serial'), 1, monkeypatch)
+    par_providers, par_tags, par_patches = _build_repo_index(
+        tmpdir.join('parallel'), 4, monkeypatch)
+
+    assert providers == par_providers
+    assert dict(tags) == dict(par_tags)
+    assert patches.index == par_patches.index
+
+    # sanity check that the mock repo has something in each index
+    assert 'mpi' in providers
+    assert tags
+    assert patches.index
+
+
+def test_package_checker_persists_stats(tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(
+                            str(tmpdir.join('cache'))))
+    monkeypatch.setattr(spack.repo.FastPackageChecker, '_paths_cache', {})
+    monkeypatch.setattr(spack.repo.FastPackageChecker, '_last_mtimes', {})
+
+    packages = tmpdir.ensure('packages', dir=True)
+    for i, name in enumerate(['a', 'b', 'c']):
+        pkg_file = packages.ensure(name, 'package.py')
+        pkg_file.setmtime(1000 + i)
+        packages.join(name).setmtime(1000)
+
+    checker = spack.repo.FastPackageChecker(str(packages))
+    assert dict(checker) == {'a': 1000, 'b': 1001, 'c': 1002}
+    assert checker.last_mtime() == 1002
+
+    # Rewrite one package and count the stats in a new process
+    spack.repo.FastPackageChecker._paths_cache.clear()
+    packages.join('b', 'package.py').setmtime(2000)
+    packages.join('b').setmtime(2000)
+
+    stat_calls = []
+    real_stat = os.stat
+
+    def _stat(path, *args, **kwargs):
+        stat_calls.append(str(path))
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'stat', _stat)
+    checker = spack.repo.FastPackageChecker(str(packages))
+    assert dict(checker) == {'a': 1000, 'b': 2000, 'c': 1002}
+    assert checker.last_mtime() == 2000
+
+    pkg_file_stats = [p for p in stat_calls if p.endswith('package.py')]
+    assert pkg_file_stats == [str(packages.join('b', 'package.py'))]
+
+
+@pytest.mark.usefixtures('mock_packages', 'config')
+def test_repo_index_sections_are_read_lazily(tmpdir, monkeypatch):
+    providers, _, _ = _build_repo_index(tmpdir, 1, monkeypatch)
+
+    def _fail(*args, **kwargs):
+        raise AssertionError('unneeded index was read')
+
+    # Reading the cached providers must not load packages or other indexes
+    monkeypatch.setattr(spack.repo, '_package_index_entries', _fail)
+    monkeypatch.setattr(spack.repo.TagIndex, 'from_json', _fail)
+    monkeypatch.setattr(spack.patch.PatchCache, 'from_json', _fail)
+
+    repo = spack.repo.Repo(spack.paths.mock_packages_path)
+    assert repo.provider_index == providers
+
+
+@pytest.mark.usefixtures('mock_packages', 'config')
+def test_repo_index_with_other_version_is_rebuilt(tmpdir, monkeypatch):
+    providers, tags, _ = _build_repo_index(tmpdir, 1, monkeypatch)
+
+    monkeypatch.setattr(spack.repo, 'repo_index_format_version', 2)
+    assert _build_repo_index(tmpdir, 1, monkeypatch)[0] == providers
+
+    index_file = tmpdir.join('indexes', 'builtin.mock-index.bin')
+    with index_file.open('rb') as f:
+        assert set(spack.repo.RepoIndexFile(f).sections) == set(
+            ['providers', 'tags', 'patches'])
+
+    # Garbage is regenerated too
+    index_file.write('garbage')
+    _, new_tags, _ = _build_repo_index(tmpdir, 1, monkeypatch)
+    assert dict(new_tags) == dict(tags)
+
+
+@pytest.mark.usefixtures('config')
+def test_empty_repo_index(tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(
+                            str(tmpdir.join('cache'))))
+    root, _ = spack.repo.create_repo(str(tmpdir.join('repo')), 'empty')
+
+    repo = spack.repo.Repo(root)
+    assert not repo.provider_index.providers
+    assert not repo.tag_index
+
+    # The empty indexes are cached, and read back the next time
+    repo = spack.repo.Repo(root)
+    assert not repo.provider_index.providers
+    assert tmpdir.join('cache', 'indexes', 'empty-index.bin').check()
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.usefixtures('config')
+def test_repo_index_reports_package_errors(tmpdir, monkeypatch, jobs):
+    monkeypatch.setattr(spack.repo, 'min_parallel_index_packages', 1)
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(
+                            str(tmpdir.join('cache'))))
+    root, _ = spack.repo.create_repo(str(tmpdir.join('repo')), 'broken')
+    for name in ('pkg1', 'pkg2', 'pkg3'):
+        tmpdir.join('repo', 'packages', name, 'package.py').write(
+            'from spack import *\n\n\nclass %s(Package):\n    pass\n'
+            % name.capitalize(), ensure=True)
+
+    # A package that makes get_pkg_class() die must not hang the workers
+    tmpdir.join('repo', 'packages', 'pkg2', 'package.py').write('Pkg2 = 42\n')
+
+    repo = spack.repo.Repo(root)
+    with spack.repo.swap(spack.repo.RepoPath(repo)):
+        with spack.config.override('config:repo_index_jobs', jobs):
+            with pytest.raises(SystemExit):
+                repo.provider_index
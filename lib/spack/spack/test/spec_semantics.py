@@ -13,8 +13,10 @@ from spack.variant import InvalidVariantValueError
 from spack.variant import MultipleValuesInExclusiveVariantError
 
 import spack.architecture
+import spack.config
 import spack.directives
 import spack.error
+import spack.spec
 
 
 def make_spec(spec_like, concrete):
@@ -943,3 +945,29 @@ class TestSpecSematics(object):
 
         with pytest.raises(SpecError):
             spec.prefix
+
+    def test_memoized_checks(self):
+        with spack.spec.memoized_checks() as cache:
+            spec = Spec('libelf@0.8:')
+            assert spec.satisfies('libelf@0.8.13', deps=False)
+            assert spec.satisfies('libelf@0.8.13', deps=False)
+            assert cache.hits['satisfies'] == 1
+            assert cache.misses['satisfies'] == 1
+
+            assert spec.constrain('libelf@:0.8.13')
+            assert not spec.constrain('libelf@:0.8.13')
+            assert cache.hits['constrain'] == 1
+            assert cache.hit_rate('constrain') == 0.5
+
+            # Mutated specs are not answered with stale results
+            assert not spec.satisfies('libelf@0.8.14', deps=False)
+            assert spec.constrain('libelf@0.8.13')
+            assert not spec.satisfies('libelf@0.8.10', deps=False)
+            check_invalid_constraint('libelf@0.8.13', 'libelf@0.8.10')
+
+        assert spack.spec._check_cache is None
+
+    def test_memoized_concretization(self):
+        expected = Spec('mpileaks ^mpich').concretized()
+        with spack.config.override('config:memoize_spec_checks', True):
+            assert Spec('mpileaks ^mpich').concretized() == expected
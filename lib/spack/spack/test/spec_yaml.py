@@ -8,10 +8,14 @@
 YAML format preserves DAG information in the spec.
 
 """
+import base64
+import hashlib
 import os
 
 from collections import Iterable, Mapping
 
+import pytest
+
 import spack.util.spack_json as sjson
 import spack.util.spack_yaml as syaml
 from spack import repo
@@ -237,3 +241,44 @@ def test_save_dependency_spec_yamls_subset(tmpdir, config):
 
         assert check_specs_equal(b_spec, os.path.join(output_path, 'b.yaml'))
         assert check_specs_equal(c_spec, os.path.join(output_path, 'c.yaml'))
+
+
+def _reference_dag_hash(spec):
+    """DAG hash computed by dumping the node dict with ruamel.yaml."""
+    yaml_text = syaml.dump(spec.to_node_dict(), default_flow_style=True,
+                           width=syaml._flow_width)
+    sha = hashlib.sha1(yaml_text.encode('utf-8'))
+    return base64.b32encode(sha.digest()).lower().decode('utf-8')
+
+
+@pytest.mark.parametrize('abstract', [
+    'mpileaks ^zmpi', 'mpileaks cflags=-O3 ldflags="-g -Wl,-z"',
+    'multivalue_variant foo=bar,baz', 'externaltool',
+    'patch-several-dependencies', 'dep-diamond-patch-top', 'dttop',
+    'hash-test1@1.2', 'mixedversions@1.0.1', 'python'
+])
+def test_dag_hash_matches_yaml_dump(abstract, config, mock_packages):
+    spec = Spec(abstract).concretized()
+    for s in spec.traverse():
+        s._hash = None
+        assert s.dag_hash() == _reference_dag_hash(s)
+
+    # hashes survive copies that keep link and run dependencies
+    copy = spec.copy(deps=('link', 'run'))
+    assert all(s._hash for s in copy.traverse())
+    assert copy.dag_hash() == spec.dag_hash()
+
+
+@pytest.mark.parametrize('data', [
+    syaml_dict([('b', 1), ('a', [True, None, 'x86_64', '1.2', '1.2.3'])]),
+    {'b': {'yes': 'no'}, 'a': ['', '0x1f', '1e5', '2019-01-02', 'a: b']},
+    syaml_dict([('mpileaks', syaml_dict([
+        ('version', '2.3'), ('dependencies', syaml_dict([
+            ('mpich', syaml_dict([
+                ('hash', '2e2222222222222222222222222222222'),
+                ('type', ['link'])]))]))]))]),
+    syaml_dict([('', 'empty key'), ('1.2', '?a')]),
+])
+def test_dump_flow(data):
+    assert syaml.dump_flow(data) == syaml.dump(
+        data, default_flow_style=True, width=syaml._flow_width)
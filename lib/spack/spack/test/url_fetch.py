@@ -10,12 +10,14 @@ from llnl.util.filesystem import working_dir, is_exe
 
 import spack.repo
 import spack.config
-from spack.fetch_strategy import FailedDownloadError
+from spack.fetch_strategy import FailedDownloadError, ChecksumError
 from spack.fetch_strategy import from_list_url, URLFetchStrategy
+from spack.fetch_strategy import FsCache, link_or_copy
 from spack.spec import Spec
 from spack.stage import Stage
 from spack.version import ver
 import spack.util.crypto as crypto
+import spack.util.executable
 
 
 @pytest.fixture(params=list(crypto.hashes.keys()))
@@ -170,3 +172,97 @@ def test_url_extra_fetch(tmpdir, mock_archive):
         stage.fetch()
         assert fetcher.archive_file is not None
         fetcher.fetch()
+
+
+@pytest.mark.parametrize('method', ['urllib', 'curl'])
+def test_fetch_checksum_while_downloading(
+        tmpdir, mock_archive, monkeypatch, method):
+    """The archive is read again to check it only if it was not checksummed
+    while it was downloaded."""
+    checksum = crypto.checksum(crypto.hash_fun_for_algo('sha256'),
+                               mock_archive.archive_file)
+    reads = []
+    real_checksum = crypto.checksum
+
+    def counting_checksum(*args, **kwargs):
+        reads.append(args[1])
+        return real_checksum(*args, **kwargs)
+    monkeypatch.setattr(crypto, 'checksum', counting_checksum)
+
+    fetcher = URLFetchStrategy(mock_archive.url, checksum)
+    with spack.config.override('config:url_fetch_method', method):
+        with Stage(fetcher, path=str(tmpdir)):
+            fetcher.fetch()
+            fetcher.check()
+            assert len(reads) == (1 if method == 'curl' else 0)
+
+            # a modified archive is read again, and fails
+            with open(fetcher.archive_file, 'ab') as f:
+                f.write(b'garbage')
+            with pytest.raises(ChecksumError):
+                fetcher.check()
+            assert reads[-1] == fetcher.archive_file
+
+
+def test_fetch_curl_by_default(tmpdir, mock_archive, monkeypatch):
+    """Archives are downloaded with curl unless urllib is asked for."""
+    def no_urllib(*args, **kwargs):
+        raise AssertionError('archives should be fetched with curl')
+    monkeypatch.setattr(URLFetchStrategy, '_fetch_urllib', no_urllib)
+
+    fetcher = URLFetchStrategy(mock_archive.url)
+    with Stage(fetcher, path=str(tmpdir)):
+        fetcher.fetch()
+        assert fetcher.archive_file is not None
+
+
+def test_fetch_curl_options(tmpdir, mock_archive, monkeypatch):
+    """Archives with curl options are downloaded with curl, which gets
+    the options, whatever the url_fetch_method."""
+    curl_args = []
+    real_call = spack.util.executable.Executable.__call__
+
+    def recording_call(self, *args, **kwargs):
+        curl_args.extend(args)
+        return real_call(self, *args, **kwargs)
+    monkeypatch.setattr(
+        spack.util.executable.Executable, '__call__', recording_call)
+
+    fetcher = URLFetchStrategy(mock_archive.url, curl_options=['-j'])
+
+    with spack.config.override('config:url_fetch_method', 'urllib'):
+        with Stage(fetcher, path=str(tmpdir)):
+            fetcher.fetch()
+            assert fetcher.archive_file is not None
+
+    assert curl_args[-1] == '-j'
+
+
+def test_fetch_cache_links_archives(tmpdir, mock_archive):
+    """Expanded archives are linked into the fetch cache, not copied."""
+    fetcher = URLFetchStrategy(mock_archive.url)
+    cache = FsCache(str(tmpdir.join('cache')))
+    with Stage(fetcher, path=str(tmpdir.join('stage'))):
+        fetcher.fetch()
+        fetcher.digest = 'abc'  # make it cachable
+        cache.store(fetcher, 'test/archive.tar.gz')
+        # storing again replaces the cached archive
+        cache.store(fetcher, 'test/archive.tar.gz')
+
+        cached = str(tmpdir.join('cache', 'test', 'archive.tar.gz'))
+        assert os.path.samefile(cached, fetcher.archive_file)
+
+
+def test_link_or_copy_falls_back_to_copy(tmpdir, monkeypatch):
+    src = tmpdir.join('src')
+    src.write('data')
+
+    def no_link(src, dest):
+        raise OSError('cross-device link')
+    monkeypatch.setattr(os, 'link', no_link)
+
+    dest = str(tmpdir.join('dest'))
+    link_or_copy(str(src), dest)
+    assert not os.path.samefile(str(src), dest)
+    with open(dest) as f:
+        assert f.read() == 'data'
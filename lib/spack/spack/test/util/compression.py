@@ -0,0 +1,82 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Test Spack's compression codecs for tarballs."""
+import gzip
+import io
+import os
+import tarfile
+from contextlib import closing
+
+import pytest
+
+import spack.util.compression as compression
+
+
+@pytest.fixture(params=list(compression.codecs))
+def codec(request):
+    """Returns each compression codec available here."""
+    codec = compression.codec_for(request.param)
+    if not codec.available():
+        pytest.skip('%s is not available' % request.param)
+    return codec
+
+
+@pytest.fixture()
+def source_dir(tmpdir):
+    """Returns a directory with a few files to be archived."""
+    source = tmpdir.join('source')
+    source.ensure(dir=True)
+    for i in range(5):
+        source.join('file%d' % i).write(os.urandom(1000) * (i + 1) * 200,
+                                        mode='wb')
+    source.join('subdir', 'text.txt').write('some text\n' * 1000,
+                                            ensure=True)
+    return source
+
+
+def test_codec_round_trip(codec, source_dir, tmpdir, monkeypatch):
+    # Use small chunks for parallel gzip, to have many of them
+    monkeypatch.setattr(compression, 'parallel_gzip_chunk_size', 4096)
+
+    tarball = str(tmpdir.join('archive' + codec.extension))
+    with open(tarball, 'wb') as f:
+        with closing(codec.compressor(f)) as stream:
+            with closing(tarfile.open(mode='w|', fileobj=stream)) as tar:
+                tar.add(str(source_dir), arcname='source')
+
+    dest = tmpdir.join('dest')
+    codec.extract(tarball, str(dest))
+
+    for path in source_dir.visit():
+        copy = dest.join('source', path.relto(source_dir))
+        assert copy.check(dir=path.check(dir=True))
+        if path.check(file=True):
+            assert copy.read(mode='rb') == path.read(mode='rb')
+
+
+def test_parallel_gzip_is_gzip():
+    data = os.urandom(10000) + b'abc' * 100000
+    output = io.BytesIO()
+    writer = compression.ParallelGzipWriter(
+        output, jobs=3, chunk_size=1000)
+    for i in range(0, len(data), 777):
+        writer.write(data[i:i + 777])
+    writer.close()
+    writer.close()
+
+    with closing(gzip.GzipFile(fileobj=io.BytesIO(output.getvalue()))) as f:
+        assert f.read() == data
+
+    # Empty input still gives a valid gzip file
+    output = io.BytesIO()
+    compression.ParallelGzipWriter(output).close()
+    with closing(gzip.GzipFile(fileobj=io.BytesIO(output.getvalue()))) as f:
+        assert f.read() == b''
+
+
+def test_unknown_codec():
+    with pytest.raises(compression.CodecError):
+        compression.codec_for('rar')
@@ -0,0 +1,153 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Test Spack's in-process ELF inspection."""
+import os
+import struct
+
+import pytest
+
+import spack.util.elf as elf
+from spack.util.executable import Executable
+
+
+@pytest.fixture()
+def hello_world(tmpdir, monkeypatch):
+    """Returns a function compiling a hello world program."""
+    # the linker would add it to the RPATHs of the program
+    monkeypatch.delenv('LD_RUN_PATH', raising=False)
+    # other tests leave Spack's compiler wrappers, which add RPATHs too,
+    # in PATH, where gcc looks for the linker
+    monkeypatch.setenv('PATH', '/usr/bin:/bin')
+    source = tmpdir.join('main.c')
+    source.write('int main(){ return 0; }\n')
+
+    def _compile(name, *flags):
+        output = str(tmpdir.join(name))
+        gcc = Executable('/usr/bin/gcc')
+        gcc(str(source), '-o', output, *flags)
+        return output
+
+    return _compile
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+@pytest.mark.parametrize('flags,rpath,runpath', [
+    ([], None, None),
+    (['-Wl,-rpath,/foo/lib:/bar/lib', '-Wl,--disable-new-dtags'],
+     '/foo/lib:/bar/lib', None),
+    (['-Wl,-rpath,/foo/lib', '-Wl,--enable-new-dtags'], None, '/foo/lib'),
+])
+def test_read_elf_rpaths(hello_world, flags, rpath, runpath):
+    binary = hello_world('hello', *flags)
+    parsed = elf.read_elf(binary)
+
+    assert parsed.elf_type in (2, 3)
+    assert parsed.is_64_bit == (struct.calcsize('P') == 8)
+    assert (parsed.rpath and parsed.rpath.value) == rpath
+    assert (parsed.runpath and parsed.runpath.value) == runpath
+    search_path = runpath or rpath
+    assert parsed.rpaths == (search_path.split(':') if search_path else [])
+
+    # Offsets point into the file
+    entry = parsed.rpath or parsed.runpath
+    if entry:
+        with open(binary, 'rb') as f:
+            f.seek(entry.offset)
+            assert f.read(len(entry.value)) == entry.value.encode('utf-8')
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_file_type(hello_world, tmpdir):
+    binary = hello_world('hello')
+    assert elf.file_type(binary) == ('application', 'x-executable') or \
+        elf.file_type(binary) == ('application', 'x-sharedlib')
+
+    library = hello_world('libhello.so', '-shared', '-fPIC')
+    assert elf.file_type(library) == ('application', 'x-sharedlib')
+
+    files = {
+        'script.sh': (b'#!/bin/bash\necho hi\n', ('text', 'x-script')),
+        'notes.txt': (u'caf\xe9\n'.encode('utf-8'), ('text', 'plain')),
+        'empty': (b'', ('inode', 'x-empty')),
+        'data.bin': (b'\x00\x01\x02binary', ('application', 'octet-stream')),
+        'corrupt.so': (b'\x7fELF\x02\x01', ('application', 'octet-stream')),
+        'mach.dylib': (b'\xcf\xfa\xed\xfe' + b'\0' * 64,
+                       ('application', 'x-mach-binary')),
+        'fat.dylib': (b'\xca\xfe\xba\xbe\0\0\0\x02' + b'\0' * 64,
+                      ('application', 'x-mach-binary')),
+        'Hello.class': (b'\xca\xfe\xba\xbe\0\0\0\x34' + b'\0' * 64,
+                        ('application', 'octet-stream')),
+        'short.bin': (b'\xca\xfe\xba\xbe\0\0',
+                      ('application', 'octet-stream')),
+    }
+    for name, (contents, mime) in files.items():
+        path = tmpdir.join(name)
+        path.write(contents, mode='wb')
+        assert elf.file_type(str(path)) == mime
+
+    os.symlink(binary, str(tmpdir.join('link')))
+    assert elf.file_type(str(tmpdir.join('link'))) == ('inode', 'symlink')
+    assert elf.file_type(str(tmpdir)) == ('inode', 'directory')
+
+
+def test_find_strings():
+    data = b'\0\x01/foo/bar/lib\0some text with /foo/bar in it\n/foo/baz'
+    assert list(elf.find_strings(data, b'/foo/bar')) == [
+        (2, b'/foo/bar/lib'),
+        (15, b'some text with /foo/bar in it'),
+    ]
+    assert list(elf.find_strings(data, b'/foo/baz')) == [(45, b'/foo/baz')]
+    assert list(elf.find_strings(data, b'/nope')) == []
+
+
+def test_contains(tmpdir):
+    path = tmpdir.join('data.bin')
+    path.write(b'\0\0/foo/bar\0', mode='wb')
+
+    assert elf.contains(str(path), b'/nope', b'/foo')
+    assert not elf.contains(str(path), b'/nope')
+
+    empty = tmpdir.join('empty')
+    empty.write('')
+    assert not elf.contains(str(empty), b'/foo')
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+@pytest.mark.parametrize('dtags', [
+    '--disable-new-dtags', '--enable-new-dtags'
+])
+def test_set_rpath_in_place(hello_world, dtags):
+    placeholder = '/' + '@' * 40 + '/lib'
+    binary = hello_world('hello', '-Wl,-rpath,' + placeholder, '-Wl,' + dtags)
+    with open(binary, 'rb') as f:
+        size = len(f.read())
+
+    # A shorter RPATH is written in place, as DT_RPATH
+    assert elf.set_rpath_in_place(binary, '/opt/lib:/usr/lib')
+    parsed = elf.read_elf(binary)
+    assert parsed.rpath.value == '/opt/lib:/usr/lib'
+    assert parsed.runpath is None
+    with open(binary, 'rb') as f:
+        assert len(f.read()) == size
+
+    # The binary still works
+    Executable(binary)()
+
+    # A longer one does not fit
+    assert not elf.set_rpath_in_place(binary, placeholder + '/too/long')
+    assert elf.read_elf(binary).rpath.value == '/opt/lib:/usr/lib'
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_set_rpath_in_place_needs_patchelf(hello_world, tmpdir):
+    # Files without RPATH need a new dynamic entry
+    binary = hello_world('hello')
+    assert not elf.set_rpath_in_place(binary, '/opt/lib')
+
+    text = tmpdir.join('text.txt')
+    text.write('Hello world\n')
+    with pytest.raises(elf.ElfParsingError):
+        elf.set_rpath_in_place(str(text), '/opt/lib')
@@ -3,9 +3,23 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import collections
+import gzip
+import multiprocessing
+import multiprocessing.pool
 import re
 import os
+import shutil
+import struct
+import subprocess
+import tarfile
+import threading
+import zlib
+from contextlib import closing
 from itertools import product
+from ordereddict_backport import OrderedDict
+
+import spack.error
 from spack.util.executable import which
 
 # Supported archive extensions.
@@ -60,3 +74,215 @@ def extension(path):
         if re.search(suffix, path):
             return t
     return None
+
+
+#: Size of the chunks compressed independently by the parallel gzip codec
+parallel_gzip_chunk_size = 1 << 20
+
+# Header of a gzip member with no name and no timestamp (RFC 1952)
+_gzip_header = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+class CodecError(spack.error.SpackError):
+    """Raised when a compression codec fails or is not available."""
+
+
+class Codec(object):
+    """Streaming compression format for tarballs.
+
+    Attributes:
+        name (str): name of the codec, as used in configuration files
+        extension (str): extension of the tarballs it compresses
+    """
+    name = None
+    extension = None
+
+    def available(self):
+        """Whether the codec can be used on this machine."""
+        return True
+
+    def compressor(self, stream):
+        """Return a write-only file object compressing what is written to
+        it into ``stream``.  Closing it flushes the compressed data, but
+        leaves ``stream`` open."""
+        raise NotImplementedError
+
+    def extract(self, path, dest):
+        """Extract the compressed tarball at ``path`` into ``dest``."""
+        with closing(tarfile.open(path, 'r')) as tar:
+            tar.extractall(path=dest)
+
+
+class GzipCodec(Codec):
+    """Plain gzip, compressed on a single core."""
+    name = 'gzip'
+    extension = '.tar.gz'
+
+    def compressor(self, stream):
+        return gzip.GzipFile(filename='', mode='wb', fileobj=stream)
+
+
+class ParallelGzipCodec(Codec):
+    """Gzip compressed by many threads at once.
+
+    The data is cut in chunks, compressed separately as gzip members and
+    concatenated, like ``pigz --independent`` does.  The result is a
+    valid gzip file that any gzip implementation can read.
+    """
+    name = 'pgzip'
+    extension = '.tar.gz'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compressor(self, stream):
+        return ParallelGzipWriter(stream, level=self.level)
+
+
+class ExternalCodec(Codec):
+    """Compression done by an external, multi-threaded executable."""
+
+    def __init__(self, name, extension, compress_args, decompress_args):
+        self.name = name
+        self.extension = extension
+        self.compress_args = compress_args
+        self.decompress_args = decompress_args
+
+    def available(self):
+        return which(self.name) is not None
+
+    def _executable(self):
+        executable = which(self.name)
+        if executable is None:
+            raise CodecError('{0} is required to use {0} compression'
+                             .format(self.name))
+        return executable.path
+
+    def compressor(self, stream):
+        return PipeWriter([self._executable()] + self.compress_args, stream)
+
+    def extract(self, path, dest):
+        command = [self._executable()] + self.decompress_args + [path]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        try:
+            with closing(tarfile.open(fileobj=process.stdout,
+                                      mode='r|')) as tar:
+                tar.extractall(path=dest)
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise CodecError('{0} failed to decompress {1}'
+                             .format(self.name, path))
+
+
+#: Codecs for buildcache tarballs, by name
+codecs = OrderedDict((c.name, c) for c in (
+    GzipCodec(),
+    ParallelGzipCodec(),
+    ExternalCodec('xz', '.tar.xz', ['-T0', '-6', '-c'], ['-dc']),
+    ExternalCodec('zstd', '.tar.zst', ['-T0', '-3', '-q', '-c'],
+                  ['-dcq']),
+))
+
+
+def codec_for(name):
+    """Return the compression codec called ``name``."""
+    if name not in codecs:
+        raise CodecError('unknown compression codec: {0}'.format(name),
+                         'use one of: {0}'.format(', '.join(codecs)))
+    return codecs[name]
+
+
+def _gzip_member(data, level):
+    """Compress ``data`` into a complete gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = compressor.compress(data) + compressor.flush()
+    trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff,
+                          len(data) & 0xffffffff)
+    return _gzip_header + body + trailer
+
+
+class ParallelGzipWriter(object):
+    """Write-only file object compressing chunks of its input in a pool
+    of threads, and writing them in order to ``stream``.
+
+    zlib releases the GIL while it compresses, so this scales with the
+    number of cores.  At most two chunks per thread are kept in memory.
+    """
+
+    def __init__(self, stream, level=6, jobs=None, chunk_size=None):
+        self.stream = stream
+        self.level = level
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size or parallel_gzip_chunk_size
+        self.pool = multiprocessing.pool.ThreadPool(self.jobs)
+        self.pending = collections.deque()
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.chunk_size:
+            self._submit()
+
+    def _submit(self):
+        chunk = b''.join(self.buffer)
+        self.buffer, self.buffered = [], 0
+        self.pending.append(
+            self.pool.apply_async(_gzip_member, (chunk, self.level)))
+        while len(self.pending) > 2 * self.jobs:
+            self.stream.write(self.pending.popleft().get())
+
+    def close(self):
+        if self.pool is None:
+            return
+        try:
+            if self.buffered or not self.pending:
+                self._submit()
+            while self.pending:
+                self.stream.write(self.pending.popleft().get())
+        finally:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+class PipeWriter(object):
+    """Write-only file object piping its input through ``command``, and
+    writing the output to ``stream``."""
+
+    def __init__(self, command, stream):
+        self.command = command
+        self.stream = stream
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.error = None
+        self.thread = threading.Thread(target=self._copy_output)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _copy_output(self):
+        try:
+            shutil.copyfileobj(self.process.stdout, self.stream)
+        except BaseException as e:
+            self.error = e
+
+    def write(self, data):
+        self.process.stdin.write(data)
+
+    def close(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        self.thread.join()
+        self.process.stdout.close()
+        returncode = self.process.wait()
+        self.process = None
+
+        if self.error is not None:
+            raise self.error
+        if returncode != 0:
+            raise CodecError('{0} exited with status {1}'
+                             .format(' '.join(self.command), returncode))
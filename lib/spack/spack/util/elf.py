@@ -0,0 +1,407 @@
+# Copyright 2013-2019 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""In-process inspection of installed files.
+
+Creating or relocating a binary package needs to know, for every file in
+a prefix, whether it is an ELF or Mach-O binary or a text file, what its
+RPATH is, and whether it still mentions the install root.  Running
+``file``, ``strings`` and ``patchelf`` for each of them costs a few
+processes per file, so this module answers the same questions by reading
+the files directly.
+"""
+import mmap
+import os
+import stat
+import struct
+from contextlib import closing, contextmanager
+
+from spack.error import SpackError
+
+#: ELF file types (``e_type``), mapped to the MIME subtypes ``file`` uses
+ELF_SUBTYPES = {
+    1: 'x-object',
+    2: 'x-executable',
+    3: 'x-sharedlib',
+    4: 'x-coredump',
+}
+
+#: Magic numbers of thin Mach-O binaries, in either byte order
+MACHO_MAGICS = (b'\xfe\xed\xfa\xce', b'\xfe\xed\xfa\xcf',
+                b'\xce\xfa\xed\xfe', b'\xcf\xfa\xed\xfe')
+
+#: Magic number of universal Mach-O binaries (and of Java class files)
+MACHO_FAT_MAGIC = b'\xca\xfe\xba\xbe'
+
+# Program header and dynamic section constants
+PT_LOAD = 1
+PT_DYNAMIC = 2
+DT_NULL = 0
+DT_STRTAB = 5
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+#: Number of bytes looked at to tell text from binary data
+HEAD_SIZE = 8192
+
+# Bytes that may appear in text files (same heuristic as ``file``: no
+# NULs and no control characters other than the usual whitespace)
+_text_chars = bytes(bytearray(sorted(
+    set([7, 8, 9, 10, 12, 13, 27]) | set(range(0x20, 0x100)) - set([0x7f]))))
+
+
+class ElfParsingError(SpackError):
+    """Raised when a file looks like ELF but cannot be parsed."""
+
+
+class DynamicString(object):
+    """A string from the dynamic string table of an ELF file.
+
+    Attributes:
+        value (str): the string itself
+        offset (int): offset of the string in the file
+        tag_offset (int): offset in the file of the dynamic entry
+            pointing to the string
+    """
+    def __init__(self, value, offset, tag_offset):
+        self.value = value
+        self.offset = offset
+        self.tag_offset = tag_offset
+
+    def __repr__(self):
+        return 'DynamicString(%r, %d, %d)' % (
+            self.value, self.offset, self.tag_offset)
+
+
+class ElfFile(object):
+    """What Spack needs to know about an ELF file.
+
+    Attributes:
+        is_64_bit (bool): whether this is an ELFCLASS64 file
+        is_little_endian (bool): byte order of the file
+        elf_type (int): ``e_type`` of the file
+        rpath (DynamicString): ``DT_RPATH`` of the file, or None
+        runpath (DynamicString): ``DT_RUNPATH`` of the file, or None
+    """
+    def __init__(self, is_64_bit, is_little_endian, elf_type):
+        self.is_64_bit = is_64_bit
+        self.is_little_endian = is_little_endian
+        self.elf_type = elf_type
+        self.rpath = None
+        self.runpath = None
+
+    @property
+    def subtype(self):
+        """MIME subtype of the file, as ``file --mime-type`` reports it."""
+        return ELF_SUBTYPES.get(self.elf_type, 'octet-stream')
+
+    @property
+    def rpaths(self):
+        """Search path of the file: DT_RUNPATH if present, else DT_RPATH."""
+        entry = self.runpath or self.rpath
+        return entry.value.split(':') if entry else []
+
+
+@contextmanager
+def mapped(path):
+    """Map a file read-only in memory.
+
+    Yields an ``mmap`` of the file, or an empty byte string for empty
+    files, which cannot be mapped.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with closing(mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ)) as data:
+            yield data
+
+
+def parse_elf(data):
+    """Read the header and the dynamic section of an ELF file.
+
+    Args:
+        data: contents of the file, as bytes or an ``mmap``
+
+    Returns:
+        (ElfFile): description of the file, or None if it is not ELF
+
+    Raises:
+        ElfParsingError: if the file is truncated or corrupt
+    """
+    if data[:4] != b'\x7fELF':
+        return None
+
+    try:
+        return _parse_elf(data)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ElfParsingError('cannot parse ELF file: %s' % e)
+
+
+def _parse_elf(data):
+    ei_class, ei_data = bytearray(data[4:6])
+    if ei_class not in (1, 2) or ei_data not in (1, 2):
+        raise ElfParsingError('unknown ELF class or byte order')
+
+    is_64_bit = ei_class == 2
+    endian = '<' if ei_data == 1 else '>'
+
+    if is_64_bit:
+        header = struct.unpack_from(endian + 'HHIQQQIHHHHHH', data, 16)
+        phdr_fmt = struct.Struct(endian + 'IIQQQQQQ')
+        dyn_fmt = struct.Struct(endian + 'qQ')
+    else:
+        header = struct.unpack_from(endian + 'HHIIIIIHHHHHH', data, 16)
+        phdr_fmt = struct.Struct(endian + 'IIIIIIII')
+        dyn_fmt = struct.Struct(endian + 'iI')
+
+    elf_type, e_phoff, e_phentsize, e_phnum = (
+        header[0], header[4], header[8], header[9])
+    elf = ElfFile(is_64_bit, ei_data == 1, elf_type)
+
+    # Collect loadable segments and the dynamic segment
+    loads, dynamic = [], None
+    for i in range(e_phnum):
+        phdr = phdr_fmt.unpack_from(data, e_phoff + i * e_phentsize)
+        if is_64_bit:
+            p_type, _, p_offset, p_vaddr, _, p_filesz = phdr[:6]
+        else:
+            p_type, p_offset, p_vaddr, _, p_filesz = phdr[:5]
+
+        if p_type == PT_LOAD:
+            loads.append((p_vaddr, p_offset, p_filesz))
+        elif p_type == PT_DYNAMIC:
+            dynamic = (p_offset, p_filesz)
+
+    if dynamic is None:
+        return elf
+
+    # Read the dynamic entries we are interested in
+    strtab, strings = None, {}
+    offset, end = dynamic[0], dynamic[0] + dynamic[1]
+    while offset + dyn_fmt.size <= end:
+        tag, value = dyn_fmt.unpack_from(data, offset)
+        if tag == DT_NULL:
+            break
+        elif tag == DT_STRTAB:
+            strtab = value
+        elif tag in (DT_RPATH, DT_RUNPATH):
+            strings[tag] = (value, offset)
+        offset += dyn_fmt.size
+
+    if not strings:
+        return elf
+
+    if strtab is None:
+        raise ElfParsingError('dynamic section has no string table')
+
+    # DT_STRTAB is an address: find where it is in the file
+    for vaddr, p_offset, p_filesz in loads:
+        if vaddr <= strtab < vaddr + p_filesz:
+            strtab_offset = p_offset + strtab - vaddr
+            break
+    else:
+        raise ElfParsingError('string table is not in a loaded segment')
+
+    for tag, (value, tag_offset) in strings.items():
+        start = strtab_offset + value
+        end = data.find(b'\0', start)
+        if end < 0:
+            raise ElfParsingError('unterminated dynamic string')
+
+        entry = DynamicString(
+            data[start:end].decode('utf-8'), start, tag_offset)
+        if tag == DT_RPATH:
+            elf.rpath = entry
+        else:
+            elf.runpath = entry
+
+    return elf
+
+
+def set_rpath_in_place(path, rpath):
+    """Overwrite the RPATH of the ELF file at ``path``, if it fits.
+
+    The new RPATH is written over the old string in the dynamic string
+    table and padded with NULs, which is possible whenever it is not
+    longer than the old one (buildcaches pad install roots with
+    placeholders for this reason).  Like ``patchelf --force-rpath``, a
+    ``DT_RUNPATH`` entry is turned into ``DT_RPATH``.
+
+    Args:
+        path (str): path of the ELF file to modify
+        rpath (str): new RPATH, as a colon separated string
+
+    Returns:
+        (bool): True if the RPATH was rewritten, False if the file has no
+            room for it and needs to be rewritten by ``patchelf``
+
+    Raises:
+        ElfParsingError: if the file is not a valid ELF file
+    """
+    new_value = rpath.encode('utf-8')
+
+    with open(path, 'rb+') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ElfParsingError('%s is empty' % path)
+
+        with closing(mmap.mmap(f.fileno(), 0)) as data:
+            elf = parse_elf(data)
+            if elf is None:
+                raise ElfParsingError('%s is not an ELF file' % path)
+
+            # Adding a new entry, or dropping one of two, means
+            # reshaping the dynamic section
+            if bool(elf.rpath) == bool(elf.runpath):
+                return False
+
+            entry = elf.rpath or elf.runpath
+            size = len(entry.value.encode('utf-8'))
+            if len(new_value) > size:
+                return False
+
+            end = entry.offset + size
+            data[entry.offset:end] = new_value.ljust(size, b'\0')
+
+            if entry is elf.runpath:
+                tag_fmt = ('<' if elf.is_little_endian else '>') + (
+                    'q' if elf.is_64_bit else 'i')
+                struct.pack_into(tag_fmt, data, entry.tag_offset, DT_RPATH)
+
+            data.flush()
+
+    return True
+
+
+def _looks_like_text(head):
+    return not bytes(head).translate(None, _text_chars)
+
+
+def _is_fat_macho(head):
+    # Java class files share the magic number of universal binaries; they
+    # are told apart by the next word, which is the (small) number of
+    # architectures for a binary and the class file version for Java
+    if len(head) < 8:
+        return False
+    nfat_arch, = struct.unpack_from('>I', head, 4)
+    return nfat_arch < 30
+
+
+def classify(data):
+    """MIME type and subtype of some file contents.
+
+    The result matches what ``file -b --mime-type`` reports for the
+    file types relocation cares about: ELF and Mach-O binaries and text.
+    Any other binary data is reported as ``application/octet-stream``.
+
+    Args:
+        data: contents of the file, as bytes or an ``mmap``
+
+    Returns:
+        (tuple): MIME type and subtype
+    """
+    head = data[:HEAD_SIZE]
+
+    if not head:
+        return 'inode', 'x-empty'
+
+    if head[:4] == b'\x7fELF':
+        try:
+            elf = parse_elf(data)
+        except ElfParsingError:
+            return 'application', 'octet-stream'
+        return 'application', elf.subtype
+
+    if head[:4] in MACHO_MAGICS or (
+            head[:4] == MACHO_FAT_MAGIC and _is_fat_macho(head)):
+        return 'application', 'x-mach-binary'
+
+    if _looks_like_text(head):
+        if head[:2] == b'#!':
+            return 'text', 'x-script'
+        return 'text', 'plain'
+
+    return 'application', 'octet-stream'
+
+
+def file_type(path):
+    """MIME type and subtype of a file, without following symlinks.
+
+    Args:
+        path (str): path of the file to be analyzed
+
+    Returns:
+        (tuple): MIME type and subtype, see ``classify()``
+    """
+    mode = os.lstat(path).st_mode
+    if stat.S_ISLNK(mode):
+        return 'inode', 'symlink'
+    if stat.S_ISDIR(mode):
+        return 'inode', 'directory'
+    if not stat.S_ISREG(mode):
+        return 'inode', 'x-special'
+
+    with mapped(path) as data:
+        return classify(data)
+
+
+def read_elf(path):
+    """Parse the ELF file at ``path``.
+
+    Returns:
+        (ElfFile): description of the file, or None if it is not ELF
+    """
+    with mapped(path) as data:
+        return parse_elf(data)
+
+
+def find_strings(data, needle):
+    """Find the printable strings in ``data`` containing ``needle``.
+
+    This is equivalent to searching the output of ``strings`` for
+    ``needle``, except that it only ever looks at the parts of the
+    data around each occurrence.
+
+    Args:
+        data: contents of the file, as bytes or an ``mmap``
+        needle (bytes): what to look for
+
+    Yields:
+        (tuple): offset in the data and value of each string
+    """
+    if not needle:
+        return
+
+    size = len(data)
+    position = data.find(needle)
+    while position >= 0:
+        # Widen the match to the surrounding printable characters
+        start = position
+        while start > 0 and data[start - 1:start] not in _string_ends:
+            start -= 1
+        end = position + len(needle)
+        while end < size and data[end:end + 1] not in _string_ends:
+            end += 1
+
+        yield start, data[start:end]
+        position = data.find(needle, end)
+
+
+# Bytes that terminate printable strings, as single-byte strings
+_string_ends = set(
+    bytes(bytearray([b])) for b in range(256)
+    if not (0x20 <= b < 0x7f or b == 9))
+
+
+def contains(path, *needles):
+    """Whether the file at ``path`` contains any of ``needles``.
+
+    Args:
+        path (str): path of the file to be searched
+        needles (bytes): byte strings to look for
+    """
+    with mapped(path) as data:
+        return any(n and data.find(n) >= 0 for n in needles)
@@ -96,7 +96,7 @@ class FileCache(object):
             self._get_lock(key)
         return exists
 
-    def read_transaction(self, key):
+    def read_transaction(self, key, binary=False):
         """Get a read transaction on a file cache item.
 
         Returns a ReadTransaction context manager and opens the cache file for
@@ -105,28 +105,35 @@ class FileCache(object):
            with file_cache_object.read_transaction(key) as cache_file:
                cache_file.read()
 
+        If ``binary`` is True, the cache file is opened in binary mode.
+
         """
+        mode = 'rb' if binary else 'r'
         return ReadTransaction(
-            self._get_lock(key), lambda: open(self.cache_path(key)))
+            self._get_lock(key), lambda: open(self.cache_path(key), mode))
 
-    def write_transaction(self, key):
+    def write_transaction(self, key, binary=False):
         """Get a write transaction on a file cache item.
 
         Returns a WriteTransaction context manager that opens a temporary file
         for writing.  Once the context manager finishes, if nothing went wrong,
         moves the file into place on top of the old file atomically.
 
+        If ``binary`` is True, both files are opened in binary mode.
+
         """
+        suffix = 'b' if binary else ''
+
         class WriteContextManager(object):
 
             def __enter__(cm):  # noqa
                 cm.orig_filename = self.cache_path(key)
                 cm.orig_file = None
                 if os.path.exists(cm.orig_filename):
-                    cm.orig_file = open(cm.orig_filename, 'r')
+                    cm.orig_file = open(cm.orig_filename, 'r' + suffix)
 
                 cm.tmp_filename = self.cache_path(key) + '.tmp'
-                cm.tmp_file = open(cm.tmp_filename, 'w')
+                cm.tmp_file = open(cm.tmp_filename, 'w' + suffix)
 
                 return cm.orig_file, cm.tmp_file
 
@@ -12,6 +12,9 @@
   default unorderd dict.
 
 """
+import ctypes
+import re
+
 from ordereddict_backport import OrderedDict
 from six import string_types, StringIO
 
@@ -25,7 +28,7 @@ from llnl.util.tty.color import colorize, clen, cextra
 import spack.error
 
 # Only export load and dump
-__all__ = ['load', 'dump', 'SpackYAMLError']
+__all__ = ['load', 'dump', 'dump_flow', 'SpackYAMLError']
 
 # Make new classes so we can add custom attributes.
 # Also, use OrderedDict instead of just dict.
@@ -336,6 +339,106 @@ def dump(*args, **kwargs):
         return yaml.dump(*args, **kwargs)
 
 
+#: Line width for flow style output that is never wrapped.  This is the
+#: max C int, to avoid passing too large a value to cyaml.
+_flow_width = 2 ** (ctypes.sizeof(ctypes.c_int) * 8 - 1) - 1
+
+
+#: Strings that are always written as plain scalars in flow style: they
+#: contain no indicators and can't be read back as anything but strings.
+_plain_scalar_re = re.compile(r'^[A-Za-z][A-Za-z0-9_.+-]*$')
+
+#: base32 hashes are also plain, as long as they can't be read as numbers
+_hash_scalar_re = re.compile(r'^[a-z2-7]{32}$')
+
+#: Plain-looking strings that YAML would read as booleans or null
+_reserved_scalars = set([
+    'y', 'yes', 'n', 'no', 'true', 'false', 'on', 'off', 'null'])
+
+#: Cache of how scalars are written by ``dump()`` in flow style
+_flow_scalars = {}
+
+#: Types that dump_flow() formats itself; anything else goes to dump()
+_flow_types = (type(None), bool, int, str, syaml_str, syaml_int)
+
+
+class _FlowFallback(Exception):
+    """Raised when dump_flow() can't format some data by itself."""
+
+
+def _flow_scalar(value):
+    """How ``dump()`` writes a scalar inside a flow collection."""
+    # Only plain str; e.g. unicode gets a tag in Python 2
+    if type(value) is str and value.lower() not in _reserved_scalars:
+        if _plain_scalar_re.match(value):
+            return value
+
+        # with two letters or more, a hash can't be an int or a float
+        if (_hash_scalar_re.match(value) and
+                sum(c.isalpha() for c in value) > 1):
+            return value
+
+    if type(value) not in _flow_types:
+        raise _FlowFallback()
+
+    key = (type(value), value)
+    text = _flow_scalars.get(key)
+    if text is None:
+        text = dump([value], default_flow_style=True, width=_flow_width)
+        text = text.rstrip('\n')[1:-1]
+        if len(_flow_scalars) > 4096:
+            _flow_scalars.clear()
+        _flow_scalars[key] = text
+    return text
+
+
+def _flow(data, out):
+    if type(data) is syaml_dict or type(data) is dict:
+        items = data.items()
+        if type(data) is dict:
+            items = sorted(items)
+
+        out.append('{')
+        for i, (key, value) in enumerate(items):
+            # leave keys that may need quotes or '? ' to dump()
+            if not (type(key) is str and _plain_scalar_re.match(key) and
+                    key.lower() not in _reserved_scalars and len(key) < 100):
+                raise _FlowFallback()
+
+            out.append(', ' if i else '')
+            out.append(key)
+            out.append(': ')
+            _flow(value, out)
+        out.append('}')
+
+    elif type(data) is list or type(data) is syaml_list:
+        out.append('[')
+        for i, value in enumerate(data):
+            out.append(', ' if i else '')
+            _flow(value, out)
+        out.append(']')
+
+    else:
+        out.append(_flow_scalar(data))
+
+
+def dump_flow(data):
+    """Write data on a single line in YAML flow style.
+
+    This returns the same text as ``dump(data, default_flow_style=True,
+    width=<max int>)``, but builds it directly for the plain dicts, lists
+    and scalars that make up e.g. spec node dicts, which is much faster.
+    Any other data is passed on to ``dump()``.
+    """
+    out = []
+    try:
+        _flow(data, out)
+    except _FlowFallback:
+        return dump(data, default_flow_style=True, width=_flow_width)
+    out.append('\n')
+    return ''.join(out)
+
+
 def dump_annotated(data, stream=None, *args, **kwargs):
     kwargs['Dumper'] = LineAnnotationDumper
 
@@ -86,7 +86,8 @@ else:
             super(NonDaemonPool, self).__init__(*args, **kwargs)
 
 
-def _read_from_url(url, accept_content_type=None):
+def _ssl_context():
+    """SSL context for urlopen that follows ``config:verify_ssl``."""
     context = None
     verify_ssl = spack.config.get('config:verify_ssl')
     pyver = sys.version_info
@@ -101,6 +102,20 @@ def _read_from_url(url, accept_content_type=None):
         context = ssl.create_default_context()
     else:
         context = ssl._create_unverified_context()
+    return context
+
+
+def open_url(url):
+    """Open a URL for reading, with Spack's SSL settings and timeout.
+
+    Returns the response, a file-like object. Raises URLError (or
+    HTTPError) if the URL cannot be opened.
+    """
+    return _urlopen(Request(url), timeout=_timeout, context=_ssl_context())
+
+
+def _read_from_url(url, accept_content_type=None):
+    context = _ssl_context()
 
     req = Request(url)
 
@@ -175,7 +175,7 @@ function _spack_buildcache_create {
     if $list_options
     then
         compgen -W "-h --help -r --rel -f --force -u --unsigned -a --allow-root
-                    -k --key -d --directory" -- "$cur"
+                    -k --key -d --directory --stream -c --compression" -- "$cur"
     else
         compgen -W "$(_all_packages)" -- "$cur"
     fi
@@ -301,7 +301,7 @@ function _spack_compilers {
 }
 
 function _spack_concretize {
-    compgen -W "-h --help -f --force" -- "$cur"
+    compgen -W "-h --help -f --force -j --jobs" -- "$cur"
 }
 
 function _spack_config {
@@ -635,7 +635,7 @@ function _spack_install {
     if $list_options
     then
         compgen -W "-h --help --only -j --jobs -I --install-status
-                    --overwrite --keep-prefix --keep-stage --dont-restage
+                    -p --concurrent-packages --overwrite --keep-prefix --keep-stage --dont-restage
                     --use-cache --no-cache --show-log-on-error --source
                     -n --no-checksum -v --verbose --fake --only-concrete
                     -f --file --clean --dirty --test --log-format --log-file